@@ -0,0 +1,115 @@
+"""
+Compares the per call overhead of the debuglog that looked for the logger on every call with the one that finds it
+the way chosen when decorating and skips the records when DEBUG is off, on a method and on a function with a logger
+argument, with the logger at INFO and at DEBUG.
+
+    python benchmarks/bench_debuglog.py --calls 200000
+"""
+import argparse
+import datetime as dt
+import functools
+import logging
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "utils")]
+
+from decorators import debuglog  # noqa: E402
+
+
+def scan_debuglog(logger=None):
+    """The debuglog before the logger was found the way chosen when decorating"""
+
+    def log_inner(func):
+        @functools.wraps(func)
+        def wrapper_log(*args, **kwargs):
+            log = None
+            if logger is None:
+                for kw in kwargs.values():
+                    if isinstance(kw, logging.Logger):
+                        log = kw
+                    elif isinstance(kw, object) and hasattr(kw, "logger"):
+                        log = kw.logger
+                if log is None:
+                    for arg in args:
+                        if isinstance(arg, logging.Logger):
+                            log = arg
+                        elif isinstance(arg, object) and hasattr(arg, "logger"):
+                            log = arg.logger
+            else:
+                log = logger
+            start_time = time.time()
+            log.debug("Executing... ", extra={"name_override": func.__name__})
+            value = func(*args, **kwargs)
+            if value:
+                log.debug("Finishing...", extra={"name_override": func.__name__})
+            else:
+                log.debug("Finished.", extra={"name_override": func.__name__})
+            tt = round(time.time() - start_time, 2)
+            total_time = "Elapsed time: {}".format(dt.timedelta(seconds=tt)).split(".")[0]
+            log.debug(total_time, extra={"name_override": func.__name__})
+            return value
+
+        return wrapper_log
+
+    return log_inner
+
+
+def make_logger():
+    logger = logging.getLogger("bench_debuglog")
+    logger.propagate = False
+    handler = logging.StreamHandler(open(os.devnull, "w"))
+    handler.setFormatter(
+        logging.Formatter("%(asctime)s %(levelname)-8s [%(funcName)s]: %(message)s")
+    )
+    logger.addHandler(handler)
+    return logger
+
+
+def make_targets(decorator, logger):
+    class Pull(object):
+        def __init__(self, logger):
+            self.logger = logger
+
+        def get_page(self, page, size=100):
+            return page
+
+    def to_txt(page, headers, entity, logger):
+        return page
+
+    pull = Pull(logger)
+    if decorator is None:
+        return pull.get_page, to_txt
+    Pull.get_page = decorator()(Pull.get_page)
+    return pull.get_page, decorator()(to_txt)
+
+
+def per_call(calls, method, function, logger):
+    t0 = time.time()
+    for page in range(calls):
+        method(page, size=100)
+        function(page, ["id"], "student", logger)
+    return (time.time() - t0) / (2 * calls) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=200000)
+    args = parser.parse_args()
+    logger = make_logger()
+    print("{:<8}{:<12}{:>10}{:>14}".format("level", "decorator", "calls", "us/call"))
+    for level in ("INFO", "DEBUG"):
+        logger.setLevel(getattr(logging, level))
+        for name, decorator in (("none", None), ("scan", scan_debuglog), ("debuglog", debuglog)):
+            method, function = make_targets(decorator, logger)
+            print(
+                "{:<8}{:<12}{:>10}{:>14.2f}".format(
+                    level, name, 2 * args.calls, per_call(args.calls, method, function, logger)
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Compares the throughput of the old regex scan of json_to_txt with the incremental RecordParser on a synthetic
+PowerQuery stream file.
+
+    python benchmarks/bench_json_to_txt.py --records 200000
+"""
+import argparse
+import json
+import mmap
+import os
+import re
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "utils")]
+
+from json_stream import iter_file_chunks, iter_records  # noqa: E402
+
+BUFFERING = 2**21
+RECORD_REGEX = b'(?<=[,\\[])\\{"[a-zA-Z0-9\\-_]+":\\s?".*?"\\}(?=[,\\]])'
+
+
+def write_stream_file(path, records, tricky):
+    with open(path, "wb") as f:
+        f.write(b'{"name": "history", "record": [')
+        for index in range(records):
+            record = {
+                "studentid": "{}".format(index),
+                "schoolid": "{}".format(index % 40),
+                "coursename": "Course number {}".format(index % 300),
+                "grade": "A",
+                "comment": 'says "}, then more' if tricky and index % 100 == 0 else "ok",
+            }
+            f.write((b"," if index else b"") + json.dumps(record).encode("utf-8"))
+        f.write(b"]}")
+
+
+def regex_scan(path):
+    """The json_to_txt scan before the RecordParser: mmap, any() over finditer, then finditer again"""
+    count = 0
+    with open(path, "r+b") as json_file:
+        mmap_json = mmap.mmap(json_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if any(re.finditer(RECORD_REGEX, mmap_json)):
+            for match in re.finditer(RECORD_REGEX, mmap_json):
+                try:
+                    json.loads(match.group(0))
+                    count += 1
+                except ValueError:
+                    # json_to_txt stopped at the first mangled match, here the scan goes on to time it all
+                    pass
+        mmap_json.close()
+    return count
+
+
+def parser_scan(path):
+    count = 0
+    with open(path, "rb", BUFFERING) as json_file:
+        for _ in iter_records(iter_file_chunks(json_file, BUFFERING)):
+            count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--records", type=int, default=200000)
+    args = parser.parse_args()
+    print(
+        "{:<8}{:<8}{:>10}{:>10}{:>10}{:>14}".format(
+            "data", "path", "records", "seconds", "MB/s", "records/s"
+        )
+    )
+    for tricky in (False, True):
+        path = os.path.join(tempfile.mkdtemp(), "history.json.tmp")
+        write_stream_file(path, args.records, tricky)
+        size = os.path.getsize(path) / 1024.0 / 1024.0
+        for name, scan in (("regex", regex_scan), ("parser", parser_scan)):
+            t0 = time.time()
+            count = scan(path)
+            elapsed = time.time() - t0
+            print(
+                "{:<8}{:<8}{:>10}{:>10.2f}{:>10.1f}{:>14.0f}".format(
+                    "tricky" if tricky else "plain",
+                    name,
+                    count,
+                    elapsed,
+                    size / elapsed,
+                    count / elapsed,
+                )
+            )
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Measures the wall time, records per second and peak RSS of PowerSchoolPull.run against the local stand-in server,
+for every entity size, transfer mode and number of page and entity workers.
+
+    python benchmarks/bench_pull.py --records 10000 100000 --mode paged stream --workers 1 4 --parallel 1 2
+    python benchmarks/bench_pull.py --records 50000 --latency 0.05 --bandwidth 5000000 --fields 20
+
+Every pull runs in its own process, so its peak RSS is its own, and the server runs in another one so its threads
+don't compete with the pull for the GIL. The pull runs in the interpreter of the script, Python 2 like production.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "utils")]
+
+from powerQueriesPull_generic import build_pull, build_session  # noqa: E402
+from tests.standin_server import (  # noqa: E402
+    QUERY_PREFIX,
+    Options,
+    StandInServer,
+    record_headers,
+)
+from utils.client_info import ClientPowerSchool  # noqa: E402
+
+LOGGER = logging.getLogger("bench_pull")
+# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+RSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+
+def entity_name(records, index):
+    return "bench{}_{}".format(records, index)
+
+
+def write_config(folder, hostname, case, fields):
+    """
+    It writes the configuration file of the pull of a case, with its entities pinned to its transfer mode
+    """
+    names = [entity_name(case["records"], index) for index in range(case["tables"])]
+    config = {
+        "hostname": hostname,
+        "clientId": "bench",
+        "clientSecret": "bench",
+        "tokenUrl": "/oauth/access_token/",
+        "fileList": [QUERY_PREFIX + name for name in names],
+        "headerDict": dict(("{}.txt".format(name), record_headers(name, fields)) for name in names),
+        "transfer_modes": dict((name, case["mode"]) for name in names),
+        "metrics_file": "",
+    }
+    config_file = os.path.join(folder, "client.json")
+    with open(config_file, "w") as f:
+        json.dump(config, f)
+    return config_file
+
+
+def run_pull(hostname, case, fields, queue):
+    """
+    It runs the pull of a case in a new folder and puts its timings in the queue
+    """
+    folder = tempfile.mkdtemp(prefix="bench_pull_")
+    timings = {"seconds": 0.0, "records": 0, "error": None}
+    try:
+        client = ClientPowerSchool(config_file=write_config(folder, hostname, case, fields))
+        options = Options(workers=case["workers"], entities=case["parallel"], engine=case["engine"])
+        session = build_session(max_in_flight=case["workers"] * case["parallel"], logger=LOGGER)
+        pull = build_pull(
+            options, client, session, logger=LOGGER, pull_logger=LOGGER, output_dir=folder
+        )
+        t0 = time.time()
+        result = pull.run(options=options)
+        elapsed = time.time() - t0
+        pull.query.request.close()
+        timings["seconds"] = elapsed
+        timings["records"] = sum(
+            value.get("records", 0) for value in result.values() if isinstance(value, dict)
+        )
+        timings["error"] = pull.context.get("error")
+    except Exception as exc:
+        LOGGER.exception(exc)
+        timings["error"] = "{}".format(exc) or exc.__class__.__name__
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+        timings["rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * RSS_UNIT
+        queue.put(timings)
+
+
+def serve(entities, args, queue):
+    server = StandInServer(
+        entities=entities,
+        latency=args.latency,
+        bandwidth=args.bandwidth,
+        fields=args.fields,
+        chunked=True,
+    )
+    queue.put(server.hostname)
+    server.serve_forever()
+
+
+def make_cases(args):
+    return [
+        {
+            "records": records,
+            "tables": args.tables,
+            "mode": mode,
+            "workers": workers,
+            "parallel": parallel,
+            "engine": args.engine,
+        }
+        for records in args.records
+        for mode in args.mode
+        for workers in args.workers
+        for parallel in args.parallel
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--records", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--tables", type=int, default=2, help="entities pulled in every run")
+    parser.add_argument(
+        "--mode", nargs="+", default=["paged", "stream"], choices=["paged", "stream"]
+    )
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--parallel", type=int, nargs="+", default=[1, 2])
+    parser.add_argument("--engine", default="threads", choices=["threads", "async"])
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds before every answer")
+    parser.add_argument(
+        "--bandwidth", type=int, default=None, help="bytes per second of every answer"
+    )
+    parser.add_argument("--fields", type=int, default=0, help="extra fields of every record")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    queue = multiprocessing.Queue()
+    entities = dict(
+        (entity_name(records, index), records)
+        for records in args.records
+        for index in range(args.tables)
+    )
+    server = multiprocessing.Process(target=serve, args=(entities, args, queue))
+    server.daemon = True
+    server.start()
+    hostname = queue.get()
+    print(
+        "{:>9}{:>8}{:>9}{:>10}{:>10}{:>11}{:>10}{:>9}".format(
+            "records", "mode", "workers", "parallel", "seconds", "records/s", "peak MB", "status"
+        )
+    )
+    try:
+        for case in make_cases(args):
+            pull = multiprocessing.Process(
+                target=run_pull, args=(hostname, case, args.fields, queue)
+            )
+            pull.start()
+            timings = queue.get()
+            pull.join()
+            expected = case["records"] * case["tables"]
+            # the error of a failed pull is logged by the pull
+            if timings["error"]:
+                status = "failed"
+            else:
+                status = "ok" if timings["records"] == expected else "missing"
+            print(
+                "{:>9}{:>8}{:>9}{:>10}{:>10.2f}{:>11.0f}{:>10.1f}{:>9}".format(
+                    expected,
+                    case["mode"],
+                    case["workers"],
+                    case["parallel"],
+                    timings["seconds"],
+                    timings["records"] / timings["seconds"] if timings["seconds"] else 0,
+                    timings["rss"] / 2.0**20,
+                    status,
+                )
+            )
+    finally:
+        server.terminate()
+
+
+if __name__ == "__main__":
+    main()
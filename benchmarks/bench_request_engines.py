@@ -0,0 +1,129 @@
+"""
+Compares the threaded request path (RequestRetryPowerSchool + ordered_imap) with the asyncio engine
+(AsyncRequestPowerSchool) on the same page requests against the local stand-in server.
+
+    python benchmarks/bench_request_engines.py --requests 400 --latency 0.05 --concurrency 8 32 64
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "utils")]
+
+import requests  # noqa: E402
+from queries_request import ordered_imap  # noqa: E402
+from session_request import RequestRetryPowerSchool  # noqa: E402
+
+from tests.standin_server import QUERY_PREFIX, StandInServer  # noqa: E402
+
+LOGGER = logging.getLogger("bench_request_engines")
+
+
+def page_requests(count, pagesize):
+    return [
+        {
+            "url": QUERY_PREFIX + "student",
+            "params": {"page": page, "pagesize": pagesize},
+            "payload": {},
+            "entity_name": "student",
+            "stream": False,
+        }
+        for page in range(1, count + 1)
+    ]
+
+
+def peak_threads(run):
+    peak = [threading.active_count()]
+    done = threading.Event()
+
+    def watch():
+        while not done.is_set():
+            peak[0] = max(peak[0], threading.active_count())
+            time.sleep(0.005)
+
+    watcher = threading.Thread(target=watch)
+    watcher.start()
+    t0 = time.time()
+    records = run()
+    elapsed = time.time() - t0
+    done.set()
+    watcher.join()
+    # the watcher thread itself is not counted
+    return elapsed, records, peak[0] - 1
+
+
+def run_threaded(hostname, contexts, concurrency):
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=concurrency)
+    session.mount("http://", adapter)
+    request = RequestRetryPowerSchool(
+        session=session, method="POST", hostname=hostname, logger=LOGGER
+    )
+    responses = ordered_imap(request.make_request, contexts, workers=concurrency)
+    return sum(len(response.json()["record"]) for response, _ in responses)
+
+
+def run_async(hostname, contexts, concurrency):
+    from async_request import AsyncRequestPowerSchool
+
+    request = AsyncRequestPowerSchool(
+        method="POST", hostname=hostname, logger=LOGGER, limit=concurrency
+    )
+    try:
+        responses = request.make_requests(contexts, concurrency=concurrency)
+        return sum(len(response.json()["record"]) for response, _ in responses)
+    finally:
+        request.close()
+
+
+def serve(entities, latency, queue):
+    server = StandInServer(entities=entities, latency=latency)
+    queue.put(server.hostname)
+    server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--pagesize", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 64])
+    args = parser.parse_args()
+
+    # the server runs in its own process so its threads don't compete with the engines for the GIL
+    queue = multiprocessing.Queue()
+    server = multiprocessing.Process(
+        target=serve, args=({"student": args.requests * args.pagesize}, args.latency, queue)
+    )
+    server.daemon = True
+    server.start()
+    hostname = queue.get()
+    contexts = page_requests(args.requests, args.pagesize)
+    print(
+        "{:<10}{:>12}{:>10}{:>12}{:>10}".format(
+            "engine", "concurrency", "seconds", "req/sec", "threads"
+        )
+    )
+    try:
+        for concurrency in args.concurrency:
+            for name, engine in (("threads", run_threaded), ("async", run_async)):
+                elapsed, records, threads = peak_threads(
+                    lambda: engine(hostname, [dict(c) for c in contexts], concurrency)
+                )
+                assert records == args.requests * args.pagesize
+                print(
+                    "{:<10}{:>12}{:>10.2f}{:>12.1f}{:>10}".format(
+                        name, concurrency, elapsed, args.requests / elapsed, threads
+                    )
+                )
+    finally:
+        server.terminate()
+
+
+if __name__ == "__main__":
+    main()
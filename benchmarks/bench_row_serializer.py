@@ -0,0 +1,99 @@
+"""
+Compares the field by field replace chain that dict_to_record used with the RowSerializer on synthetic student rows.
+
+    python benchmarks/bench_row_serializer.py --records 500000
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "utils")]
+
+from utils.file_processors import RowSerializer  # noqa: E402
+
+HEADERS = [
+    "dcid",
+    "id",
+    "student_number",
+    "schoolid",
+    "lastname",
+    "firstname",
+    "middlename",
+    "grade_level",
+    "entrydate",
+    "exitdate",
+    "enroll_status",
+    "street",
+    "city",
+    "state",
+    "zip",
+    "home_phone",
+    "mother",
+    "father",
+    "alert_medical",
+    "missing_column",
+]
+
+
+def make_records(records):
+    text = type(b"".decode("ascii"))
+    return [
+        dict(
+            [(header, text("{} {}".format(header, index))) for header in HEADERS[:-2]]
+            + [("alert_medical", text('Needs "inhaler"\r\nsee nurse') if index % 20 == 0 else "")]
+        )
+        for index in range(records)
+    ]
+
+
+def replace_chain(record_dict, headers):
+    """The dict_to_record loop before the RowSerializer"""
+    record_list = []
+    for header in headers:
+        if header in record_dict:
+            field = (
+                record_dict.get(header)
+                .replace("\r\n", "   ")
+                .replace("\n", "   ")
+                .replace("\t", " ")
+                .replace('"', "")
+                .replace("'", "")
+            )
+            record_list.append(field.encode("utf-8"))
+        else:
+            record_list.append(b"")
+    return b"\t".join(record_list) + b"\n"
+
+
+def run_chain(records):
+    return [replace_chain(record_dict, HEADERS) for record_dict in records]
+
+
+def run_serializer(records):
+    serialize = RowSerializer(HEADERS).serialize
+    return [serialize(record_dict) for record_dict in records]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--records", type=int, default=500000)
+    args = parser.parse_args()
+    records = make_records(args.records)
+    print("{:<12}{:>10}{:>10}{:>14}".format("path", "records", "seconds", "records/s"))
+    outputs = []
+    for name, run in (("chain", run_chain), ("serializer", run_serializer)):
+        t0 = time.time()
+        outputs.append(run(records))
+        elapsed = time.time() - t0
+        print(
+            "{:<12}{:>10}{:>10.2f}{:>14.0f}".format(
+                name, args.records, elapsed, args.records / elapsed
+            )
+        )
+    print("identical output: {}".format(outputs[0] == outputs[1]))
+
+
+if __name__ == "__main__":
+    main()
@@ -60,6 +60,37 @@ VERSION = "1.6.0"
 |           --log {mode}                                                       |
 |         Where {mode} in ["debug", "info", "warning", "error", "critical"]    |
 |           {mode} is case insensitive, and defaults to "INFO"                 |
+|       to request the pages of an entity concurrently:                        |
+|           -w {workers}                                                       |
+|           --workers={workers}                                                |
+|         Where {workers} is the maximum number of pages in flight, it         |
+|         overrides "page_workers" in the config file and defaults to 1.       |
+|       to pull several entities at the same time:                             |
+|           -p {entities}                                                      |
+|           --parallel={entities}                                              |
+|         Where {entities} is the maximum number of entities in flight, it     |
+|         overrides "entity_workers" in the config file and defaults to 1.     |
+|       to choose the request engine:                                          |
+|           --engine={engine}                                                  |
+|         Where {engine} is "threads" (default) or "async", it overrides       |
+|         "request_engine" in the config file. "async" runs the requests on    |
+|         an asyncio event loop and needs Python 3 and aiohttp (installed with |
+|         requirements-base.txt), on Python 2 the pull stops with an error.    |
+|       to pull several districts in one process:                              |
+|           --folders={folder_name},{folder_name}                              |
+|           --manifest={hosts manifest file}                                   |
+|         The districts share one budget of requests in flight, set with       |
+|         --budget={requests} (defaults to 8), and up to                       |
+|         --districts={districts} of them run at the same time (defaults to 2).|
+|       to request the token, the year id and the counts from the server,      |
+|       without the local cache:                                               |
+|           --no-cache                                                         |
+|       to continue the entities of a pull that was stopped, from the pages    |
+|       written before, when their count and year id didn't change:            |
+|           --resume                                                           |
+|       to profile every phase of the pull, writing its stats to the           |
+|       "profile" folder of the output:                                        |
+|           --profile                                                          |
 |       to run locally:                                                        |
 |           -t <config file's name>                                            |
 |           --test <config file's name>                                        |
@@ -88,6 +119,27 @@ VERSION = "1.6.0"
 |   ptpython powerQueriesPull_generic.py -f 9999 -l warning                    |
 |   ptpython powerQueriesPull_generic.py -f 9999 --log warning                 |
 |                                                                              |
+| Concurrent page requests:                                                    |
+|   ptpython powerQueriesPull_generic.py -f 9999 -w 4                          |
+|   ptpython powerQueriesPull_generic.py -f 9999 --workers=4                   |
+|                                                                              |
+| Concurrent entities:                                                         |
+|   ptpython powerQueriesPull_generic.py -f 9999 -p 3                          |
+|   ptpython powerQueriesPull_generic.py -f 9999 --parallel=3 --workers=4      |
+|                                                                              |
+| Several districts:                                                           |
+|   ptpython powerQueriesPull_generic.py --folders=5121,5990 --budget=12       |
+|   ptpython powerQueriesPull_generic.py --manifest=/home/hosts.json           |
+|                                                                              |
+| Without the local cache:                                                     |
+|   ptpython powerQueriesPull_generic.py -f 9999 -s student --no-cache         |
+|                                                                              |
+| Continue a stopped pull:                                                     |
+|   ptpython powerQueriesPull_generic.py -f 9999 --resume                      |
+|                                                                              |
+| Profile a pull:                                                              |
+|   ptpython powerQueriesPull_generic.py -f 9999 -s student --profile          |
+|                                                                              |
 | To run locally:                                                              |
 |   ptpython powerQueriesPull_generic.py -t <config file's name>               |
 |   ptpython powerQueriesPull_generic.py --test <config file's name>           |
@@ -97,24 +149,53 @@ VERSION = "1.6.0"
 """
 import datetime as dt
 import json
+import os
 import sys
 import time
+from functools import partial
+
+if sys.version_info[0] >= 3:
+    # the modules of utils import each other by bare name, the Python 2 implicit relative imports
+    sys.path.insert(1, os.path.join(os.path.dirname(os.path.abspath(__file__)), "utils"))
 
+from utils import cache
+from utils import checkpoint as ckp
+from utils import circuit_breaker as cb
 from utils import client_info as ci
+from utils import compression as cz
 from utils import configuration
 from utils import file_processors as fp
 from utils import loggering
+from utils import metrics as mt
+from utils import page_sizer as ps
+from utils import profiler as pf
 from utils import queries_request as qr
+from utils import rate_limiter as rl
+from utils import retry_policy as rp
 from utils import session_request as sr
 from utils.adapters import PowerSchoolAdapter
 from utils.base import PullGeneric
 from utils.decorators import debuglog, for_all_methods
 from utils.get_info import updatedict
+from utils.orchestrator import DistrictOrchestrator
+from utils.scheduler import EntityScheduler
+from utils.token_manager import (
+    REFRESH_MARGIN,
+    TokenError,
+    TokenManager,
+    is_token,
+)
 
 TIMEOUT = 600.0
 
 BASE_YEAR = 1990
 
+TOKEN_CACHE = "tokens.json"
+METADATA_CACHE = "metadata.json"
+YEARID_CACHE_TTL = 86400
+PAGE_STATS_CACHE_TTL = 30 * 86400
+STREAM_THRESHOLD = 10
+
 
 @for_all_methods("__init__", debuglog())
 class PowerSchoolPull(PullGeneric):
@@ -122,6 +203,10 @@ class PowerSchoolPull(PullGeneric):
     This class is a subclass of the PullGeneric class, which is a subclass of the Pull class.
     """
 
+    metadata_cache = None
+    resume = False
+    profiler = None
+
     def get_context_data(self, **kwargs):
         """
         It returns a dictionary of the context data.
@@ -142,89 +227,357 @@ class PowerSchoolPull(PullGeneric):
             files_to_pull = [f for f in files_to_pull if f.split(".")[-1] == options.single]
         return files_to_pull
 
-    def get_token(self, tokenurl):
+    def get_profiler(self, options):
+        """
+        It returns the profiler of the phases of the pull with --profile, None otherwise
+
+        :param options: A dictionary of options that were passed to the command
+        """
+        if not getattr(options, "profile", False):
+            return None
+        return pf.PhaseProfiler(
+            folder=os.path.join(self.adapter.output_dir, "profile"),
+            top=self.adapter.client.get("profile_top", pf.TOP),
+            logger=self.logger,
+        )
+
+    def profile(self, phase):
+        """
+        It returns a context manager that profiles a phase of the pull when there is a profiler, and does nothing
+        otherwise
+
+        :param phase: the name of the phase
         """
-        This function takes a tokenurl as an argument and returns a token
+        if self.profiler is None:
+            return pf.NO_PROFILE
+        return self.profiler.phase(phase)
+
+    def get_token(self, tokenurl, use_cache=True):
+        """
+        It returns a valid token through the token manager of the request, creating it the first time. The token is
+        reused from the cache of the district while it is valid.
 
         :param tokenurl: The URL to get the token from
+        :param use_cache: if the token is kept in the cache of the district, besides the run
+        """
+        manager = self.query.request.token_manager
+        if manager is None:
+            client = self.adapter.client
+            cache_dir = client.get("cache_dir", cache.DEFAULT_CACHE_DIR)
+            manager = TokenManager(
+                fetch=partial(self.fetch_token, tokenurl=tokenurl),
+                cache=cache.FileCache(os.path.join(cache_dir, TOKEN_CACHE), logger=self.logger)
+                if use_cache and client.get("token_cache", True)
+                else None,
+                key="{} {}".format(client.hostname, client.get("clientId", "")),
+                refresh_margin=client.get("token_refresh_margin", REFRESH_MARGIN),
+                logger=self.logger,
+            )
+            self.query.request.token_manager = manager
+        token = manager.get_token()
+        self.context["result"]["token"] = manager.status()
+        return token
+
+    def fetch_token(self, tokenurl):
+        """
+        It requests a new token from the server on a spawned copy of the pull, so it can be called from any thread,
+        and returns the token and its `expires_in`
+
+        :param tokenurl: The URL to get the token from
+        :raises TokenError: when the server doesn't answer with an access token
         """
         t0 = time.time()
-        self.query.entities = [tokenurl]
-        self.query.preadapter = self.adapter.preadapter_token
-        self.query.postadapter = self.adapter.postadapter_token
-        result = self.query.make_query()
-        if "error" in result["token"]:
-            loggering.error_log(msg=result["token"], logger=self.logger)
-        else:
-            self.logger.debug("Token: {}".format(result["token"]))
-            self.logger.debug("Time: {}".format(round(time.time(), 2) - t0))
-        updatedict(self.context["result"], result)
-        return result.get("token", "")
+        pull = self.spawn()
+        pull.query.request.headers = None
+        pull.query.request.token_manager = None
+        pull.query.entities = [tokenurl]
+        pull.query.preadapter = pull.adapter.preadapter_token
+        pull.query.postadapter = pull.adapter.postadapter_token
+        pull.query.failadapter = None
+        try:
+            result = pull.query.make_query()
+        finally:
+            pull.query.request.close()
+        self.observe_phase("token", t0)
+        # a failed request leaves the text of its response, and a response without a token an error dictionary
+        token = result.get("token") if isinstance(result, dict) else None
+        if not is_token(token):
+            raise TokenError(
+                "The token request to {} failed: {}".format(
+                    tokenurl, token["error"] if isinstance(token, dict) else result or "no answer"
+                )
+            )
+        self.logger.debug("Time: {}".format(round(time.time(), 2) - t0))
+        return token, pull.adapter.context.get("expires_in")
 
     def get_request_headers(self, *args, **kwargs):
         """
-        It returns the request headers.
+        It returns the request headers. The responses are asked compressed unless `compression` is false in the
+        configuration file.
         """
         token = kwargs.get("token")
         self.query.request.headers = {
             "Authorization": "Bearer {0}".format(token),
             "Content-Type": "application/JSON",
+            "Accept-Encoding": cz.accept_encoding(self.adapter.client.get("compression", True)),
         }
         return self.query.request.headers
 
+    def get_metadata_cache(self, options):
+        """
+        It returns the cache of the year id and the counts of the entities, or None when it is bypassed with
+        --no-cache
+
+        :param options: the options that were passed to the script
+        """
+        if getattr(options, "no_cache", False):
+            return None
+        cache_dir = self.adapter.client.get("cache_dir", cache.DEFAULT_CACHE_DIR)
+        return cache.FileCache(os.path.join(cache_dir, METADATA_CACHE), logger=self.logger)
+
+    def get_cached(self, key, ttl):
+        """
+        It returns the value of a key in the metadata cache, or None when it is missing, expired or not cached
+
+        :param key: the key of the value
+        :param ttl: the seconds the values of this kind are cached, 0 doesn't cache them
+        """
+        if self.metadata_cache is None or not ttl:
+            return None
+        return self.metadata_cache.get(key)
+
+    def set_cached(self, key, value, ttl):
+        """
+        It stores a value in the metadata cache for `ttl` seconds
+
+        :param key: the key of the value
+        :param value: the value to store
+        :param ttl: the seconds the values of this kind are cached, 0 doesn't cache them
+        """
+        if self.metadata_cache is not None and ttl:
+            self.metadata_cache.set(key, value, ttl=ttl)
+
     def get_year_id(self):
         """
-        It returns the year id of the current year.
+        It returns the year id of the current year, from the cache when it was requested before for the same host and
+        year range
         """
         t0 = time.time()
+        ttl = self.adapter.client.get("yearid_cache_ttl", YEARID_CACHE_TTL)
+        key = "yearid {} {}".format(self.adapter.client.hostname, self.adapter.get_year_range())
+        yearid = self.get_cached(key, ttl)
+        if yearid is not None:
+            self.logger.debug("Year id {} from the cache.".format(yearid))
+            self.context["result"]["yearid"] = yearid
+            self.observe_phase("yearid", t0)
+            return yearid
         self.query.entities = ["/ws/schema/query/com.blackboard.datalink.yearid"]
         self.query.preadapter = self.adapter.preadapter_yearid
         self.query.postadapter = self.adapter.postadapter_yearid
         result = self.query.make_query()
         # TODO: make something when error and no yearid
         self.logger.debug("Time: {}".format(round(time.time(), 2) - t0))
+        self.observe_phase("yearid", t0)
         updatedict(self.context["result"], result)
+        if result.get("yearid", ""):
+            self.set_cached(key, result["yearid"], ttl)
         return result.get("yearid", "")
 
     def get_num_pages(self, filelist, yearid):
         """
-        Get the number of records that every entity has from the server
+        Get the number of records that every entity has from the server, or from the cache when "count_cache_ttl" is
+        set in the config file and it was requested in the last "count_cache_ttl" seconds
 
         :param filelist: a list of filenames to be processed
         """
         t0 = time.time()
-        self.query.entities = filelist
-        self.query.preadapter = self.adapter.preadapter_numpages
-        self.query.postadapter = self.adapter.postadapter_numpages
-        self.query.request.retry_params = {"payload": {"yearid": yearid}}
-        result = self.query.make_query()
-        # TODO: make something when error and no NUM_PAGES
+        ttl = self.adapter.client.get("count_cache_ttl", 0)
+        hostname = self.adapter.client.hostname
+        keys = dict(
+            (entity, "count {} {} {}".format(hostname, entity, yearid)) for entity in filelist
+        )
+        missing = []
+        for entity in filelist:
+            cached = self.get_cached(keys[entity], ttl)
+            if cached is None:
+                missing.append(entity)
+            else:
+                self.adapter.set_count(entity.split(".")[-1], cached["count"], cached["payload"])
+        if missing:
+            self.query.entities = missing
+            self.query.preadapter = self.adapter.preadapter_numpages
+            self.query.postadapter = self.adapter.postadapter_numpages
+            self.query.request.retry_params = {"payload": {"yearid": yearid}}
+            self.query.make_query()
+            # TODO: make something when error and no NUM_PAGES
+            for entity in missing:
+                entity_name = entity.split(".")[-1]
+                count = self.adapter.context["result"].get(entity_name, {}).get("count")
+                if isinstance(count, int):
+                    payload = self.adapter.context["payload"][entity_name]
+                    self.set_cached(keys[entity], {"count": count, "payload": payload}, ttl)
+        result = self.adapter.context["result"]
         self.logger.debug("Time: {}".format(round(time.time(), 2) - t0))
+        self.observe_phase("count", t0, filelist=filelist)
         updatedict(self.context["result"], result)
         return result
 
-    def get_files(self, filelist, numpages):
+    def get_page_sizing(self):
+        """
+        It returns the limits and the targets of the page sizes from the config file
+        """
+        client = self.adapter.client
+        return {
+            "page_size_min": client.get("page_size_min", ps.PAGE_SIZE_MIN),
+            "page_size_max": client.get("page_size_max", ps.PAGE_SIZE_MAX),
+            "target_bytes": client.get("page_target_bytes", ps.TARGET_BYTES),
+            "target_seconds": client.get("page_target_seconds", ps.TARGET_SECONDS),
+        }
+
+    def stats_key(self, mode, entity):
+        """
+        It returns the key of the timings of an entity pulled in a mode in the metadata cache
+
+        :param mode: "page" or "stream"
+        :param entity: the endpoint of the entity
+        """
+        return "{} stats {} {}".format(mode, self.adapter.client.hostname, entity)
+
+    def get_files(self, filelist, numpages, yearid=None):
         """
         This function takes a list of files and a number of pages and returns a list of files that have the same number of
-        pages
+        pages. The page sizes and the choice between streaming and paging every entity start from the timings of its
+        last runs, which are kept in the metadata cache.
 
         :param filelist: a list of files to be processed
         :param numpages: the number of pages to be processed
+        :param yearid: the year id the counts were requested with, kept in the checkpoints
         """
         t0 = time.time()
+        client = self.adapter.client
+        ttl = client.get("page_stats_cache_ttl", PAGE_STATS_CACHE_TTL)
+        entities = dict((entity.split(".")[-1], entity) for entity in filelist)
         self.query.entities = filelist
         self.query.preadapter = self.adapter.preadapter_data
         self.query.postadapter = self.adapter.postadapter_data_to_txt
-        result = self.query.make_query(
-            num_pages=numpages, records_per_page=5000, stream_threshold=10
-        )
+        self.query.failadapter = self.adapter.failadapter_data
+        try:
+            self.query.make_query(
+                num_pages=numpages,
+                page_sizing=self.get_page_sizing(),
+                page_stats=dict(
+                    (name, self.get_cached(self.stats_key("page", entity), ttl))
+                    for name, entity in entities.items()
+                ),
+                stream_stats=dict(
+                    (name, self.get_cached(self.stats_key("stream", entity), ttl))
+                    for name, entity in entities.items()
+                ),
+                stream_threshold=client.get("stream_threshold", STREAM_THRESHOLD),
+                yearid=yearid,
+                resume=self.resume,
+            )
+        finally:
+            self.query.failadapter = None
+            self.adapter.close_writers()
+        for name, entity in entities.items():
+            sizer = self.adapter.context["sizers"].get(name)
+            if sizer is not None and sizer.records:
+                self.set_cached(self.stats_key("page", entity), sizer.estimates(), ttl)
+            elif name in self.adapter.context["page_samples"]:
+                self.set_cached(
+                    self.stats_key("page", entity), self.adapter.context["page_samples"][name], ttl
+                )
+            timings = self.adapter.context["stream_timings"].get(name)
+            if timings:
+                self.set_cached(self.stats_key("stream", entity), timings, ttl)
+        result = self.adapter.context["result"]
+        self.logger.debug("Time: {}".format(round(time.time(), 2) - t0))
+        for name in entities:
+            mode = (
+                "stream"
+                if isinstance(result.get(name), dict) and "stream" in result[name]
+                else "page"
+            )
+            self.observe_phase(mode, t0, filelist=[name])
+        updatedict(self.context["result"], result)
+        return result
+
+    def observe_phase(self, phase, t0, filelist=None):
+        """
+        It adds the seconds since `t0` to the `phase_seconds` of the metrics of the run, when there are metrics
+
+        :param phase: token, yearid, count, page or stream
+        :param t0: the time the phase started
+        :param filelist: the entities of the phase, if any
+        """
+        metrics = self.query.request.metrics
+        if metrics is not None:
+            entity = ",".join(entity.split(".")[-1] for entity in filelist or [])
+            metrics.observe("phase_seconds", time.time() - t0, phase=phase, entity=entity)
+
+    def export_metrics(self, run_seconds):
+        """
+        It writes the metrics of the run to "metrics_file" of the config file in the output folder, metrics.json by
+        default, and to "metrics_textfile" for the textfile collector of node_exporter when it is set
+
+        :param run_seconds: the seconds of the run
+        """
+        metrics = self.query.request.metrics
+        if metrics is None:
+            return
+        client = self.adapter.client
+        metrics.set("run_seconds", round(run_seconds, 3))
+        if "error" not in self.context:
+            metrics.set("last_success_timestamp_seconds", round(time.time(), 3))
+        try:
+            json_file = client.get("metrics_file", mt.METRICS_FILE)
+            if json_file:
+                metrics.to_json(os.path.join(self.adapter.output_dir, json_file))
+            textfile = client.get("metrics_textfile", None)
+            if textfile:
+                metrics.to_prometheus(textfile)
+        except (IOError, OSError) as exc:
+            self.logger.warning("The metrics were not written: {}".format(exc))
+
+    def pull_entity(self, entity, yearid):
+        """
+        It pulls a single entity on a spawned copy of the pull, so its results, retries and files don't share state
+        with the entities pulled at the same time
+
+        :param entity: the endpoint of the entity to pull
+        :param yearid: the year id to send when the entity needs it
+        """
+        pull = self.spawn()
+        try:
+            num_pages = pull.get_num_pages(filelist=[entity], yearid=yearid)
+            pull.get_files(filelist=[entity], numpages=num_pages, yearid=yearid)
+        finally:
+            pull.query.request.close()
+        return pull.context["result"]
+
+    def get_entities(self, filelist, yearid):
+        """
+        It pulls every entity in the list, up to `self.workers` of them at the same time
+
+        :param filelist: a list of files to be processed
+        :param yearid: the year id to send when the entity needs it
+        """
+        t0 = time.time()
+        result = {}
+        scheduler = EntityScheduler(max_in_flight=self.workers, logger=self.logger)
+        pulls = scheduler.run(partial(self.pull_entity, yearid=yearid), filelist)
+        for entity, entity_result, elapsed in pulls:
+            self.logger.debug("{} pulled in {} sec.".format(entity.split(".")[-1], elapsed))
+            updatedict(result, entity_result)
         self.logger.debug("Time: {}".format(round(time.time(), 2) - t0))
         updatedict(self.context["result"], result)
         return result
 
     def review_tmp_files(self, filelist):
         """
-        > This function takes a list of files
+        > This function takes a list of files. The tmp file of an entity with an error is not renamed, so the last
+        whole file is kept.
 
         :param filelist: a list of files to be reviewed
         """
@@ -232,8 +585,22 @@ class PowerSchoolPull(PullGeneric):
         result = {}
         for file in filelist:
             filename = file.split(".")[-1]
+            error = (self.context["result"].get(filename) or {}).get("error")
+            if error:
+                self.logger.error(
+                    "{} failed, its last file is kept and its tmp file is not renamed: {}".format(
+                        filename, error
+                    )
+                )
+                continue
             ori_file_size, new_file_size = fp.review_temporary_file(
-                filename=filename, logger=self.logger
+                filename=self.adapter.get_filename(filename),
+                logger=self.logger,
+                extension=self.adapter.get_sink_class(filename).extension,
+            )
+            fp.check_and_delete_file(
+                full_filename=ckp.checkpoint_filename(self.adapter.get_filename(filename)),
+                logger=self.logger,
             )
             result[filename] = {"file_sizes": {"original": ori_file_size, "new": new_file_size}}
         tt = round(time.time() - t0, 2)
@@ -246,23 +613,243 @@ class PowerSchoolPull(PullGeneric):
         """
         A function that takes in a variable number of arguments and keyword arguments.
         """
+        t0 = time.time()
         try:
-            t0 = time.time()
             options = kwargs.get("options", "")
             files_to_pull = self.get_files_to_pull(options)
-            token = self.get_token(tokenurl=self.adapter.client.tokenUrl)
+            self.metadata_cache = self.get_metadata_cache(options)
+            self.resume = getattr(options, "resume", False)
+            self.profiler = self.get_profiler(options)
+            with self.profile("token"):
+                token = self.get_token(
+                    tokenurl=self.adapter.client.tokenUrl,
+                    use_cache=self.metadata_cache is not None,
+                )
             req_headers = self.get_request_headers(token=token)
-            yearid = self.get_year_id()
-            num_pages = self.get_num_pages(filelist=files_to_pull, yearid=yearid)
-            files = self.get_files(filelist=files_to_pull, numpages=num_pages)
-            review = self.review_tmp_files(filelist=files_to_pull)
+            with self.profile("yearid"):
+                yearid = self.get_year_id()
+            with self.profile("entities"):
+                files = self.get_entities(filelist=files_to_pull, yearid=yearid)
+            with self.profile("review"):
+                review = self.review_tmp_files(filelist=files_to_pull)
+            if self.metadata_cache is not None:
+                self.context["result"]["cache"] = self.metadata_cache.stats()
+            breaker = self.query.request.get_circuit_breaker()
+            if breaker is not None:
+                self.context["result"]["circuit_breaker"] = breaker.stats()
+            limiter = self.query.request.get_rate_limiter()
+            if limiter is not None:
+                self.context["result"]["rate_limiter"] = limiter.stats()
             file_json = json.dumps(self.context["result"], indent=4)
             self.logger.info("Final pull results: {}".format(file_json))
             tt = round(time.time() - t0, 2)
             total_time = "Time: {}".format(dt.timedelta(seconds=tt)).split(".")[0]
             self.logger.info(total_time)
         except Exception as exc:
+            self.context["error"] = "{}".format(exc)
             loggering.except_log(exc, logger=self.logger)
+        if self.profiler is not None:
+            self.logger.info(self.profiler.summary())
+        self.export_metrics(time.time() - t0)
+        return self.context["result"]
+
+
+def build_pull(
+    options,
+    client,
+    session,
+    logger,
+    pull_logger,
+    budget=None,
+    output_dir="",
+    retry_budget=None,
+    circuit_breakers=None,
+    rate_limiters=None,
+    metrics=None,
+):
+    """
+    It builds the request, query, adapter and pull objects of one district
+
+    :param options: the options that were passed to the script
+    :param client: the client object of the district
+    :param session: the requests session
+    :param logger: the logger for the request, query and adapter
+    :param pull_logger: the logger for the pull
+    :param budget: a semaphore shared by every request in flight, if any
+    :param output_dir: the folder where the files are written, the current folder by default
+    :param retry_budget: the RetryBudget shared by the districts of the run, if any
+    :param circuit_breakers: the CircuitBreakers of the hosts of the run, new ones when None
+    :param rate_limiters: the RateLimiters of the hosts of the run, new ones when None
+    :param metrics: the Metrics of the district, new ones labelled with its host when None
+    """
+    page_workers, entity_workers = get_workers(options, client)
+    retry_policy = get_retry_policy(client, budget=retry_budget, logger=logger)
+    if circuit_breakers is None:
+        circuit_breakers = cb.CircuitBreakers(logger=logger)
+    circuit_breakers.get(
+        client.hostname,
+        failures=client.get("circuit_failures", cb.FAILURES),
+        reset_seconds=client.get("circuit_reset_seconds", cb.RESET_SECONDS),
+    )
+    if rate_limiters is None:
+        rate_limiters = rl.RateLimiters(logger=logger)
+    rate_limiters.get(
+        client.hostname,
+        rate=client.get("rate_limit", None),
+        burst=client.get("rate_limit_burst", None),
+        min_rate=client.get("rate_limit_min", rl.MIN_RATE),
+    )
+    if metrics is None:
+        metrics = mt.Metrics(labels={"host": client.hostname}, logger=logger)
+    engine = configuration.get_setting(options, client, "engine", "request_engine", "threads")
+    if engine == "async":
+        if sys.version_info[0] < 3:
+            loggering.error_log(
+                msg='The "async" request engine needs Python 3 and aiohttp, '
+                "pull with --engine=threads on Python 2.",
+                logger=logger,
+            )
+        from utils import async_request as ar
+
+        request_ps = ar.AsyncRequestPowerSchool(
+            session=session,
+            method="POST",
+            hostname=client.hostname,
+            budget=budget,
+            limit=page_workers + 1,
+            retry_policy=retry_policy,
+            spool_size=client.get("spool_size", sr.SPOOL_SIZE),
+            circuit_breakers=circuit_breakers,
+            rate_limiters=rate_limiters,
+            metrics=metrics,
+            logger=logger,
+        )
+        query_ps = ar.AsyncQueriesPowerSchool(
+            request=request_ps, workers=page_workers, logger=logger
+        )
+    else:
+        request_ps = sr.RequestRetryPowerSchool(
+            session=session,
+            method="POST",
+            hostname=client.hostname,
+            budget=budget,
+            retry_policy=retry_policy,
+            spool_size=client.get("spool_size", sr.SPOOL_SIZE),
+            circuit_breakers=circuit_breakers,
+            rate_limiters=rate_limiters,
+            metrics=metrics,
+            logger=logger,
+        )
+        query_ps = qr.QueriesPowerSchool(request=request_ps, workers=page_workers, logger=logger)
+    adapter = PowerSchoolAdapter(
+        client=client, query=query_ps, output_dir=output_dir, logger=logger
+    )
+    return PowerSchoolPull(logger=pull_logger, adapter=adapter, workers=entity_workers)
+
+
+def get_workers(options, client):
+    """
+    It returns the number of pages in flight of every entity and the number of entities pulled at the same time
+
+    :param options: the options that were passed to the script
+    :param client: the client object of the district
+    """
+    return (
+        int(configuration.get_setting(options, client, "workers", "page_workers", 1)),
+        int(configuration.get_setting(options, client, "entities", "entity_workers", 1)),
+    )
+
+
+def get_retry_policy(client, budget=None, logger=None):
+    """
+    It returns the retry policy of a district, with the attempts, backoff and budget of its configuration file
+
+    :param client: the client object of the district
+    :param budget: the RetryBudget shared by the districts of the run, a new one from the configuration file when None
+    :param logger: a logger object
+    """
+    if budget is None:
+        budget = rp.RetryBudget(client.get("retry_budget", rp.RETRY_BUDGET))
+    return rp.RetryPolicy(
+        attempts=client.get("retry_attempts", rp.ATTEMPTS),
+        backoff=client.get("retry_backoff", rp.BACKOFF),
+        max_backoff=client.get("retry_max_backoff", rp.MAX_BACKOFF),
+        max_retry_after=client.get("retry_after_max", rp.MAX_RETRY_AFTER),
+        budget=budget,
+        logger=logger,
+    )
+
+
+def get_district_limits(options):
+    """
+    It returns the number of districts pulled at the same time and the number of requests in flight shared by them
+
+    :param options: the options that were passed to the script
+    """
+    return (
+        options.districts or configuration.get_manifest_setting(options, "max_in_flight", 2),
+        options.budget or configuration.get_manifest_setting(options, "budget", 8),
+    )
+
+
+def build_session(max_in_flight, hosts=1, logger=None):
+    """
+    It returns the requests session of the run. Every host gets a pool with a connection for every request in flight,
+    plus one for the token and metadata requests, and a request waits for a free connection instead of opening one
+    that is thrown away when the pool is full.
+
+    :param max_in_flight: the maximum number of requests in flight to a host
+    :param hosts: the number of hosts requested at the same time
+    :param logger: a logger object
+    """
+    return sr.session_retry(
+        pool_connections=max(int(hosts), sr.DEFAULT_POOLSIZE),
+        pool_maxsize=int(max_in_flight) + 1,
+        pool_block=True,
+        logger=logger,
+    )
+
+
+def run_districts(options, session, log_level, logger):
+    """
+    It pulls every district of the --folders list or the hosts manifest in this process
+
+    :param options: the options that were passed to the script
+    :param session: the requests session shared by all the districts
+    :param log_level: the log level of the district loggers
+    :param logger: the logger for the run
+    """
+    districts = configuration.get_districts(options=options, logger=logger)
+    retry_budget = rp.RetryBudget(
+        configuration.get_manifest_setting(options, "retry_budget", rp.RETRY_BUDGET)
+    )
+    circuit_breakers = cb.CircuitBreakers(logger=logger)
+    rate_limiters = rl.RateLimiters(logger=logger)
+
+    def build_district_pull(district, budget, logger):
+        client = ci.ClientPowerSchool(config_file=district["config"])
+        return build_pull(
+            options,
+            client,
+            session,
+            logger=logger,
+            pull_logger=logger,
+            budget=budget,
+            output_dir=district["output_dir"],
+            retry_budget=retry_budget,
+            circuit_breakers=circuit_breakers,
+            rate_limiters=rate_limiters,
+        )
+
+    max_in_flight, budget = get_district_limits(options)
+    orchestrator = DistrictOrchestrator(
+        build_pull=build_district_pull,
+        max_in_flight=max_in_flight,
+        budget=budget,
+        log_level=log_level,
+        logger=logger,
+    )
+    return orchestrator.run(districts=districts, options=options)
 
 
 def main():
@@ -272,21 +859,31 @@ def main():
     t0 = time.time()
     log_level = configuration.get_log_level()
     logger = loggering.LoggerPowerSchool(log_level=log_level).get_logger()
-    logger2 = loggering.LoggerPowerSchool(file_name="debug.log", name="PowerSchoolPull").get_logger(
-        file_level="INFO"
-    )
     loggering.start_log(version=VERSION, logger=logger)
-    session = sr.session_retry(logger=logger)
     options = configuration.get_opts_and_args(args=sys.argv[1:])
-    config_file = configuration.get_config_file(options=options, logger=logger)
-    client = ci.ClientPowerSchool(config_file=config_file)
-    request_ps = sr.RequestRetryPowerSchool(
-        session=session, method="POST", hostname=client.hostname, logger=logger
-    )
-    query_ps = qr.QueriesPowerSchool(request=request_ps, logger=logger)
-    adapter = PowerSchoolAdapter(client=client, query=query_ps, logger=logger)
-    ps_pull = PowerSchoolPull(logger=logger2, adapter=adapter)
-    ps_pull.run(options=options)
+    ckp.stop_on_sigterm(logger=logger)
+    try:
+        if "NULL" not in options.folders or "NULL" not in options.manifest:
+            max_in_flight, budget = get_district_limits(options)
+            session = build_session(max_in_flight=budget, hosts=max_in_flight, logger=logger)
+            run_districts(options=options, session=session, log_level=log_level, logger=logger)
+        else:
+            logger2 = loggering.LoggerPowerSchool(
+                file_name="debug.log", name="PowerSchoolPull"
+            ).get_logger(file_level="INFO")
+            config_file = configuration.get_config_file(options=options, logger=logger)
+            client = ci.ClientPowerSchool(config_file=config_file)
+            page_workers, entity_workers = get_workers(options, client)
+            session = build_session(max_in_flight=page_workers * entity_workers, logger=logger)
+            ps_pull = build_pull(options, client, session, logger=logger, pull_logger=logger2)
+            ps_pull.run(options=options)
+            ps_pull.query.request.close()
+    except ckp.PullInterrupted as exc:
+        logger.warning("Pull stopped, the checkpoints keep the pages written.")
+        sys.exit(exc.args[0])
+    connection_stats = sr.session_stats(session)
+    if connection_stats is not None:
+        logger.info("Connections: {}".format(json.dumps(connection_stats.stats())))
     tt = round(time.time() - t0, 2)
     total_time = "Time: {}".format(dt.timedelta(seconds=tt)).split(".")[0]
     logger.info(total_time)
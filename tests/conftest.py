@@ -0,0 +1,19 @@
+import copy
+
+import pytest
+
+from .standin_server import StandInServer
+
+
+@pytest.fixture
+def standin(request):
+    """
+    It starts the stand-in server for a test and stops it after the test. The server takes a copy of the `STANDIN`
+    keyword arguments of the test module, 12 students by default, updated with the ones of an indirect parametrization,
+    so a test that changes the entities of its server doesn't change the ones of the next tests.
+    """
+    kwargs = copy.deepcopy(getattr(request.module, "STANDIN", {"entities": {"student": 12}}))
+    kwargs.update(copy.deepcopy(getattr(request, "param", {})))
+    server = StandInServer(**kwargs).start()
+    yield server
+    server.stop()
@@ -0,0 +1,255 @@
+import gzip
+import io
+import json
+import threading
+import time
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs, urlparse
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, urlparse
+
+QUERY_PREFIX = "/ws/schema/query/com.blackboard.datalink."
+# bytes written at a time when the bandwidth is limited, and records in every chunk of a stream
+WRITE_SIZE = 2**14
+STREAM_BATCH = 500
+
+
+def make_record(entity, index, fields=0):
+    """
+    It returns a synthetic record for the entity, with the same value shapes PowerQueries returns
+
+    :param entity: the name of the entity
+    :param index: the position of the record within the entity
+    :param fields: the number of extra fields, to make the records as wide as the ones of a real entity
+    """
+    record = {
+        "organizationid": "{}".format(1000 + index % 50),
+        "{}id".format(entity): "{}".format(index),
+        "lastname": "Last{}".format(index),
+        "firstname": "First{}".format(index),
+        "notes": 'line one\r\nline two\t"quoted"' if index % 10 == 0 else "",
+    }
+    for field in range(fields):
+        record["field{}".format(field)] = "value {} of {}".format(field, index)
+    return record
+
+
+def record_headers(entity, fields=0):
+    """
+    It returns the headers of the records of `make_record`, in the order of the headerDict of a configuration file
+
+    :param entity: the name of the entity
+    :param fields: the number of extra fields of the records
+    """
+    return ["organizationid", "{}id".format(entity), "lastname", "firstname", "notes"] + [
+        "field{}".format(field) for field in range(fields)
+    ]
+
+
+class Options(object):
+    """
+    The options of the command line of a pull, the ones of a pull without arguments by default
+
+    :param no_cache: if the metadata cache is skipped
+    :param workers: the page workers of every entity, the ones of the configuration file when None
+    :param entities: the entities pulled at the same time, the ones of the configuration file when None
+    :param engine: the request engine, the one of the configuration file when None
+    """
+
+    def __init__(self, no_cache=True, workers=None, entities=None, engine=None):
+        self.attendance = False
+        self.single = "NULL"
+        self.no_cache = no_cache
+        self.resume = False
+        self.profile = False
+        self.workers = workers
+        self.entities = entities
+        self.engine = engine
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    It answers the PowerSchool token, yearid, count and PowerQuery page requests
+    """
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, content, status=200, headers=None, cut=False):
+        body = json.dumps(content).encode("utf-8")
+        if cut:
+            # a whole HTTP answer whose json ends in the middle
+            body = body[: len(body) // 2]
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        if self.server.compress and "gzip" in (self.headers.get("Accept-Encoding") or ""):
+            buffer = io.BytesIO()
+            with gzip.GzipFile(fileobj=buffer, mode="wb") as f:
+                f.write(body)
+            body = buffer.getvalue()
+            self.send_header("Content-Encoding", "gzip")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", "{}".format(len(body)))
+        self.end_headers()
+        self.write(body)
+
+    def write(self, data):
+        """
+        It writes to the connection, no faster than the bandwidth of the server when it has one
+        """
+        if not self.server.bandwidth:
+            self.wfile.write(data)
+            return
+        for start in range(0, len(data), WRITE_SIZE):
+            end = start + WRITE_SIZE
+            block = data[start:end]
+            self.wfile.write(block)
+            time.sleep(len(block) / float(self.server.bandwidth))
+
+    def send_stream(self, entity, count):
+        """
+        It answers a request for the whole entity with a chunked body, whose records are made while they are sent
+        """
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        head = '{{"name": "{}", "record": ['.format(entity)
+        self.write_chunk(head.encode("utf-8"))
+        for start in range(0, count, STREAM_BATCH):
+            records = ", ".join(
+                json.dumps(make_record(entity, index, self.server.fields))
+                for index in range(start, min(start + STREAM_BATCH, count))
+            )
+            self.write_chunk(((", " if start else "") + records).encode("utf-8"))
+        self.write_chunk(b"]}")
+        self.write(b"0\r\n\r\n")
+
+    def write_chunk(self, data):
+        self.write("{:x}\r\n".format(len(data)).encode("ascii") + data + b"\r\n")
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        self.server.requests += 1
+        time.sleep(self.server.latency)
+        if url.path.startswith("/oauth/access_token"):
+            return self.send_json(
+                {
+                    "access_token": self.server.issue_token(),
+                    "token_type": "Bearer",
+                    "expires_in": "{}".format(self.server.expires_in),
+                }
+            )
+        token = (self.headers.get("Authorization") or "").replace("Bearer ", "", 1)
+        if self.server.check_tokens and token not in self.server.valid_tokens:
+            return self.send_json({"message": "Unauthorized"}, status=401)
+        if not url.path.startswith(QUERY_PREFIX):
+            return self.send_json({"message": "Not found"}, status=404)
+        if self.server.failures:
+            status, headers = self.server.failures.pop(0)
+            return self.send_json({"message": "Failure"}, status=status, headers=headers)
+        entity = url.path.replace(QUERY_PREFIX, "", 1).split("/")[0]
+        if entity == "yearid":
+            return self.send_json({"name": "yearid", "record": [{"yearid": "33"}]})
+        count = self.server.entities.get(entity, 0)
+        if url.path.endswith("/count"):
+            return self.send_json({"count": count})
+        page = int(params.get("page", ["1"])[0])
+        pagesize = int(params.get("pagesize", ["0"])[0])
+        self.server.pages.append((entity, page))
+        if pagesize == 0 and self.server.chunked:
+            return self.send_stream(entity, count)
+        start, stop = (0, count) if pagesize == 0 else ((page - 1) * pagesize, page * pagesize)
+        records = [
+            make_record(entity, index, self.server.fields)
+            for index in range(start, min(stop, count))
+        ]
+        return self.send_json(
+            {"name": entity, "record": records}, cut=(entity, page) in self.server.cut_pages
+        )
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    """
+    A local HTTP server that imitates the PowerSchool endpoints the pull uses
+
+    :param entities: a dictionary with the number of records of every entity
+    :param latency: seconds to wait before answering every request
+    :param check_tokens: if the PowerQuery requests are rejected with a 401 when their token was not issued or expired
+    :param expires_in: the `expires_in` of the issued tokens
+    :param compress: if the answers are gzipped for the requests that accept it
+    :param bandwidth: the bytes per second every answer is sent at, as fast as possible when None
+    :param fields: the number of extra fields of the records
+    :param chunked: if the requests for a whole entity, with a page size of 0, are answered with a chunked stream
+
+    The PowerQuery requests are answered with the (status, headers) tuples appended to `failures`, one for each of the
+    next requests, before they are answered normally. The (entity, page) pages in `cut_pages` are answered with the
+    first half of their json.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        entities=None,
+        latency=0.0,
+        port=0,
+        check_tokens=False,
+        expires_in=3600,
+        compress=False,
+        bandwidth=None,
+        fields=0,
+        chunked=False,
+    ):
+        HTTPServer.__init__(self, ("127.0.0.1", port), StandInHandler)
+        self.entities = entities or {}
+        self.latency = latency
+        self.check_tokens = check_tokens
+        self.expires_in = expires_in
+        self.compress = compress
+        self.bandwidth = bandwidth
+        self.fields = fields
+        self.chunked = chunked
+        self.tokens = 0
+        self.valid_tokens = set()
+        self.requests = 0
+        self.pages = []
+        self.failures = []
+        self.cut_pages = set()
+        self.thread = None
+
+    def issue_token(self):
+        self.tokens += 1
+        token = "standin-token-{}".format(self.tokens)
+        self.valid_tokens.add(token)
+        return token
+
+    def expire_tokens(self):
+        self.valid_tokens.clear()
+
+    @property
+    def hostname(self):
+        return "http://127.0.0.1:{}".format(self.server_address[1])
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
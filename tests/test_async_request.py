@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import threading
+
+import pytest
+import requests
+
+from ..utils import queries_request as qr
+from ..utils import session_request as sr
+from ..utils.circuit_breaker import CircuitBreakers
+from ..utils.retry_policy import RetryPolicy
+from ..utils.token_manager import TokenManager
+from .standin_server import QUERY_PREFIX
+
+pytest.importorskip("aiohttp")
+
+from ..utils import async_request as ar  # noqa: E402
+
+LOGGER = logging.getLogger("test_async_request")
+
+
+def page_requests(pages, pagesize):
+    return [
+        {
+            "url": QUERY_PREFIX + "student",
+            "params": {"page": page, "pagesize": pagesize},
+            "payload": {},
+            "entity_name": "student",
+            "stream": False,
+        }
+        for page in range(1, pages + 1)
+    ]
+
+
+def test_async_request_count(standin):
+    request = ar.AsyncRequestPowerSchool(method="POST", hostname=standin.hostname, logger=LOGGER)
+    response, context = request.make_request({"url": QUERY_PREFIX + "student/count"})
+    request.close()
+    assert response.status_code == 200
+    assert response.json() == {"count": 12}
+
+
+def test_async_requests_keep_order(standin):
+    request = ar.AsyncRequestPowerSchool(method="POST", hostname=standin.hostname, logger=LOGGER)
+    responses = list(request.make_requests(page_requests(3, 5), concurrency=3))
+    request.close()
+    pages = [[r["studentid"] for r in response.json()["record"]] for response, _ in responses]
+    assert [context["params"]["page"] for _, context in responses] == [1, 2, 3]
+    assert pages == [[str(i) for i in range(0, 5)], [str(i) for i in range(5, 10)], ["10", "11"]]
+
+
+def test_async_request_same_as_threaded(standin):
+    threaded = sr.RequestRetryPowerSchool(
+        session=requests.Session(), method="POST", hostname=standin.hostname, logger=LOGGER
+    )
+    expected = [r.json() for r, _ in qr.ordered_imap(threaded.make_request, page_requests(3, 5), 2)]
+    request = ar.AsyncRequestPowerSchool(method="POST", hostname=standin.hostname, logger=LOGGER)
+    result = [r.json() for r, _ in request.make_requests(page_requests(3, 5), concurrency=2)]
+    request.close()
+    assert result == expected
+
+
+def test_async_request_stream(standin):
+    request = ar.AsyncRequestPowerSchool(method="POST", hostname=standin.hostname, logger=LOGGER)
+    context = page_requests(1, 0)[0]
+    context["stream"] = True
+    response, _ = request.make_request(context)
+    # the body is read from the connection while it is parsed
+    assert isinstance(response.raw, ar.StreamBody)
+    body = b"".join(response.iter_content(chunk_size=7))
+    request.close()
+    assert body.count(b'"studentid"') == 12
+    assert response.wire_bytes == len(body)
+
+
+def test_a_cancelled_request_does_not_keep_a_budget_slot(standin):
+    budget = threading.Semaphore(1)
+    budget.acquire()
+    request = ar.AsyncRequestPowerSchool(
+        method="POST", hostname=standin.hostname, budget=budget, logger=LOGGER
+    )
+    loop = request.get_loop()
+    task = loop.create_task(request.fetch(page_requests(1, 5)[0]))
+    loop.run_until_complete(asyncio.sleep(0.05))
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        loop.run_until_complete(task)
+    budget.release()
+    request.close()
+    assert budget.acquire(False)
+
+
+def test_async_request_spooled_page(standin):
+    request = ar.AsyncRequestPowerSchool(method="POST", hostname=standin.hostname, logger=LOGGER)
+    context = page_requests(1, 5)[0]
+    context["spool"] = True
+    response, _ = request.make_request(context)
+    request.close()
+    assert response.ok
+    assert response._content is False
+    assert response.json()["record"][4]["studentid"] == "4"
+
+
+def test_async_request_connection_error():
+    request = ar.AsyncRequestPowerSchool(
+        method="POST",
+        hostname="http://127.0.0.1:9",
+        retry_policy=RetryPolicy(attempts=1),
+        logger=LOGGER,
+    )
+    response, _ = request.make_request({"url": QUERY_PREFIX + "student/count", "timeout": 2})
+    request.close()
+    assert response.status_code == 408
+
+
+def test_async_request_retries_with_a_new_token(standin):
+    standin.check_tokens = True
+
+    def fetch():
+        response = requests.post(standin.hostname + "/oauth/access_token/")
+        return response.json()["access_token"], response.json()["expires_in"]
+
+    request = ar.AsyncRequestPowerSchool(
+        method="POST",
+        hostname=standin.hostname,
+        token_manager=TokenManager(fetch),
+        logger=LOGGER,
+    )
+    responses = list(request.make_requests(page_requests(3, 4), concurrency=3))
+    standin.expire_tokens()
+    response, _ = request.make_request(page_requests(1, 4)[0])
+    request.close()
+    assert [len(response.json()["record"]) for response, _ in responses] == [4, 4, 4]
+    assert len(response.json()["record"]) == 4
+    assert standin.tokens == 2
+
+
+def test_async_request_counts_its_connections(standin):
+    session = sr.session_retry(logger=LOGGER)
+    request = ar.AsyncRequestPowerSchool(
+        session=session, method="POST", hostname=standin.hostname, limit=2, logger=LOGGER
+    )
+    responses = list(request.make_requests(page_requests(3, 5), concurrency=2))
+    request.close()
+    assert len(responses) == 3
+    stats = sr.session_stats(session).stats()
+    assert stats["requests"] == 3
+    assert 1 <= stats["new_connections"] <= 2
+
+
+def test_async_request_follows_the_retry_policy(standin):
+    standin.failures.extend([(429, {"Retry-After": "0"}), (504, {})])
+    policy = RetryPolicy(backoff=0, logger=LOGGER)
+    request = ar.AsyncRequestPowerSchool(
+        method="POST", hostname=standin.hostname, retry_policy=policy, logger=LOGGER
+    )
+    responses = list(request.make_requests(page_requests(2, 5), concurrency=1))
+    request.close()
+    assert [len(response.json()["record"]) for response, _ in responses] == [5, 5]
+    assert policy.stats("student")["statuses"] == {"429": 1, "504": 1}
+
+
+def test_async_request_fails_fast_with_the_circuit_open():
+    breakers = CircuitBreakers(logger=LOGGER)
+    breakers.get("http://127.0.0.1:9", failures=1, reset_seconds=60)
+    request = ar.AsyncRequestPowerSchool(
+        method="POST",
+        hostname="http://127.0.0.1:9",
+        circuit_breakers=breakers,
+        logger=LOGGER,
+    )
+    first, _ = request.make_request({"url": QUERY_PREFIX + "student/count", "timeout": 2})
+    second, _ = request.make_request({"url": QUERY_PREFIX + "student/count", "timeout": 2})
+    request.close()
+    assert (first.status_code, second.status_code) == (408, 503)
+    assert breakers.get("http://127.0.0.1:9").stats()["rejected_requests"] == 1
+
+
+def test_async_request_decodes_compressed_bodies(standin):
+    standin.compress = True
+    request = ar.AsyncRequestPowerSchool(method="POST", hostname=standin.hostname, logger=LOGGER)
+    page, _ = request.make_request(page_requests(1, 12)[0])
+    context = page_requests(1, 0)[0]
+    context["stream"] = True
+    stream, _ = request.make_request(context)
+    body = b"".join(stream.iter_content(chunk_size=7))
+    request.close()
+    assert len(page.json()["record"]) == 12
+    assert page.headers["Content-Encoding"] == "gzip"
+    assert 0 < page.wire_bytes < len(page.content)
+    assert body.count(b'"studentid"') == 12
+    assert 0 < stream.wire_bytes < len(body)
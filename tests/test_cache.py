@@ -0,0 +1,71 @@
+import os
+import stat
+
+import pytest
+
+from ..utils import cache as ch
+from ..utils.cache import FileCache
+
+
+def test_file_cache_set_and_get(tmpdir):
+    path = os.path.join(str(tmpdir), "cache", "tokens.json")
+    FileCache(path).set("district", {"access_token": "abc"}, ttl=60)
+    assert FileCache(path).get("district") == {"access_token": "abc"}
+    assert FileCache(path).get("other", "missing") == "missing"
+
+
+def test_file_cache_owner_only_permissions(tmpdir):
+    path = os.path.join(str(tmpdir), "tokens.json")
+    FileCache(path).set("district", "abc", ttl=60)
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    assert [name for name in os.listdir(str(tmpdir))] == ["tokens.json"]
+
+
+def test_write_json_interrupted_leaves_no_temp_file(tmpdir):
+    path = os.path.join(str(tmpdir), "student.checkpoint.json")
+
+    def interrupted_rename(source, destination):
+        raise KeyboardInterrupt()
+
+    rename = ch.os.rename
+    ch.os.rename = interrupted_rename
+    try:
+        with pytest.raises(KeyboardInterrupt):
+            ch.write_json(path, {"pages": {}})
+    finally:
+        ch.os.rename = rename
+    assert os.listdir(str(tmpdir)) == []
+
+
+def test_file_cache_expired_entries(tmpdir):
+    cache = FileCache(os.path.join(str(tmpdir), "tokens.json"))
+    cache.set("old", "abc", ttl=-1)
+    cache.set("new", "def", ttl=60)
+    assert cache.get("old") is None
+    assert sorted(cache.load()) == ["new"]
+
+
+def test_file_cache_corrupt_file(tmpdir):
+    path = os.path.join(str(tmpdir), "tokens.json")
+    with open(path, "w") as cache_file:
+        cache_file.write("{not json")
+    cache = FileCache(path)
+    assert cache.get("district") is None
+    cache.set("district", "abc", ttl=60)
+    assert cache.get("district") == "abc"
+
+
+def test_file_cache_delete(tmpdir):
+    cache = FileCache(os.path.join(str(tmpdir), "tokens.json"))
+    cache.set("district", "abc", ttl=60)
+    cache.delete("district")
+    assert cache.get("district") is None
+
+
+def test_file_cache_stats(tmpdir):
+    cache = FileCache(os.path.join(str(tmpdir), "metadata.json"))
+    cache.set("yearid", "33", ttl=60)
+    cache.get("yearid")
+    cache.get("count")
+    cache.get("yearid")
+    assert cache.stats() == {"hits": 2, "misses": 1, "hit_ratio": 0.67}
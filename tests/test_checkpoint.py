@@ -0,0 +1,230 @@
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import requests
+
+from ..powerQueriesPull_generic import build_pull
+from ..utils import checkpoint as ckp
+from ..utils import client_info as ci
+from .standin_server import QUERY_PREFIX, Options
+
+LOGGER = logging.getLogger("test_checkpoint")
+STANDIN = {"entities": {"student": 12000}}
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUDENT = QUERY_PREFIX + "student"
+SNAPSHOT = {"yearid": "33", "count": 12000, "page_size_base": 625, "stream": False}
+
+
+def test_checkpoint_is_saved_and_loaded(tmpdir):
+    path = ckp.checkpoint_filename(os.path.join(str(tmpdir), "student"))
+    checkpoint = ckp.Checkpoint(path, snapshot=SNAPSHOT)
+    checkpoint.page_done(0, 5000, 100)
+    checkpoint.page_done(5000, 7500, 200)
+    loaded = ckp.Checkpoint.load(path)
+    assert (loaded.snapshot, loaded.pages) == (SNAPSHOT, {0: (5000, 100), 5000: (7500, 200)})
+    loaded.delete()
+    assert ckp.Checkpoint.load(path) is None
+
+
+def test_checkpoint_ignores_a_corrupt_file(tmpdir):
+    path = os.path.join(str(tmpdir), "student.checkpoint.json")
+    with open(path, "w") as f:
+        f.write('{"snapshot": ')
+    assert ckp.Checkpoint.load(path) is None
+
+
+def test_resume_point_stops_at_the_first_missing_page():
+    pages = {0: (5000, 100), 5000: (7500, 200), 10000: (12000, 400)}
+    checkpoint = ckp.Checkpoint("", snapshot=SNAPSHOT, pages=pages)
+    assert checkpoint.resume_point(file_size=400) == (7500, 200)
+    assert checkpoint.resume_point(file_size=150) == (5000, 100)
+    assert checkpoint.resume_point(file_size=50) == (0, 0)
+    checkpoint.keep_pages(5000)
+    assert checkpoint.pages == {0: (5000, 100)}
+
+
+def build_student_pull(standin, tmpdir, **config):
+    config_file = os.path.join(str(tmpdir), "client.json")
+    with open(config_file, "w") as f:
+        json.dump(
+            dict(
+                {
+                    "hostname": standin.hostname,
+                    "clientId": "a",
+                    "clientSecret": "b",
+                    "tokenUrl": "/oauth/access_token/",
+                    "headerDict": {"student.txt": ["organizationid", "studentid"]},
+                },
+                **config
+            ),
+            f,
+        )
+    client = ci.ClientPowerSchool(config_file=config_file)
+    pull = build_pull(
+        Options(),
+        client,
+        requests.Session(),
+        logger=LOGGER,
+        pull_logger=LOGGER,
+        output_dir=str(tmpdir),
+    )
+    pull.get_request_headers(token=pull.get_token(client.tokenUrl, use_cache=False))
+    return pull
+
+
+def pull_students(standin, tmpdir, resume):
+    pull = build_student_pull(standin, tmpdir)
+    pull.resume = resume
+    yearid = pull.get_year_id()
+    return pull.get_files(
+        filelist=[STUDENT],
+        numpages=pull.get_num_pages(filelist=[STUDENT], yearid=yearid),
+        yearid=yearid,
+    )
+
+
+def write_last_file(tmpdir):
+    txt_filename = os.path.join(str(tmpdir), "student.txt")
+    with open(txt_filename, "wb") as f:
+        f.write(b"the last whole file\n")
+    return txt_filename
+
+
+def test_resume_requests_the_pages_after_the_checkpoint(standin, tmpdir):
+    txt_filename = os.path.join(str(tmpdir), "student.txt.tmp")
+    pull_students(standin, tmpdir, resume=False)
+    with open(txt_filename, "rb") as f:
+        content = f.read()
+    checkpoint = ckp.Checkpoint.load(ckp.checkpoint_filename(os.path.join(str(tmpdir), "student")))
+    assert sorted(checkpoint.pages) == [0, 5000, 10000]
+    assert checkpoint.pages[10000] == (12000, len(content))
+
+    # a run stopped in the middle of the second page
+    with open(txt_filename, "r+b") as f:
+        f.truncate(checkpoint.pages[5000][1] - 10)
+    del standin.pages[:]
+    result = pull_students(standin, tmpdir, resume=True)
+    assert standin.pages == [("student", 2), ("student", 3)]
+    assert result["student"]["resumed_at_record"] == 5000
+    with open(txt_filename, "rb") as f:
+        assert f.read() == content
+
+
+def test_resume_pulls_again_when_the_count_changed(standin, tmpdir):
+    pull_students(standin, tmpdir, resume=False)
+    standin.entities["student"] = 11000
+    del standin.pages[:]
+    result = pull_students(standin, tmpdir, resume=True)
+    assert standin.pages == [("student", 1), ("student", 2), ("student", 3)]
+    assert "resumed_at_record" not in result["student"]
+
+
+def test_a_short_stream_keeps_the_last_file(standin, tmpdir):
+    txt_filename = write_last_file(tmpdir)
+    pull = build_student_pull(standin, tmpdir, transfer_modes={"student": "stream"})
+    numpages = pull.get_num_pages(filelist=[STUDENT], yearid="33")
+    # the stream ends before the records of the count
+    standin.entities["student"] = 11000
+    result = pull.get_files(filelist=[STUDENT], numpages=numpages, yearid="33")
+    pull.review_tmp_files(filelist=[STUDENT])
+    assert result["student"]["records"] == 11000
+    assert "error" in result["student"]
+    assert "file_sizes" not in result["student"]
+    with open(txt_filename, "rb") as f:
+        assert f.read() == b"the last whole file\n"
+    assert os.path.exists(txt_filename + ".tmp")
+
+
+def test_a_failed_page_keeps_the_last_file_and_the_checkpoint(standin, tmpdir):
+    txt_filename = write_last_file(tmpdir)
+    pull = build_student_pull(standin, tmpdir)
+    numpages = pull.get_num_pages(filelist=[STUDENT], yearid="33")
+    # the first page is refused, the next ones are written
+    standin.failures.append((400, {}))
+    result = pull.get_files(filelist=[STUDENT], numpages=numpages, yearid="33")
+    pull.review_tmp_files(filelist=[STUDENT])
+    pull.query.request.session.close()
+    assert result["student"]["error"] == "Page 1 failed with a 400 response."
+    assert "file_sizes" not in result["student"]
+    with open(txt_filename, "rb") as f:
+        assert f.read() == b"the last whole file\n"
+    checkpoint = ckp.Checkpoint.load(ckp.checkpoint_filename(os.path.join(str(tmpdir), "student")))
+    assert sorted(checkpoint.pages) == [5000, 10000]
+
+
+def test_a_cut_page_keeps_the_last_file_and_the_checkpoint(standin, tmpdir):
+    txt_filename = write_last_file(tmpdir)
+    pull = build_student_pull(standin, tmpdir)
+    numpages = pull.get_num_pages(filelist=[STUDENT], yearid="33")
+    standin.cut_pages.add(("student", 2))
+    result = pull.get_files(filelist=[STUDENT], numpages=numpages, yearid="33")
+    pull.review_tmp_files(filelist=[STUDENT])
+    pull.query.request.session.close()
+    assert result["student"]["error"].startswith("Page 2 failed")
+    assert "file_sizes" not in result["student"]
+    with open(txt_filename, "rb") as f:
+        assert f.read() == b"the last whole file\n"
+    checkpoint = ckp.Checkpoint.load(ckp.checkpoint_filename(os.path.join(str(tmpdir), "student")))
+    assert 0 in checkpoint.pages
+    assert 5000 not in checkpoint.pages
+
+
+def start_script(tmpdir, *args):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([REPO] + [path for path in [env.get("PYTHONPATH")] if path])
+    return subprocess.Popen(
+        [sys.executable, os.path.join(REPO, "powerQueriesPull_generic.py"), "-t", "client.json"]
+        + list(args),
+        cwd=str(tmpdir),
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+    )
+
+
+def test_sigterm_keeps_the_checkpoint_and_resume_finishes_the_file(standin, tmpdir):
+    with open(os.path.join(str(tmpdir), "client.json"), "w") as f:
+        json.dump(
+            {
+                "hostname": standin.hostname,
+                "clientId": "a",
+                "clientSecret": "b",
+                "tokenUrl": "/oauth/access_token/",
+                "fileList": [STUDENT],
+                "headerDict": {"student.txt": ["organizationid", "studentid"]},
+            },
+            f,
+        )
+    checkpoint_file = ckp.checkpoint_filename(os.path.join(str(tmpdir), "student"))
+    txt_filename = os.path.join(str(tmpdir), "student.txt")
+    # the pages are slow enough for SIGTERM to arrive after the first one is written
+    standin.latency = 0.5
+    process = start_script(tmpdir, "-w", "1")
+    deadline = time.time() + 60
+    while not os.path.exists(checkpoint_file) and process.poll() is None:
+        assert time.time() < deadline
+        time.sleep(0.05)
+    process.send_signal(signal.SIGTERM)
+    output = process.communicate()[0]
+    assert process.returncode == 128 + signal.SIGTERM, output
+    assert not os.path.exists(txt_filename)
+    assert os.path.exists(txt_filename + ".tmp")
+    pages = ckp.Checkpoint.load(checkpoint_file).pages
+    assert 0 in pages and 10000 not in pages
+
+    standin.latency = 0.0
+    del standin.pages[:]
+    process = start_script(tmpdir, "--resume")
+    output = process.communicate()[0]
+    assert process.returncode == 0, output
+    assert ("student", 1) not in standin.pages
+    with open(txt_filename, "rb") as f:
+        lines = f.read().splitlines()
+    assert len(lines) == 12001
+    assert len(set(lines)) == 12001
+    assert not os.path.exists(checkpoint_file)
@@ -0,0 +1,96 @@
+import logging
+import time
+
+from ..utils import circuit_breaker as cb
+from ..utils import retry_policy as rp
+from ..utils import session_request as sr
+from .standin_server import QUERY_PREFIX
+
+LOGGER = logging.getLogger("test_circuit_breaker")
+COUNT = {"url": QUERY_PREFIX + "student/count", "entity_name": "student", "timeout": 2}
+
+
+def make_request(hostname, circuit_breakers):
+    return sr.RequestRetryPowerSchool(
+        session=sr.session_retry(logger=LOGGER),
+        method="POST",
+        hostname=hostname,
+        retry_policy=rp.RetryPolicy(backoff=0, logger=LOGGER),
+        circuit_breakers=circuit_breakers,
+        logger=LOGGER,
+    )
+
+
+def test_breaker_opens_after_failures_in_a_row():
+    breaker = cb.CircuitBreaker("host", failures=3, reset_seconds=60, logger=LOGGER)
+    for failed in (True, True, False, True, True):
+        assert breaker.allow()
+        breaker.record(failed)
+    assert breaker.stats()["state"] == cb.CLOSED
+    breaker.record(True)
+    assert not breaker.allow()
+    assert breaker.stats() == {
+        "state": cb.OPEN,
+        "opened": 1,
+        "rejected_requests": 1,
+        "consecutive_failures": 3,
+    }
+
+
+def test_breaker_lets_one_probe_through():
+    breaker = cb.CircuitBreaker("host", failures=1, reset_seconds=0.05, logger=LOGGER)
+    breaker.record(True)
+    assert not breaker.allow()
+    time.sleep(0.06)
+    probe = breaker.allow()
+    assert probe
+    assert not breaker.allow()
+    breaker.record(True, probe)
+    assert breaker.stats()["state"] == cb.OPEN
+    time.sleep(0.06)
+    probe = breaker.allow()
+    breaker.record(False, probe)
+    assert breaker.stats()["state"] == cb.CLOSED
+    assert breaker.stats()["opened"] == 2
+
+
+def test_only_the_probe_moves_the_breaker():
+    breaker = cb.CircuitBreaker("host", failures=1, reset_seconds=0.05, logger=LOGGER)
+    slow = breaker.allow()
+    breaker.record(True, breaker.allow())
+    # a request sent before the circuit opened answers while it is open and while it waits for its probe
+    breaker.record(False, slow)
+    assert breaker.stats()["state"] == cb.OPEN
+    time.sleep(0.06)
+    probe = breaker.allow()
+    breaker.record(False, slow)
+    breaker.record(True, slow)
+    assert breaker.stats()["state"] == cb.HALF_OPEN
+    breaker.record(False, probe)
+    assert breaker.stats()["state"] == cb.CLOSED
+
+
+def test_requests_fail_fast_once_the_host_is_down():
+    breakers = cb.CircuitBreakers(logger=LOGGER)
+    breakers.get("http://127.0.0.1:9", failures=2, reset_seconds=60)
+    request = make_request("http://127.0.0.1:9", breakers)
+    response, _ = request.make_request(dict(COUNT))
+    assert response.status_code == 408
+    assert breakers.get("http://127.0.0.1:9").stats()["consecutive_failures"] == 2
+    response, _ = request.make_request(dict(COUNT))
+    assert (response.status_code, response.reason) == (503, "Circuit Open")
+    assert request.retry_policy.stats("student")["retries"] == 1
+
+
+def test_probe_closes_the_circuit(standin):
+    breakers = cb.CircuitBreakers(logger=LOGGER)
+    breaker = breakers.get(standin.hostname, failures=1, reset_seconds=0.2)
+    breaker.record(True)
+    request = make_request(standin.hostname, breakers)
+    response, _ = request.make_request(dict(COUNT))
+    assert response.status_code == 503
+    assert standin.requests == 0
+    time.sleep(0.25)
+    response, _ = request.make_request(dict(COUNT))
+    assert response.json() == {"count": 12}
+    assert breaker.stats()["state"] == cb.CLOSED
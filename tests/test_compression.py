@@ -0,0 +1,70 @@
+import gzip
+import io
+import logging
+import os
+import zlib
+
+from ..utils import compression as cz
+from ..utils import file_processors as fp
+from ..utils import session_request as sr
+from .standin_server import QUERY_PREFIX
+
+LOGGER = logging.getLogger("test_compression")
+STANDIN = {"entities": {"student": 2000}, "compress": True}
+BODY = b'{"record": [' + b",".join([b'{"studentid": "1", "lastname": "Last"}'] * 500) + b"]}"
+
+
+def gzipped(body):
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode="wb") as f:
+        f.write(body)
+    return buffer.getvalue()
+
+
+def make_request(hostname, compression=True):
+    return sr.RequestRetryPowerSchool(
+        session=sr.session_retry(logger=LOGGER),
+        method="POST",
+        hostname=hostname,
+        headers={"Accept-Encoding": cz.accept_encoding(compression)},
+        logger=LOGGER,
+    )
+
+
+def test_decoder_decodes_chunk_by_chunk():
+    for wire in (gzipped(BODY), zlib.compress(BODY)):
+        decoder = cz.Decoder("gzip")
+        chunks = [wire[start:][:100] for start in range(0, len(wire), 100)]
+        body = b"".join(decoder.decode(chunk) for chunk in chunks) + decoder.flush()
+        assert body == BODY
+        assert (decoder.wire_bytes, decoder.decoded_bytes) == (len(wire), len(BODY))
+    decoder = cz.Decoder(cz.IDENTITY)
+    assert decoder.decode(BODY) + decoder.flush() == BODY
+    assert decoder.wire_bytes == decoder.decoded_bytes == len(BODY)
+
+
+def test_pages_are_negotiated_and_counted(standin):
+    context = {"url": QUERY_PREFIX + "student", "params": {"page": 1, "pagesize": 500}}
+    response, _ = make_request(standin.hostname).make_request(dict(context))
+    assert len(response.json()["record"]) == 500
+    assert cz.content_encoding(response) == "gzip"
+    assert cz.wire_bytes(response) < len(response.content) / 4
+    totals = cz.add_transfer({}, response, len(response.content))
+    response, _ = make_request(standin.hostname, compression=False).make_request(dict(context))
+    assert cz.content_encoding(response) == cz.IDENTITY
+    assert cz.wire_bytes(response) == len(response.content)
+    totals = cz.add_transfer(totals, response, len(response.content))
+    assert totals["encodings"] == {"gzip": 1, "identity": 1}
+    assert totals["decoded_bytes"] == 2 * len(response.content)
+    assert 1 < totals["ratio"] < 2
+
+
+def test_stream_is_decoded_while_it_is_written(standin, tmpdir):
+    context = {"url": QUERY_PREFIX + "student", "params": {"page": 1, "pagesize": 0}}
+    context["stream"] = True
+    response, _ = make_request(standin.hostname).make_request(context)
+    counter = {"bytes": 0}
+    entity = os.path.join(str(tmpdir), "student")
+    records = fp.stream_to_txt(response, ["studentid", "lastname"], entity, LOGGER, counter=counter)
+    assert records == 2000
+    assert 0 < cz.wire_bytes(response) < counter["bytes"] / 4
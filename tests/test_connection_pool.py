@@ -0,0 +1,122 @@
+import logging
+
+import requests
+
+from ..utils import json_stream as js
+from ..utils import queries_request as qr
+from ..utils import session_request as sr
+from .standin_server import QUERY_PREFIX
+
+LOGGER = logging.getLogger("test_connection_pool")
+STANDIN = {"entities": {"student": 40}, "latency": 0.02}
+
+
+def page_contexts(pages, spool=False):
+    return [
+        {
+            "url": QUERY_PREFIX + "student",
+            "params": {"page": page, "pagesize": 2},
+            "payload": {},
+            "spool": spool,
+        }
+        for page in range(1, pages + 1)
+    ]
+
+
+def pull_pages(session, hostname, pages, workers):
+    request = sr.RequestRetryPowerSchool(
+        session=session, method="POST", hostname=hostname, logger=LOGGER
+    )
+    contexts = page_contexts(pages)
+    return [
+        response.status_code
+        for response, _ in qr.ordered_imap(request.make_request, contexts, workers)
+    ]
+
+
+def test_pool_sized_to_the_workers_reuses_its_connections(standin):
+    session = sr.session_retry(pool_maxsize=4, pool_block=True, logger=LOGGER)
+    assert pull_pages(session, standin.hostname, pages=20, workers=4) == [200] * 20
+    stats = sr.session_stats(session).stats()
+    assert stats["requests"] == 20
+    assert stats["new_connections"] <= 4
+    assert stats["reused_connections"] == 20 - stats["new_connections"]
+    assert stats["discarded_connections"] == 0
+
+
+def test_small_pool_discards_connections(standin):
+    session = sr.session_retry(pool_maxsize=1, pool_block=False, logger=LOGGER)
+    assert pull_pages(session, standin.hostname, pages=20, workers=4) == [200] * 20
+    stats = sr.session_stats(session).stats()
+    assert stats["discarded_connections"] > 0
+    assert stats["new_connections"] > 4
+
+
+def test_spooled_pages_give_their_connection_back(standin):
+    session = sr.session_retry(pool_maxsize=1, pool_block=True, logger=LOGGER)
+    request = sr.RequestRetryPowerSchool(
+        session=session, method="POST", hostname=standin.hostname, logger=LOGGER
+    )
+    # with one connection, the second page waits for the first one unless its body was already read
+    responses = [request.make_request(context)[0] for context in page_contexts(3, spool=True)]
+    pages = [
+        [record["studentid"] for record in js.iter_records(response.iter_content(chunk_size=7))]
+        for response in responses
+    ]
+    assert pages == [["0", "1"], ["2", "3"], ["4", "5"]]
+    assert sr.session_stats(session).stats()["new_connections"] == 1
+
+
+class Budget(object):
+    def __init__(self, events):
+        self.events = events
+
+    def acquire(self):
+        self.events.append("acquire")
+
+    def release(self):
+        self.events.append("release")
+
+
+def test_budget_is_held_until_the_body_is_spooled(standin):
+    events = []
+    spool_body = sr.spool_body
+
+    def recorded_spool_body(response, **kwargs):
+        events.append("spool")
+        return spool_body(response, **kwargs)
+
+    request = sr.RequestRetryPowerSchool(
+        session=sr.session_retry(logger=LOGGER),
+        method="POST",
+        hostname=standin.hostname,
+        budget=Budget(events),
+        logger=LOGGER,
+    )
+    sr.spool_body = recorded_spool_body
+    try:
+        response, _ = request.make_request(page_contexts(1, spool=True)[0])
+    finally:
+        sr.spool_body = spool_body
+    assert response.status_code == 200
+    assert events == ["acquire", "spool", "release"]
+
+
+def test_spooled_bodies_bigger_than_the_spool_size_go_to_a_file(standin):
+    session = sr.session_retry(logger=LOGGER)
+    sizes = {}
+    for spool_size in (16, None):
+        request = sr.RequestRetryPowerSchool(
+            session=session,
+            method="POST",
+            hostname=standin.hostname,
+            spool_size=spool_size,
+            logger=LOGGER,
+        )
+        response, _ = request.make_request(page_contexts(1, spool=True)[0])
+        sizes[spool_size] = response.raw._rolled
+    assert sizes == {16: True, None: False}
+
+
+def test_session_stats_of_other_sessions():
+    assert sr.session_stats(requests.Session()) is None
@@ -1,8 +1,9 @@
+import logging
 import time
 
 import requests
 
-from ..utils.decorators import debuglog, retry_requests
+from ..utils.decorators import debuglog, for_all_methods, retry_requests
 from ..utils.loggering import LoggerGeneric
 
 
@@ -164,3 +165,75 @@ def test_log_decorator_class_logger_from_parameter_407(global_config):
     final = time.time()
     timer = int(final - initial)
     assert result.status_code == 407
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def list_logger(name, level):
+    logger = logging.getLogger(name)
+    logger.propagate = False
+    logger.setLevel(level)
+    handler = ListHandler()
+    logger.handlers = [handler]
+    return logger, handler
+
+
+def test_log_decorator_finds_the_logger_of_self_and_of_the_logger_argument():
+    logger, handler = list_logger("test_debuglog_debug", logging.DEBUG)
+
+    class Deco(object):
+        def __init__(self, logger):
+            self.logger = logger
+
+        def to_decorate(self, page):
+            return page
+
+    Deco = for_all_methods(["__init__"], debuglog())(Deco)
+
+    @debuglog()
+    def to_txt(page, entity, logger=None):
+        return page
+
+    assert Deco(logger).to_decorate(3) == 3
+    assert to_txt(0, "student", logger) == 0
+    assert to_txt(1, "student", logger=logger) == 1
+    assert [record.getMessage() for record in handler.records] == [
+        "Executing... ",
+        "Finishing...",
+        "Elapsed time: 0:00:00",
+        "Executing... ",
+        "Finished.",
+        "Elapsed time: 0:00:00",
+        "Executing... ",
+        "Finishing...",
+        "Elapsed time: 0:00:00",
+    ]
+    assert set(record.name_override for record in handler.records) == {"to_decorate", "to_txt"}
+
+
+def test_log_decorator_writes_nothing_without_debug():
+    logger, handler = list_logger("test_debuglog_info", logging.INFO)
+
+    class Deco(object):
+        def __init__(self, logger):
+            self.logger = logger
+
+        @debuglog()
+        def to_decorate(self, page):
+            return page
+
+    @debuglog()
+    def no_logger(page):
+        return page
+
+    assert Deco(logger).to_decorate(3) == 3
+    assert debuglog(logger=logger)(no_logger)(4) == 4
+    assert no_logger(5) == 5
+    assert handler.records == []
@@ -0,0 +1,162 @@
+import gzip
+import json
+import logging
+import os
+
+import pytest
+import requests
+
+from ..utils.file_processors import (
+    GzipTsvSink,
+    NdjsonSink,
+    PageWriter,
+    RowSerializer,
+    pages_to_txt,
+    review_temporary_file,
+    stream_to_txt,
+    truncate_file,
+)
+
+HEADERS = ["StudentId", "LastName"]
+PAGES = [
+    [{"studentid": "1", "lastname": "Smith"}, {"studentid": "2", "lastname": "Nunez"}],
+    [{"studentid": "3", "lastname": "Jones"}],
+]
+LOGGER = logging.getLogger(__name__)
+
+
+def test_page_writer_writes_header_once(tmpdir):
+    entity = os.path.join(str(tmpdir), "students")
+    with PageWriter(headers=HEADERS, entity=entity, logger=LOGGER) as writer:
+        counts = [writer.write_records(page) for page in PAGES]
+    with open("{}.txt.tmp".format(entity), "rb") as temp_file:
+        content = temp_file.read()
+    assert counts == [2, 1]
+    assert writer.records == 3
+    assert writer.bytes == len(content)
+    assert content == b"StudentId\tLastName\n1\tSmith\n2\tNunez\n3\tJones\n"
+
+
+def test_page_writer_opens_file_lazily(tmpdir):
+    entity = os.path.join(str(tmpdir), "students")
+    writer = PageWriter(headers=HEADERS, entity=entity, logger=LOGGER)
+    writer.close()
+    assert not os.path.exists("{}.txt.tmp".format(entity))
+
+
+def test_pages_to_txt_appends_without_repeating_header(tmpdir):
+    entity = os.path.join(str(tmpdir), "students")
+    for page in PAGES:
+        pages_to_txt(headers=HEADERS, data=page, entity=entity, logger=LOGGER)
+    with open("{}.txt.tmp".format(entity), "rb") as temp_file:
+        lines = temp_file.read().splitlines()
+    assert lines.count(b"StudentId\tLastName") == 1
+    assert len(lines) == 4
+
+
+class StreamResponse(object):
+    def __init__(self, content):
+        self.content = content
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+    def iter_content(self, chunk_size=1):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:][:chunk_size]
+
+
+def test_row_serializer_cleans_values():
+    serializer = RowSerializer(headers=["notes", "missing", "name"])
+    record = {
+        "notes": b"a\r\nb\nc\td \"e\" 'f' \r".decode("ascii"),
+        "name": b"N\xc3\xba".decode("utf-8"),
+    }
+    assert serializer.serialize(record) == b"a   b   c d e f \r\t\tN\xc3\xba\n"
+
+
+def test_row_serializer_values_that_are_not_text():
+    serializer = RowSerializer(headers=["a", "b", "c", "d"], logger=LOGGER)
+    record = {"a": b"x".decode("ascii"), "b": None, "c": 5, "d": b"y\x00z".decode("ascii")}
+    assert serializer.serialize(record) == b"x\t\t\ty\x00z\n"
+
+
+def test_row_serializer_write_in_batches(tmpdir):
+    serializer = RowSerializer(headers=["studentid"])
+    records = [{"studentid": "{}".format(index)} for index in range(7)]
+    with open(os.path.join(str(tmpdir), "students.txt"), "wb") as temp_file:
+        assert serializer.write(temp_file, records, batch_size=3) == 7
+    assert serializer.records == 7
+    assert serializer.bytes == os.path.getsize(os.path.join(str(tmpdir), "students.txt"))
+
+
+def test_stream_to_txt(tmpdir):
+    entity = os.path.join(str(tmpdir), "students")
+    body = json.dumps({"name": "students", "record": PAGES[0] + PAGES[1]}).encode("utf-8")
+    response = StreamResponse(body)
+    records = stream_to_txt(response, headers=HEADERS, entity=entity, logger=LOGGER)
+    with open("{}.txt.tmp".format(entity), "rb") as temp_file:
+        content = temp_file.read()
+    assert records == 3
+    assert response.closed
+    assert content == b"StudentId\tLastName\n1\tSmith\n2\tNunez\n3\tJones\n"
+
+
+class CutStreamResponse(StreamResponse):
+    def iter_content(self, chunk_size=1):
+        for chunk in StreamResponse.iter_content(self, chunk_size):
+            yield chunk
+        raise requests.exceptions.ChunkedEncodingError("Connection broken")
+
+
+def test_stream_to_txt_raises_when_the_stream_is_cut(tmpdir):
+    entity = os.path.join(str(tmpdir), "students")
+    body = json.dumps({"name": "students", "record": PAGES[0] + PAGES[1]}).encode("utf-8")
+    # the connection breaks in the middle of the third record
+    cut = body.index(b"Jones")
+    response = CutStreamResponse(body[:cut])
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        stream_to_txt(response, headers=HEADERS, entity=entity, logger=LOGGER)
+    assert response.closed
+    with open("{}.txt.tmp".format(entity), "rb") as temp_file:
+        assert temp_file.read() == b"StudentId\tLastName\n1\tSmith\n2\tNunez\n"
+
+
+def test_stream_to_txt_raises_when_the_body_is_truncated(tmpdir):
+    entity = os.path.join(str(tmpdir), "students")
+    body = json.dumps({"name": "students", "record": PAGES[0] + PAGES[1]}).encode("utf-8")
+    cut = body.index(b"Jones")
+    with pytest.raises(ValueError):
+        stream_to_txt(StreamResponse(body[:cut]), headers=HEADERS, entity=entity, logger=LOGGER)
+
+
+def test_gzip_sink_can_be_cut_after_every_page(tmpdir):
+    entity = os.path.join(str(tmpdir), "students")
+    sink = GzipTsvSink(headers=HEADERS, entity=entity, logger=LOGGER)
+    offsets = []
+    with PageWriter(headers=HEADERS, entity=entity, logger=LOGGER, sink=sink) as writer:
+        for page in PAGES:
+            writer.write_records(page)
+            writer.flush()
+            offsets.append(writer.offset)
+    assert writer.filename == "{}.txt.gz.tmp".format(entity)
+    with gzip.open(writer.filename, "rb") as gzip_file:
+        assert gzip_file.read() == b"StudentId\tLastName\n1\tSmith\n2\tNunez\n3\tJones\n"
+    truncate_file(writer.filename, offsets[0], logger=LOGGER)
+    pages_to_txt(headers=HEADERS, data=PAGES[1], entity=entity, logger=LOGGER, sink=sink)
+    review_temporary_file(entity, logger=LOGGER, extension=sink.extension)
+    with gzip.open("{}.txt.gz".format(entity), "rb") as gzip_file:
+        assert gzip_file.read() == b"StudentId\tLastName\n1\tSmith\n2\tNunez\n3\tJones\n"
+
+
+def test_stream_to_ndjson(tmpdir):
+    entity = os.path.join(str(tmpdir), "students")
+    body = json.dumps({"name": "students", "record": PAGES[0] + PAGES[1]}).encode("utf-8")
+    sink = NdjsonSink(headers=HEADERS, entity=entity, logger=LOGGER)
+    records = stream_to_txt(StreamResponse(body), HEADERS, entity, LOGGER, sink=sink)
+    with open("{}.ndjson.tmp".format(entity), "rb") as temp_file:
+        lines = temp_file.read().splitlines()
+    assert records == 3
+    assert [json.loads(line.decode("utf-8")) for line in lines] == PAGES[0] + PAGES[1]
+    assert lines[0] == b'{"studentid":"1","lastname":"Smith"}'
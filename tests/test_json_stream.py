@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+from ..utils.json_stream import RecordParser, iter_records
+
+RECORDS = [
+    {"studentid": "1", "lastname": "O'Neil", "notes": 'ends with "}'},
+    {"studentid": "2", "lastname": "Nunez", "notes": "tab\there, new\r\nline"},
+    {"studentid": "3", "lastname": "Smith", "extra": {"nested": ["a", "b"]}},
+]
+
+
+def envelope(records, extra=""):
+    body = '{"name": "students", "record": ' + json.dumps(records) + extra + "}"
+    return body.encode("utf-8")
+
+
+def chunked(data, size):
+    return [data[start:][:size] for start in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("size", [1, 3, 17, 4096])
+def test_iter_records_any_chunk_size(size):
+    assert list(iter_records(chunked(envelope(RECORDS), size))) == RECORDS
+
+
+def test_iter_records_multibyte_character_split_between_chunks():
+    body = b'{"name": "students", "record": [{"lastname": "Nu\xc3\xb1ez"}]}'
+    expected = [{"lastname": b"Nu\xc3\xb1ez".decode("utf-8")}]
+    assert list(iter_records(chunked(body, 1))) == expected
+
+
+def test_iter_records_ignores_extensions():
+    body = envelope(RECORDS[:1], extra=', "@extensions": "x"')
+    assert list(iter_records([body])) == RECORDS[:1]
+
+
+def test_iter_records_without_records():
+    assert list(iter_records([b'{"name": "students"}'])) == []
+    assert list(iter_records([b'{"name": "students", "record": []}'])) == []
+
+
+def test_iter_records_truncated_response():
+    with pytest.raises(ValueError):
+        list(iter_records([envelope(RECORDS)[:-20]]))
+
+
+def test_record_parser_yields_records_as_they_complete():
+    parser = RecordParser()
+    assert parser.feed(b'{"name": "s", "record": [{"a": "1"}, {"a"') == [{"a": "1"}]
+    assert parser.feed(b': "2"}]}') == [{"a": "2"}]
+    assert parser.close() == []
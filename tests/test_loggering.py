@@ -0,0 +1,132 @@
+import logging
+import os
+import threading
+import time
+
+from ..utils import loggering
+
+
+def read_lines(filename):
+    with open(filename) as log_file:
+        return log_file.read().splitlines()
+
+
+def wait_for(condition, seconds=5):
+    deadline = time.time() + seconds
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_records_are_written_by_the_listener(tmpdir):
+    log_file = os.path.join(str(tmpdir), "debug.log")
+    loggerps = loggering.LoggerPowerSchool(
+        log_level="DEBUG",
+        formatter="%(levelname)s %(funcName)s: %(message)s",
+        name="test_loggering_listener",
+        file_name=log_file,
+    )
+    logger = loggerps.get_logger(file_level="INFO")
+    logger.propagate = False
+    written = []
+    loggerps.listener.handlers[1].target.emit = lambda record: written.append(
+        (threading.current_thread().name, record.getMessage())
+    )
+
+    def page(number):
+        logger.debug("Page %s", number)
+        logger.info("Page %s written", number)
+
+    threads = [threading.Thread(target=page, args=(number,)) for number in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert wait_for(lambda: len(written) == 3)
+    assert sorted(message for _, message in written) == [
+        "Page 0 written",
+        "Page 1 written",
+        "Page 2 written",
+    ]
+    assert set(name for name, _ in written) == {loggerps.listener._thread.name}
+
+
+def test_memory_is_flushed_at_the_capacity_and_the_flush_level():
+    written = []
+    target = logging.Handler()
+    target.emit = written.append
+    memory = loggering.LoggerPowerSchool().memory_handler(capacity=3, target=target)
+    record = lambda level: logging.LogRecord("test", level, __file__, 1, "message", None, None)
+    memory.handle(record(logging.INFO))
+    memory.handle(record(logging.WARNING))
+    assert written == []
+    memory.handle(record(logging.ERROR))
+    assert len(written) == 3
+    for _ in range(3):
+        memory.handle(record(logging.INFO))
+    assert len(written) == 6
+
+
+def test_records_are_written_at_exit(tmpdir):
+    log_file = os.path.join(str(tmpdir), "debug.log")
+    loggerps = loggering.LoggerPowerSchool(
+        formatter="%(levelname)s: %(message)s", name="test_loggering_exit", file_name=log_file
+    )
+    logger = loggerps.get_logger(file_level="INFO")
+    logger.propagate = False
+    for number in range(100):
+        logger.info("Record %s", number)
+    logger.warning("Last one")
+    loggering.stop_listeners()
+    lines = read_lines(log_file)
+    assert len(lines) == 101
+    assert lines[-1] == "WARNING: Last one"
+    assert loggerps.listener not in loggering.LISTENERS.values()
+
+
+def test_records_keep_their_arguments_as_they_were_logged(tmpdir):
+    log_file = os.path.join(str(tmpdir), "debug.log")
+    loggerps = loggering.LoggerPowerSchool(
+        formatter="%(levelname)s: %(message)s", name="test_loggering_arguments", file_name=log_file
+    )
+    logger = loggerps.get_logger(file_level="INFO")
+    logger.propagate = False
+    result = {"records": 0}
+    for records in (5000, 10000):
+        result["records"] = records
+        logger.info("Student: %s", result)
+    result["records"] = 12000
+    try:
+        raise ValueError("page 3")
+    except ValueError:
+        logger.exception("Failed: %s", result)
+    result["records"] = None
+    loggering.stop_listeners()
+    lines = read_lines(log_file)
+    assert lines[:3] == [
+        "INFO: Student: {'records': 5000}",
+        "INFO: Student: {'records': 10000}",
+        "ERROR: Failed: {'records': 12000}",
+    ]
+    assert lines[-1] == "ValueError: page 3"
+
+
+def test_a_logger_asked_again_shares_its_listener(tmpdir):
+    log_file = os.path.join(str(tmpdir), "debug.log")
+    loggerps = loggering.LoggerPowerSchool(
+        formatter="%(levelname)s: %(message)s", name="test_loggering_shared", file_name=log_file
+    )
+    logger = loggerps.get_logger(file_level="INFO")
+    logger.propagate = False
+    listener = loggerps.listener
+    assert loggerps.get_logger(file_level="INFO") is logger
+    assert loggerps.listener is listener
+    assert len(logger.handlers) == 1
+    logger.info("Only once")
+    loggering.stop_listeners()
+    assert read_lines(log_file) == ["INFO: Only once"]
+    # a listener stopped at exit is replaced along with its handler
+    loggerps.get_logger(file_level="INFO")
+    assert loggerps.listener is not listener
+    assert logger.handlers == [loggerps.listener.queue_handler]
+    loggering.stop_listeners()
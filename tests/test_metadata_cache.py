@@ -0,0 +1,50 @@
+import json
+import logging
+import os
+
+import requests
+
+from ..powerQueriesPull_generic import build_pull
+from ..utils import client_info as ci
+from .standin_server import QUERY_PREFIX, Options
+
+LOGGER = logging.getLogger("test_metadata_cache")
+STUDENT = QUERY_PREFIX + "student"
+
+
+def pull_metadata(client, options):
+    pull = build_pull(options, client, requests.Session(), logger=LOGGER, pull_logger=LOGGER)
+    pull.metadata_cache = pull.get_metadata_cache(options)
+    token = pull.get_token(client.tokenUrl, use_cache=pull.metadata_cache is not None)
+    pull.get_request_headers(token=token)
+    yearid = pull.get_year_id()
+    return pull, yearid, pull.get_num_pages(filelist=[STUDENT], yearid=yearid)
+
+
+def test_metadata_cache_skips_the_round_trips(standin, tmpdir):
+    config_file = os.path.join(str(tmpdir), "client.json")
+    with open(config_file, "w") as f:
+        json.dump(
+            {
+                "hostname": standin.hostname,
+                "clientId": "a",
+                "clientSecret": "b",
+                "tokenUrl": "/oauth/access_token/",
+                "cache_dir": str(tmpdir),
+                "count_cache_ttl": 60,
+            },
+            f,
+        )
+    client = ci.ClientPowerSchool(config_file=config_file)
+    _, yearid, num_pages = pull_metadata(client, Options(no_cache=False))
+    requests_made = standin.requests
+    assert requests_made == 3
+
+    pull, cached_yearid, cached_num_pages = pull_metadata(client, Options(no_cache=False))
+    assert standin.requests == requests_made
+    assert (cached_yearid, cached_num_pages["student"]) == (yearid, num_pages["student"])
+    assert pull.metadata_cache.stats() == {"hits": 2, "misses": 0, "hit_ratio": 1.0}
+
+    pull, _, _ = pull_metadata(client, Options(no_cache=True))
+    assert standin.requests == requests_made * 2
+    assert pull.metadata_cache is None
@@ -0,0 +1,122 @@
+import json
+import logging
+import os
+
+import pytest
+import requests
+
+from ..powerQueriesPull_generic import build_pull
+from ..utils import client_info as ci
+from ..utils import metrics as mt
+from ..utils import session_request as sr
+from .standin_server import QUERY_PREFIX, Options
+
+LOGGER = logging.getLogger("test_metrics")
+
+
+def test_request_phases():
+    assert mt.request_phase({"entity_name": "token", "url": "/oauth/access_token/"}) == "token"
+    assert mt.request_phase({"entity_name": "yearid", "url": QUERY_PREFIX + "yearid"}) == "yearid"
+    assert (
+        mt.request_phase({"entity_name": "student", "url": QUERY_PREFIX + "student/count"})
+        == "count"
+    )
+    assert mt.request_phase({"entity_name": "student", "url": QUERY_PREFIX + "student"}) == "page"
+    assert mt.request_phase({"entity_name": "student", "stream": True}) == "stream"
+
+
+def test_histograms_in_the_prometheus_text_format():
+    metrics = mt.Metrics(labels={"host": 'http://a"b'}, logger=LOGGER)
+    for seconds in (0.02, 0.2, 7.0):
+        metrics.observe("request_seconds", seconds, phase="page", entity="student")
+    metrics.count("records_total", 5, entity="student")
+    metrics.count("records_total", 7, entity="student")
+    lines = metrics.prometheus().splitlines()
+    labels = 'entity="student",host="http://a\\"b",phase="page"'
+    assert "# TYPE powerqueries_request_seconds histogram" in lines
+    assert 'powerqueries_request_seconds_bucket{%s,le="0.01"} 0' % labels in lines
+    assert 'powerqueries_request_seconds_bucket{%s,le="0.25"} 2' % labels in lines
+    assert 'powerqueries_request_seconds_bucket{%s,le="+Inf"} 3' % labels in lines
+    assert "powerqueries_request_seconds_count{%s} 3" % labels in lines
+    assert 'powerqueries_records_total{entity="student",host="http://a\\"b"} 12' in lines
+    with pytest.raises(ValueError):
+        metrics.count("request_seconds")
+
+
+def test_requests_are_counted_by_phase(standin, tmpdir):
+    metrics = mt.Metrics(labels={"host": standin.hostname}, logger=LOGGER)
+    request = sr.RequestRetryPowerSchool(
+        session=requests.Session(),
+        method="POST",
+        hostname=standin.hostname,
+        metrics=metrics,
+        logger=LOGGER,
+    )
+    request.make_request({"url": QUERY_PREFIX + "student/count", "entity_name": "student"})
+    for page in (1, 2):
+        request.make_request(
+            {
+                "url": QUERY_PREFIX + "student",
+                "entity_name": "student",
+                "params": {"page": page, "pagesize": 6},
+            }
+        )
+    filename = os.path.join(str(tmpdir), "metrics.json")
+    metrics.to_json(filename)
+    with open(filename) as metrics_file:
+        snapshot = json.load(metrics_file)
+    counts = dict(
+        (series["labels"]["phase"], series["value"])
+        for series in snapshot["counter"]["requests_total"]
+    )
+    latencies = dict(
+        (series["labels"]["phase"], series["value"])
+        for series in snapshot["histogram"]["request_seconds"]
+    )
+    assert counts == {"count": 1, "page": 2}
+    assert latencies["page"]["count"] == 2
+    assert latencies["page"]["buckets"]["+Inf"] == 2
+    assert set(series["labels"]["status"] for series in snapshot["counter"]["requests_total"]) == {
+        "200"
+    }
+
+
+def test_pull_exports_the_metrics(standin, tmpdir):
+    config_file = os.path.join(str(tmpdir), "client.json")
+    textfile = os.path.join(str(tmpdir), "powerqueries.prom")
+    with open(config_file, "w") as f:
+        json.dump(
+            {
+                "hostname": standin.hostname,
+                "clientId": "a",
+                "clientSecret": "b",
+                "tokenUrl": "/oauth/access_token/",
+                "metrics_textfile": textfile,
+            },
+            f,
+        )
+    client = ci.ClientPowerSchool(config_file=config_file)
+    pull = build_pull(
+        Options(),
+        client,
+        requests.Session(),
+        logger=LOGGER,
+        pull_logger=LOGGER,
+        output_dir=str(tmpdir),
+    )
+    pull.get_request_headers(token=pull.get_token(client.tokenUrl, use_cache=False))
+    pull.get_num_pages(filelist=[QUERY_PREFIX + "student"], yearid=pull.get_year_id())
+    pull.export_metrics(run_seconds=1.5)
+    with open(os.path.join(str(tmpdir), mt.METRICS_FILE)) as metrics_file:
+        snapshot = json.load(metrics_file)
+    phases = sorted(series["labels"]["phase"] for series in snapshot["histogram"]["phase_seconds"])
+    assert phases == ["count", "token", "yearid"]
+    assert snapshot["gauge"]["run_seconds"][0]["value"] == 1.5
+    with open(textfile) as prom_file:
+        lines = prom_file.read().splitlines()
+    host = 'host="{}"'.format(standin.hostname)
+    assert (
+        'powerqueries_requests_total{entity="student",%s,phase="count",status="200"} 1' % host
+        in lines
+    )
+    assert "# TYPE powerqueries_last_success_timestamp_seconds gauge" in lines
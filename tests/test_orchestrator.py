@@ -0,0 +1,38 @@
+import mock
+
+from ..utils.orchestrator import DistrictOrchestrator
+
+
+class FakePull:
+    def __init__(self, result, error=None):
+        self.result = result
+        self.context = {"error": error} if error else {}
+        self.query = mock.MagicMock()
+
+    def run(self, options=None):
+        return self.result
+
+
+def test_district_orchestrator_summary(tmpdir):
+    pulls = {
+        "5121": FakePull({"student": {"count": 10, "records": 10}, "token": "abc"}),
+        "5990": FakePull({}, error="No access_token"),
+    }
+
+    def build_pull(district, budget, logger):
+        if district["folder"] == "8399":
+            raise ValueError("broken config")
+        return pulls[district["folder"]]
+
+    districts = [
+        {"folder": folder, "output_dir": str(tmpdir)} for folder in ("5121", "5990", "8399")
+    ]
+    districts.append({"folder": "1234", "error": "Site folder /home/1234 does not exist"})
+    summary = DistrictOrchestrator(build_pull, max_in_flight=2, budget=4).run(districts, None)
+    assert summary["5121"]["status"] == "ok"
+    assert summary["5121"]["records"] == 10
+    assert summary["5121"]["entities"] == 1
+    assert summary["5990"]["error"] == "No access_token"
+    assert summary["8399"]["error"] == "broken config"
+    assert summary["1234"]["status"] == "failed"
+    assert pulls["5121"].query.request.close.called
@@ -0,0 +1,52 @@
+from ..utils import page_sizer as ps
+
+
+def test_page_size_ladder_halves_the_largest_size():
+    assert ps.page_size_ladder(625, 5000) == [625, 1250, 2500, 5000]
+    assert ps.page_size_ladder(1000, 5000) == [1250, 2500, 5000]
+    assert ps.page_size_ladder(100, 3000) == [375, 750, 1500, 3000]
+
+
+def test_page_sizer_starts_from_the_estimates():
+    assert ps.PageSizer().size == 5000
+    assert ps.PageSizer(target_bytes=2500000, bytes_per_record=1000.0).size == 2500
+    assert ps.PageSizer(target_seconds=1.0, seconds_per_record=0.01).size == 625
+
+
+def test_page_sizer_moves_one_step_per_response():
+    sizer = ps.PageSizer(target_bytes=1000000)
+    sizer.observe(records=5000, size=5000 * 1000)
+    assert sizer.size == 2500
+    sizer.observe(records=2500, size=2500 * 1000)
+    assert sizer.size == 1250
+    for _ in range(20):
+        sizer.observe(records=1250, size=1250 * 10)
+    assert sizer.size == 5000
+
+
+def test_next_page_starts_at_a_page_boundary():
+    sizer = ps.PageSizer()
+    assert sizer.next_page(0) == (1, 5000)
+    sizer.size = 2500
+    assert sizer.next_page(5000) == (3, 2500)
+    sizer.size = 5000
+    assert sizer.next_page(7500) == (4, 2500)
+    assert sizer.next_page(8125) == (14, 625)
+    assert sizer.stats()["sizes"] == {"5000": 1, "2500": 2, "625": 1}
+
+
+def test_changing_page_sizes_cover_every_record_once():
+    records = list(range(23456))
+    sizer = ps.PageSizer(target_bytes=500000)
+    pulled, offset, step = [], 0, 0
+    while offset < len(records):
+        page, size = sizer.next_page(offset)
+        start, end = (page - 1) * size, page * size
+        data = records[start:end]
+        pulled.extend(data)
+        # the rows get wider and narrower while the entity is pulled
+        sizer.observe(records=len(data), size=len(data) * (400 if step % 6 < 3 else 20))
+        offset += size
+        step += 1
+    assert pulled == records
+    assert len(sizer.stats()["sizes"]) > 1
@@ -0,0 +1,40 @@
+import logging
+import os
+import pstats
+import threading
+
+from ..utils import profiler as pf
+
+LOGGER = logging.getLogger("test_profiler")
+
+
+def busy(n):
+    return sum(i * i for i in range(n))
+
+
+def test_phase_profiles_the_threads_it_starts(tmpdir):
+    folder = os.path.join(str(tmpdir), "profile")
+    profiler = pf.PhaseProfiler(folder=folder, top=50, logger=LOGGER)
+    with profiler.phase("entities"):
+        threads = [threading.Thread(target=busy, args=(10000,)) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    with profiler.phase("review"):
+        busy(100)
+    stats = pstats.Stats(os.path.join(folder, "entities.prof"))
+    calls = dict((function[2], values[0]) for function, values in stats.stats.items())
+    assert calls["busy"] == 3
+    assert os.path.isfile(os.path.join(folder, "review.prof"))
+    summary = profiler.summary()
+    assert "entities:" in summary
+    assert "review:" in summary
+    assert "(busy)" in summary
+
+
+def test_no_profile_does_nothing(tmpdir):
+    with pf.NO_PROFILE as phase:
+        busy(100)
+    assert phase is pf.NO_PROFILE
+    assert os.listdir(str(tmpdir)) == []
@@ -1,3 +1,4 @@
+import sys
 import time
 
 import pytest
@@ -147,3 +148,27 @@ def test_queries_request_pages_generator(global_config, request_args_200):
     )
     result = queryps2.make_queries()
     assert result == 9
+
+
+def test_ordered_imap_keeps_input_order():
+    def delayed(number):
+        time.sleep(0.01 * (number % 4))
+        return number
+
+    result = list(qr.ordered_imap(delayed, range(20), workers=4))
+    assert result == list(range(20))
+
+
+def test_ordered_imap_sequential():
+    result = list(qr.ordered_imap(lambda number: number * 2, range(5), workers=1))
+    assert result == [0, 2, 4, 6, 8]
+
+
+def test_ordered_imap_raises_the_system_exit_of_a_worker():
+    def exits(number):
+        if number == 3:
+            sys.exit(2)
+        return number
+
+    with pytest.raises(SystemExit):
+        list(qr.ordered_imap(exits, range(10), workers=4))
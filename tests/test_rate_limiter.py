@@ -0,0 +1,76 @@
+import logging
+import time
+
+from ..utils import rate_limiter as rl
+from ..utils import retry_policy as rp
+from ..utils import session_request as sr
+from .standin_server import QUERY_PREFIX
+
+LOGGER = logging.getLogger("test_rate_limiter")
+COUNT = {"url": QUERY_PREFIX + "student/count", "entity_name": "student"}
+
+
+def make_request(hostname, rate_limiters):
+    return sr.RequestRetryPowerSchool(
+        session=sr.session_retry(logger=LOGGER),
+        method="POST",
+        hostname=hostname,
+        retry_policy=rp.RetryPolicy(backoff=0, logger=LOGGER),
+        rate_limiters=rate_limiters,
+        logger=LOGGER,
+    )
+
+
+def test_bucket_spaces_the_requests_after_the_burst():
+    limiter = rl.RateLimiter("host", rate=10, burst=2, logger=LOGGER)
+    delays = [limiter.reserve(entity="student") for _ in range(5)]
+    assert delays[:2] == [0.0, 0.0]
+    assert [round(delay, 1) for delay in delays[2:]] == [0.1, 0.2, 0.3]
+    assert abs(limiter.wait_seconds("student") - 0.6) < 0.01
+
+
+def test_rate_goes_down_on_429_and_back_up():
+    limiter = rl.RateLimiter("host", rate=10, logger=LOGGER)
+    limiter.record(429)
+    limiter.record(429)
+    assert limiter.rate == 5.0
+    limiter.record(200)
+    assert round(limiter.rate, 6) == 5.2
+    for _ in range(100):
+        limiter.record(200)
+    assert limiter.rate == 10.0
+    assert limiter.stats()["throttled"] == 2
+    assert limiter.stats()["decreases"] == 1
+
+
+def test_unlimited_host_is_limited_after_a_429():
+    limiter = rl.RateLimiter("host", logger=LOGGER)
+    for _ in range(10):
+        assert limiter.reserve() == 0.0
+        time.sleep(0.01)
+    limiter.record(429)
+    assert limiter.ceiling is not None
+    assert round(limiter.rate, 6) == round(limiter.ceiling / 2, 6)
+    assert limiter.reserve() > 0
+
+
+def test_requests_wait_for_the_limiter(standin):
+    limiters = rl.RateLimiters(logger=LOGGER)
+    limiter = limiters.get(standin.hostname, rate=20, burst=1)
+    request = make_request(standin.hostname, limiters)
+    t0 = time.time()
+    for _ in range(6):
+        response, _ = request.make_request(dict(COUNT))
+        assert response.json() == {"count": 12}
+    assert time.time() - t0 >= 0.2
+    assert limiter.wait_seconds("student") > 0
+
+
+def test_429_lowers_the_rate_of_the_host(standin):
+    standin.failures.append((429, {"Retry-After": "0"}))
+    limiters = rl.RateLimiters(logger=LOGGER)
+    limiter = limiters.get(standin.hostname, rate=20)
+    response, _ = make_request(standin.hostname, limiters).make_request(dict(COUNT))
+    assert response.json() == {"count": 12}
+    assert limiter.stats()["throttled"] == 1
+    assert 10.0 <= limiter.rate < 20.0
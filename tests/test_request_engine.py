@@ -0,0 +1,61 @@
+import json
+import logging
+import os
+import sys
+
+import pytest
+import requests
+
+from ..powerQueriesPull_generic import build_pull
+from ..utils import client_info as ci
+from ..utils import session_request as sr
+from .standin_server import Options
+
+LOGGER = logging.getLogger("test_request_engine")
+
+
+def make_client(tmpdir):
+    config_file = os.path.join(str(tmpdir), "client.json")
+    with open(config_file, "w") as f:
+        json.dump(
+            {
+                "hostname": "http://127.0.0.1:1",
+                "clientId": "a",
+                "clientSecret": "b",
+                "tokenUrl": "/oauth/access_token/",
+            },
+            f,
+        )
+    return ci.ClientPowerSchool(config_file=config_file)
+
+
+def make_pull(tmpdir, engine):
+    return build_pull(
+        Options(engine=engine),
+        make_client(tmpdir),
+        requests.Session(),
+        logger=LOGGER,
+        pull_logger=LOGGER,
+        output_dir=str(tmpdir),
+    )
+
+
+def test_threads_engine_is_the_default(tmpdir):
+    pull = make_pull(tmpdir, engine=None)
+    assert type(pull.query.request).__name__ == sr.RequestRetryPowerSchool.__name__
+
+
+@pytest.mark.skipif(sys.version_info[0] >= 3, reason="the async engine runs on Python 3")
+def test_async_engine_is_rejected_on_python_2(tmpdir):
+    with pytest.raises(SystemExit):
+        make_pull(tmpdir, engine="async")
+
+
+@pytest.mark.skipif(sys.version_info[0] < 3, reason="the async engine needs Python 3")
+def test_async_engine_on_python_3(tmpdir):
+    pytest.importorskip("aiohttp")
+    pull = make_pull(tmpdir, engine="async")
+    try:
+        assert type(pull.query.request).__name__ == "AsyncRequestPowerSchool"
+    finally:
+        pull.query.request.close()
@@ -0,0 +1,103 @@
+import logging
+import time
+from email.utils import formatdate
+
+import requests
+
+from ..utils import retry_policy as rp
+from ..utils import session_request as sr
+from .standin_server import QUERY_PREFIX
+
+LOGGER = logging.getLogger("test_retry_policy")
+STUDENT_PAGE = {
+    "url": QUERY_PREFIX + "student",
+    "params": {"page": 1, "pagesize": 5},
+    "payload": {},
+    "entity_name": "student",
+}
+
+
+def make_response(status, retry_after=None):
+    response = requests.Response()
+    response.status_code = status
+    if retry_after is not None:
+        response.headers["Retry-After"] = retry_after
+    return response
+
+
+def test_retry_after_in_seconds_and_dates():
+    assert rp.retry_after(make_response(429, "7")) == 7.0
+    now = time.time()
+    assert 19 <= rp.retry_after(make_response(503, formatdate(now + 20)), now=now) <= 20
+    assert rp.retry_after(make_response(503, "soon")) is None
+    assert rp.retry_after(make_response(503)) is None
+
+
+def test_backoff_is_jittered_below_the_limit():
+    policy = rp.RetryPolicy(attempts=10, backoff=1.0, max_backoff=5.0)
+    delays = [policy.next_delay(make_response(502), 3) for _ in range(50)]
+    assert all(0 <= delay <= 4.0 for delay in delays)
+    assert len(set(delays)) > 1
+    assert all(policy.next_delay(make_response(502), 8) <= 5.0 for _ in range(10))
+
+
+def test_next_delay_stops_retrying():
+    policy = rp.RetryPolicy(attempts=3, max_retry_after=60)
+    assert policy.next_delay(make_response(200), 1) is None
+    assert policy.next_delay(make_response(404), 1) is None
+    assert policy.next_delay(make_response(503), 3) is None
+    assert policy.next_delay(make_response(429, "600"), 1) is None
+    assert policy.next_delay(make_response(429, "6"), 1) == 6.0
+    assert policy.next_delay(make_response(401), 1, immediate=True) == 0.0
+
+
+def test_budget_is_shared_and_counted_by_entity():
+    budget = rp.RetryBudget(retries=3)
+    policy = rp.RetryPolicy(backoff=0, budget=budget)
+    other = rp.RetryPolicy(backoff=0, budget=budget)
+    assert policy.next_delay(make_response(500), 1, entity="student") == 0
+    assert policy.next_delay(make_response(503), 2, entity="student") == 0
+    assert other.next_delay(make_response(500), 1, entity="section") == 0
+    assert policy.next_delay(make_response(500), 1, entity="student") is None
+    assert budget.remaining() == 0
+    assert policy.stats("student") == {
+        "retries": 2,
+        "sleep_seconds": 0.0,
+        "statuses": {"500": 1, "503": 1},
+        "given_up": 1,
+    }
+    assert policy.stats("section") is None
+
+
+def test_request_waits_the_retry_after(standin):
+    standin.failures.extend([(503, {"Retry-After": "1"}), (500, {})])
+    policy = rp.RetryPolicy(backoff=0.1, logger=LOGGER)
+    request = sr.RequestRetryPowerSchool(
+        session=sr.session_retry(logger=LOGGER),
+        method="POST",
+        hostname=standin.hostname,
+        retry_policy=policy,
+        logger=LOGGER,
+    )
+    t0 = time.time()
+    response, _ = request.make_request(dict(STUDENT_PAGE))
+    assert time.time() - t0 >= 1
+    assert len(response.json()["record"]) == 5
+    assert standin.requests == 3
+    stats = policy.stats("student")
+    assert (stats["retries"], stats["statuses"]) == (2, {"503": 1, "500": 1})
+    assert stats["sleep_seconds"] >= 1
+
+
+def test_request_gives_up_after_the_attempts(standin):
+    standin.failures.extend([(502, {})] * 5)
+    request = sr.RequestRetryPowerSchool(
+        session=sr.session_retry(logger=LOGGER),
+        method="POST",
+        hostname=standin.hostname,
+        retry_policy=rp.RetryPolicy(attempts=3, backoff=0, logger=LOGGER),
+        logger=LOGGER,
+    )
+    response, _ = request.make_request(dict(STUDENT_PAGE))
+    assert response.status_code == 502
+    assert standin.requests == 3
@@ -0,0 +1,43 @@
+import time
+
+import pytest
+
+from ..utils.scheduler import EntityScheduler
+
+
+def test_entity_scheduler_pulls_every_entity():
+    entities = ["/ws/schema/query/com.blackboard.datalink.{}".format(n) for n in ("a", "b", "c")]
+
+    def pull(entity):
+        time.sleep(0.01)
+        return {entity.split(".")[-1]: {"records": 1}}
+
+    scheduler = EntityScheduler(max_in_flight=2)
+    results = dict((entity, result) for entity, result, elapsed in scheduler.run(pull, entities))
+    assert sorted(results) == sorted(entities)
+    assert results[entities[1]] == {"b": {"records": 1}}
+
+
+def test_entity_scheduler_isolates_failures():
+    def pull(entity):
+        if entity.endswith("broken"):
+            raise ValueError("boom")
+        return {entity.split(".")[-1]: {"records": 1}}
+
+    scheduler = EntityScheduler(max_in_flight=2)
+    results = dict(
+        (entity, result) for entity, result, elapsed in scheduler.run(pull, ["x.ok", "x.broken"])
+    )
+    assert results["x.ok"] == {"ok": {"records": 1}}
+    assert results["x.broken"] == {"broken": {"error": "boom"}}
+
+
+def test_entity_scheduler_raises_a_keyboard_interrupt():
+    def pull(entity):
+        if entity.endswith("stopped"):
+            raise KeyboardInterrupt()
+        return {entity.split(".")[-1]: {"records": 1}}
+
+    scheduler = EntityScheduler(max_in_flight=2)
+    with pytest.raises(KeyboardInterrupt):
+        list(scheduler.run(pull, ["x.ok", "x.stopped", "x.other"]))
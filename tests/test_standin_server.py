@@ -0,0 +1,37 @@
+import time
+
+import requests
+
+from ..utils.json_stream import iter_records
+from .standin_server import QUERY_PREFIX, WRITE_SIZE, StandInServer, make_record
+
+
+def test_whole_entity_is_streamed_in_chunks():
+    server = StandInServer(entities={"student": 1234}, fields=3, chunked=True).start()
+    try:
+        response = requests.post(
+            server.hostname + QUERY_PREFIX + "student",
+            params={"page": 1, "pagesize": 0},
+            stream=True,
+        )
+        assert response.headers["Transfer-Encoding"] == "chunked"
+        records = list(iter_records(response.iter_content(chunk_size=1000)))
+    finally:
+        server.stop()
+    assert len(records) == 1234
+    assert records[1233] == make_record("student", 1233, fields=3)
+
+
+def test_answers_are_sent_at_the_bandwidth():
+    server = StandInServer(entities={"student": 1000}, bandwidth=2**20).start()
+    try:
+        t0 = time.time()
+        response = requests.post(
+            server.hostname + QUERY_PREFIX + "student", params={"page": 1, "pagesize": 0}
+        )
+        elapsed = time.time() - t0
+    finally:
+        server.stop()
+    assert len(response.json()["record"]) == 1000
+    # the server sleeps after every block it writes, the client can be done before the sleep of the last one
+    assert elapsed >= (len(response.content) - WRITE_SIZE) / float(2**20)
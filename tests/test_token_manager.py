@@ -0,0 +1,98 @@
+import logging
+import os
+
+import pytest
+import requests
+
+from ..utils import queries_request as qr
+from ..utils import session_request as sr
+from ..utils.cache import FileCache
+from ..utils.token_manager import TokenError, TokenManager
+from .standin_server import QUERY_PREFIX
+
+LOGGER = logging.getLogger("test_token_manager")
+STANDIN = {"entities": {"student": 12}, "check_tokens": True}
+
+
+class FakeFetch(object):
+    def __init__(self, expires_in=3600):
+        self.expires_in = expires_in
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return "token-{}".format(self.calls), "{}".format(self.expires_in)
+
+
+def test_token_manager_reuses_the_cached_token(tmpdir):
+    cache = FileCache(os.path.join(str(tmpdir), "tokens.json"))
+    fetch = FakeFetch()
+    assert TokenManager(fetch, cache=cache, key="district").get_token() == "token-1"
+    manager = TokenManager(fetch, cache=cache, key="district")
+    assert manager.get_token() == "token-1"
+    assert manager.status()["source"] == "cache"
+    assert fetch.calls == 1
+    assert TokenManager(fetch, cache=cache, key="other").get_token() == "token-2"
+
+
+def test_token_manager_refreshes_before_expiry():
+    fetch = FakeFetch(expires_in=100)
+    manager = TokenManager(fetch, refresh_margin=300)
+    assert manager.get_token() == "token-1"
+    assert manager.get_token() == "token-2"
+
+
+def test_token_manager_refreshes_a_stale_token_once():
+    fetch = FakeFetch()
+    manager = TokenManager(fetch)
+    stale = manager.get_token()
+    assert manager.refresh(stale_token=stale) == "token-2"
+    assert manager.refresh(stale_token=stale) == "token-2"
+    assert fetch.calls == 2
+
+
+def test_token_manager_does_not_keep_a_failed_token(tmpdir):
+    cache = FileCache(os.path.join(str(tmpdir), "tokens.json"))
+    manager = TokenManager(lambda: ({"error": "invalid_client"}, None), cache=cache, key="district")
+    with pytest.raises(TokenError):
+        manager.get_token()
+    assert manager.token is None
+    assert cache.get("district") is None
+
+
+def test_failed_token_fails_the_page_workers(standin):
+    def fetch():
+        raise TokenError("invalid_client")
+
+    request = sr.RequestRetryPowerSchool(
+        session=requests.Session(),
+        method="POST",
+        hostname=standin.hostname,
+        token_manager=TokenManager(fetch),
+        logger=LOGGER,
+    )
+    contexts = [{"url": QUERY_PREFIX + "student/count"} for _ in range(4)]
+    with pytest.raises(TokenError):
+        list(qr.ordered_imap(request.make_request, contexts, workers=2))
+
+
+def test_request_retries_a_page_with_a_new_token(standin):
+    def fetch():
+        response = requests.post(standin.hostname + "/oauth/access_token/")
+        return response.json()["access_token"], response.json()["expires_in"]
+
+    request = sr.RequestRetryPowerSchool(
+        session=requests.Session(),
+        method="POST",
+        hostname=standin.hostname,
+        retry_params={},
+        token_manager=TokenManager(fetch),
+        logger=LOGGER,
+    )
+    context = {"url": QUERY_PREFIX + "student/count"}
+    response, _ = request.make_request(dict(context))
+    assert response.json()["count"] == 12
+    standin.expire_tokens()
+    response, _ = request.make_request(dict(context))
+    assert response.json()["count"] == 12
+    assert request.headers["Authorization"] == "Bearer standin-token-2"
@@ -0,0 +1,81 @@
+import json
+import logging
+import os
+
+import requests
+
+from ..powerQueriesPull_generic import build_pull
+from ..utils import client_info as ci
+from ..utils import transfer_mode as tm
+from .standin_server import QUERY_PREFIX, Options
+
+LOGGER = logging.getLogger("test_transfer_mode")
+STANDIN = {"entities": {"student": 12000}}
+STUDENT = QUERY_PREFIX + "student"
+
+
+def test_choose_mode_keeps_the_pinned_mode():
+    fast_stream = {"records_per_sec": 100000.0}
+    mode, reason = tm.choose_mode(1000, 1, 10, stream_stats=fast_stream, pinned=tm.PAGED)
+    assert (mode, reason) == (tm.PAGED, "pinned in the config file")
+
+
+def test_choose_mode_falls_back_to_the_threshold():
+    assert tm.choose_mode(60000, 12, 10)[0] == tm.STREAM
+    assert tm.choose_mode(60000, 12, 10, page_stats={"records_per_sec": 1000.0})[0] == tm.STREAM
+    assert tm.choose_mode(5000, 1, 10)[0] == tm.PAGED
+
+
+def test_choose_mode_picks_the_cheaper_mode():
+    page_stats = {"records_per_sec": 10000.0}
+    assert tm.choose_mode(60000, 12, 10, page_stats, {"records_per_sec": 5000.0})[0] == tm.PAGED
+    assert tm.choose_mode(600, 1, 10, page_stats, {"records_per_sec": 20000.0})[0] == tm.STREAM
+    # the stream has to be faster by the margin
+    assert tm.choose_mode(60000, 12, 10, page_stats, {"records_per_sec": 11000.0})[0] == tm.PAGED
+
+
+def test_choose_mode_pages_a_stream_that_does_not_fit():
+    page_stats = {"bytes_per_record": 100.0, "records_per_sec": 1000.0}
+    stream_stats = {"records_per_sec": 100000.0}
+    assert tm.choose_mode(60000, 12, 10, page_stats, stream_stats)[0] == tm.STREAM
+    mode, reason = tm.choose_mode(
+        60000, 12, 10, page_stats, stream_stats, keep_json=True, free_bytes=2**20
+    )
+    assert mode == tm.PAGED
+    assert "free" in reason
+
+
+def test_sampled_first_page_is_kept(standin, tmpdir):
+    config_file = os.path.join(str(tmpdir), "client.json")
+    with open(config_file, "w") as f:
+        json.dump(
+            {
+                "hostname": standin.hostname,
+                "clientId": "a",
+                "clientSecret": "b",
+                "tokenUrl": "/oauth/access_token/",
+                "cache_dir": str(tmpdir),
+                "headerDict": {"student.txt": ["organizationid", "studentid"]},
+            },
+            f,
+        )
+    client = ci.ClientPowerSchool(config_file=config_file)
+    options = Options(no_cache=False)
+    pull = build_pull(
+        options,
+        client,
+        requests.Session(),
+        logger=LOGGER,
+        pull_logger=LOGGER,
+        output_dir=str(tmpdir),
+    )
+    pull.metadata_cache = pull.get_metadata_cache(options)
+    pull.get_request_headers(token=pull.get_token(client.tokenUrl, use_cache=False))
+    # a stream that was timed before and pages that never were
+    pull.set_cached(pull.stats_key("stream", STUDENT), {"records_per_sec": 1.0}, 60)
+    result = pull.get_files(
+        filelist=[STUDENT], numpages=pull.get_num_pages(filelist=[STUDENT], yearid="33")
+    )
+    assert standin.pages == [("student", 1), ("student", 2), ("student", 3)]
+    assert result["student"]["records"] == 12000
+    assert pull.get_cached(pull.stats_key("page", STUDENT), 60)["records_per_sec"] > 0
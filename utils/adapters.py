@@ -1,12 +1,19 @@
 import decimal as dec
+import os
 import time
 from datetime import datetime
 
+import _strptime  # noqa: F401 datetime.strptime imports it lazily, which is not thread safe
 import loggering
 from base import AdapterGeneric
 
+from utils import checkpoint as ckp
+from utils import compression as cz
 from utils import file_processors as fp
 from utils import get_info as gi
+from utils import json_stream as js
+from utils import page_sizer as ps
+from utils import transfer_mode as tm
 
 
 # @for_all_methods(['__init__'], debuglog())
@@ -21,10 +28,64 @@ class PowerSchoolAdapter(AdapterGeneric):
         """
         kwargs.setdefault("headers", {})
         kwargs.setdefault("payload", {})
-        kwargs.setdefault("pages", {})
         kwargs.setdefault("result", {})
+        kwargs.setdefault("writers", {})
+        kwargs.setdefault("sinks", {})
+        kwargs.setdefault("checkpoints", {})
+        kwargs.setdefault("sizers", {})
+        kwargs.setdefault("stream_timings", {})
+        kwargs.setdefault("page_samples", {})
         return kwargs
 
+    def get_filename(self, entity_name):
+        """
+        It returns the path, without extension, of the files of an entity inside the output folder
+
+        :param entity_name: the name of the entity
+        """
+        return os.path.join(self.output_dir, entity_name)
+
+    def get_output_format(self, entity_name):
+        """
+        It returns the output format of an entity: its own in "output_formats" of the config file, or "output_format"
+        for all of them, a tab separated txt file by default
+
+        :param entity_name: the name of the entity
+        """
+        output_format = (self.client.get("output_formats", {}) or {}).get(entity_name)
+        return output_format or self.client.get("output_format", fp.DEFAULT_FORMAT)
+
+    def get_sink_class(self, entity_name):
+        """
+        It returns the sink class of the output format of an entity, or the one of a tab separated txt file when the
+        format is not known
+
+        :param entity_name: the name of the entity
+        """
+        return fp.SINKS.get(self.get_output_format(entity_name), fp.TsvSink)
+
+    def get_tmp_filename(self, entity_name):
+        """
+        It returns the tmp file the records of an entity are written to during the pull
+
+        :param entity_name: the name of the entity
+        """
+        return "{}.{}.tmp".format(
+            self.get_filename(entity_name), self.get_sink_class(entity_name).extension
+        )
+
+    def get_sink(self, entity_name):
+        """
+        It returns the sink that writes the records of an entity, with the headers of the entity
+
+        :param entity_name: the name of the entity
+        """
+        return self.get_sink_class(entity_name)(
+            headers=self.context["headers"][entity_name],
+            entity=self.get_filename(entity_name),
+            logger=self.logger,
+        )
+
     def preadapter_token(self, *args, **kwargs):
         """
         This function takes in a string and returns a list of tokens
@@ -60,11 +121,12 @@ class PowerSchoolAdapter(AdapterGeneric):
             response, request = kwargs.get("response")
             entity = request.get("entity_name")
             self.context["result"][entity] = response.json()["access_token"]
+            self.context["expires_in"] = response.json().get("expires_in")
         except Exception as exc:
+            # the pull raises the error on the thread that asked for the token
             self.context["result"][entity] = {
                 "error": "No access_token in the response: {}".format(exc)
             }
-            loggering.error_log(msg=exc)
         return self.context["result"]
 
     def preadapter_yearid(self, *args, **kwargs):
@@ -76,23 +138,28 @@ class PowerSchoolAdapter(AdapterGeneric):
         request = []
         if "yearid" in entity:
             entity_name = "yearid"
-            rollover_month_day = self.client.get("rollover_month_day", "08/01")
-            try:
-                cutover_date = "{0}/{1}".format(rollover_month_day, datetime.today().year)
-                rollover_date = datetime.strptime(cutover_date, "%m/%d/%Y").date()
-                self.context["rollover_date"] = rollover_date
-            except Exception as err:
-                loggering.error_log(
-                    'Invalid roll-over date entered, please format "mm/dd", received: {0}, {1}'.format(
-                        rollover_month_day, err
-                    ),
-                    logger=self.logger,
-                )
-            year_range = gi.settle_year_range(rollover_date=rollover_date, logger=self.logger)
-            payload = {"yearrange": year_range}
+            payload = {"yearrange": self.get_year_range()}
             request.append({"payload": payload, "url": entity, "entity_name": entity_name})
         return request
 
+    def get_year_range(self):
+        """
+        It returns the school year range of today, like "2022-2023", from the roll-over date of the client
+        """
+        rollover_month_day = self.client.get("rollover_month_day", "08/01")
+        try:
+            cutover_date = "{0}/{1}".format(rollover_month_day, datetime.today().year)
+            rollover_date = datetime.strptime(cutover_date, "%m/%d/%Y").date()
+            self.context["rollover_date"] = rollover_date
+        except Exception as err:
+            loggering.error_log(
+                'Invalid roll-over date entered, please format "mm/dd", received: {0}, {1}'.format(
+                    rollover_month_day, err
+                ),
+                logger=self.logger,
+            )
+        return gi.settle_year_range(rollover_date=rollover_date, logger=self.logger)
+
     def postadapter_yearid(self, *args, **kwargs):
         """
         A function that takes in a self, *args, and **kwargs.
@@ -130,13 +197,23 @@ class PowerSchoolAdapter(AdapterGeneric):
         """
         response, request = kwargs.get("response")
         entity_name = request.get("entity_name")
-        self.context["payload"][entity_name] = request.get("payload", {})
-        self.context["result"][entity_name] = {"count": response.json()["count"]}
+        self.set_count(entity_name, response.json()["count"], request.get("payload", {}))
         self.logger.debug(
             "{} has {} records.".format(entity_name, self.context["result"][entity_name])
         )
         return self.context["result"]
 
+    def set_count(self, entity_name, count, payload):
+        """
+        It keeps the number of records of an entity and the payload its data requests need
+
+        :param entity_name: the name of the entity
+        :param count: the number of records
+        :param payload: the payload the count request needed
+        """
+        self.context["payload"][entity_name] = payload
+        self.context["result"][entity_name] = {"count": count}
+
     def preadapter_data(self, *args, **kwargs):
         """
         This function takes a list of pages and returns a list of pages
@@ -145,11 +222,20 @@ class PowerSchoolAdapter(AdapterGeneric):
         request = {}
         entity = args[0]
         entity_name = entity.split(".")[-1]
-        json_filename = "{}.json.tmp".format(entity_name)
-        txt_filename = "{}.txt.tmp".format(entity_name)
+        json_filename = "{}.json.tmp".format(self.get_filename(entity_name))
+        output_format = self.get_output_format(entity_name)
+        if output_format not in fp.SINKS:
+            self.logger.warning(
+                "Ignoring the output format {} of {}, it is not one of {}.".format(
+                    output_format, entity_name, ", ".join(sorted(fp.SINKS))
+                )
+            )
+        txt_filename = self.get_tmp_filename(entity_name)
         self.context["result"][entity_name]["error_file"] = []
-        num_records = dec.Decimal(context["num_pages"][entity_name]["count"])
-        num_pagelimit = dec.Decimal(context["records_per_page"])
+        count = context["num_pages"][entity_name]["count"]
+        sizer = self.get_sizer(entity_name, context)
+        num_records = dec.Decimal(count)
+        num_pagelimit = dec.Decimal(sizer.sizes[-1])
         pagenum = (
             int(
                 dec.Decimal(num_records / num_pagelimit).quantize(
@@ -159,8 +245,29 @@ class PowerSchoolAdapter(AdapterGeneric):
             if entity_name in context["num_pages"]
             else 1
         )
-        stream = pagenum > context["stream_threshold"]
-        txt_file_deleted = fp.check_and_delete_file(full_filename=txt_filename, logger=self.logger)
+        url = "{}".format(entity)
+        payload = self.context["payload"][entity_name]
+        previous = (
+            ckp.Checkpoint.load(
+                ckp.checkpoint_filename(self.get_filename(entity_name)), logger=self.logger
+            )
+            if context.get("resume", False)
+            else None
+        )
+        stream, sample = self.choose_mode(
+            entity_name, url, payload, count, pagenum, sizer, context, previous=previous
+        )
+        snapshot = {
+            "yearid": context.get("yearid"),
+            "count": count,
+            "page_size_base": sizer.base,
+            "stream": stream,
+        }
+        checkpoint, first_record = self.get_checkpoint(entity_name, snapshot, previous=previous)
+        self.context["checkpoints"][entity_name] = checkpoint
+        txt_file_deleted = first_record > 0 or fp.check_and_delete_file(
+            full_filename=txt_filename, logger=self.logger
+        )
         json_file_deleted = fp.check_and_delete_file(
             full_filename=json_filename, logger=self.logger
         )
@@ -175,67 +282,341 @@ class PowerSchoolAdapter(AdapterGeneric):
                 self.context["result"][entity_name]["error_file"] = list(
                     "" if txt_file_deleted else txt_filename
                 )
-        pages = 1 if stream else pagenum
-        url = "{}".format(entity)
         self.context["headers"][entity_name] = gi.get_file_type_headers(
             client=self.client, entity=entity_name, logger=self.logger
         )
-        payload = self.context["payload"][entity_name]
+        self.context["sinks"][entity_name] = self.get_sink(entity_name)
         self.context["result"][entity_name].update(
             {"stream": 0, "records": 0} if stream else {"pages": 0, "records": 0}
         )
         self.context["result"][entity_name].update(
             {"payload": self.context["payload"][entity_name]}
         )
+        if first_record > 0:
+            self.context["result"][entity_name]["resumed_at_record"] = first_record
         if json_file_deleted and txt_file_deleted:
-            request = [
-                {
-                    "payload": payload,
-                    "params": {
-                        "page": page,
-                        "pagesize": 0 if stream else context["records_per_page"],
-                    },
-                    "url": url,
-                    "entity_name": entity_name,
-                    "stream": stream,
-                }
-                for page in range(1, pages + 1)
-            ]
-        self.context["pages"][entity_name] = pages
+            if stream:
+                request = [
+                    {
+                        "payload": payload,
+                        "params": {"page": 1, "pagesize": 0},
+                        "url": url,
+                        "entity_name": entity_name,
+                        "stream": stream,
+                    }
+                ]
+        if not stream:
+            self.context["sizers"][entity_name] = sizer
+            self.context["writers"][entity_name] = fp.PageWriter(
+                headers=self.context["headers"][entity_name],
+                entity=self.get_filename(entity_name),
+                logger=self.logger,
+                sink=self.context["sinks"][entity_name],
+            )
+            if json_file_deleted and txt_file_deleted:
+                if sample is not None:
+                    # the sampled first page is the first page of the pull
+                    self.postadapter_data_to_txt(response=sample)
+                    first_record = sample[1]["params"]["pagesize"]
+                request = self.page_requests(sizer, entity_name, url, payload, first_record, count)
         return request or []
 
+    def choose_mode(self, entity_name, url, payload, count, pages, sizer, context, previous=None):
+        """
+        It returns if the entity is streamed, and the response of its first page when it was requested to sample
+        the cost of the pages. A mode pinned in "transfer_modes" of the config file wins, then the mode of the pull
+        being resumed. Otherwise the mode is chosen by its cost, from the records per second of both modes in the last
+        runs. When only the stream was timed before, the first page is requested to time the pages.
+
+        :param entity_name: the name of the entity
+        :param url: the url of the entity
+        :param payload: the payload of the requests
+        :param count: the number of records of the entity
+        :param pages: the number of pages of the entity at the largest page size
+        :param sizer: the page sizer of the entity
+        :param context: the context of the query, with "page_stats" and "stream_stats"
+        :param previous: the checkpoint of the pull being resumed, if any
+        """
+        page_stats = (context.get("page_stats") or {}).get(entity_name)
+        stream_stats = (context.get("stream_stats") or {}).get(entity_name)
+        pinned = (self.client.get("transfer_modes", {}) or {}).get(entity_name)
+        if pinned is not None and pinned not in tm.MODES:
+            self.logger.warning(
+                "Ignoring the transfer mode {} of {}, it is not one of {}.".format(
+                    pinned, entity_name, ", ".join(tm.MODES)
+                )
+            )
+            pinned = None
+        sample = None
+        if pinned is None and previous is not None and previous.snapshot.get("count") == count:
+            mode = tm.STREAM if previous.snapshot.get("stream") else tm.PAGED
+            reason = "the mode of the pull being resumed"
+        else:
+            if pinned is None and stream_stats and not page_stats and count > sizer.size:
+                sample, page_stats = self.sample_page(sizer, entity_name, url, payload)
+                if page_stats:
+                    self.context["page_samples"][entity_name] = page_stats
+            mode, reason = tm.choose_mode(
+                count,
+                pages,
+                context["stream_threshold"],
+                page_stats=page_stats,
+                stream_stats=stream_stats,
+                pinned=pinned,
+                keep_json=self.client.get("keep_stream_json", False),
+                free_bytes=tm.free_space(self.output_dir),
+                margin=self.client.get("stream_margin", tm.STREAM_MARGIN),
+            )
+        self.logger.info("{} is pulled {}: {}.".format(entity_name, mode, reason))
+        return mode == tm.STREAM, sample if mode == tm.PAGED else None
+
+    def sample_page(self, sizer, entity_name, url, payload):
+        """
+        It requests the first page of an entity and returns the response and the bytes and records per second of the
+        pages it points to, or None and no stats when the request failed
+
+        :param sizer: the page sizer of the entity
+        :param entity_name: the name of the entity
+        :param url: the url of the entity
+        :param payload: the payload of the requests
+        """
+        request = next(self.page_requests(sizer, entity_name, url, payload, 0, sizer.size))
+        response, request = self.query.request.make_request(request)
+        elapsed = getattr(response, "elapsed", None)
+        if not response.ok or not elapsed:
+            return None, None
+        records = len(response.json()["record"])
+        if not records:
+            return None, None
+        workers = max(self.query.workers or 1, 1)
+        return (response, request), {
+            "bytes_per_record": float(len(response.content)) / records,
+            "records_per_sec": records * workers / max(elapsed.total_seconds(), 0.001),
+        }
+
+    def get_sizer(self, entity_name, context):
+        """
+        It returns the page sizer of an entity, with the page size limits and targets of the pull and the bytes and
+        seconds per record seen in the last run of the entity
+
+        :param entity_name: the name of the entity
+        :param context: the context of the query, with "page_sizing" and "page_stats"
+        """
+        settings = context.get("page_sizing") or {}
+        estimates = (context.get("page_stats") or {}).get(entity_name) or {}
+        return ps.PageSizer(
+            page_size_min=settings.get("page_size_min", ps.PAGE_SIZE_MIN),
+            page_size_max=settings.get("page_size_max", ps.PAGE_SIZE_MAX),
+            target_bytes=settings.get("target_bytes", ps.TARGET_BYTES),
+            target_seconds=settings.get("target_seconds", ps.TARGET_SECONDS),
+            bytes_per_record=estimates.get("bytes_per_record"),
+            seconds_per_record=estimates.get("seconds_per_record"),
+        )
+
+    def page_requests(self, sizer, entity_name, url, payload, first_record, count):
+        """
+        It yields the page requests of an entity from `first_record` on. The requests are made while the responses of
+        the ones before arrive, so every page gets the size the sizer picks with the responses seen so far.
+
+        :param sizer: the page sizer of the entity
+        :param entity_name: the name of the entity
+        :param url: the url of the entity
+        :param payload: the payload of the requests
+        :param first_record: the first record to request
+        :param count: the number of records of the entity
+        """
+        offset = first_record
+        while offset < count:
+            page, size = sizer.next_page(offset)
+            yield {
+                "payload": payload,
+                "params": {"page": page, "pagesize": size},
+                "url": url,
+                "entity_name": entity_name,
+                "stream": False,
+                "spool": True,
+                "offset": offset,
+            }
+            offset += size
+
+    def get_checkpoint(self, entity_name, snapshot, previous=None):
+        """
+        It returns the checkpoint of the entity and the first record to request. When resuming, and the checkpoint of
+        the last run has the same snapshot, the tmp file is cut after the last page written one after the other from
+        the first record and the pull goes on from the record after it. Otherwise the entity starts from the first
+        record with a new checkpoint.
+
+        :param entity_name: the name of the entity
+        :param snapshot: the year id, count, page size and mode of the entity in this run
+        :param previous: the checkpoint of the last run when the pull is resumed
+        """
+        filename = self.get_filename(entity_name)
+        txt_filename = self.get_tmp_filename(entity_name)
+        path = ckp.checkpoint_filename(filename)
+        checkpoint = previous
+        if checkpoint is not None and checkpoint.snapshot == snapshot:
+            records, offset = checkpoint.resume_point(
+                os.path.getsize(txt_filename) if os.path.exists(txt_filename) else 0
+            )
+            if records:
+                fp.truncate_file(txt_filename, offset, logger=self.logger)
+                checkpoint.keep_pages(records)
+                self.logger.info(
+                    "Resuming {} after record {} of the last run.".format(entity_name, records)
+                )
+                return checkpoint, records
+        elif checkpoint is not None:
+            self.logger.info(
+                "The count or the year id of {} changed since the last run, pulling it again.".format(
+                    entity_name
+                )
+            )
+        return ckp.Checkpoint(path, snapshot=snapshot, logger=self.logger), 0
+
+    def close_writers(self):
+        """
+        It closes the page writers of the entities pulled, flushing their txt files, and adds the page sizes used, the
+        retries and the seconds waited for the rate limiter to the results
+        """
+        while self.context["writers"]:
+            entity_name, writer = self.context["writers"].popitem()
+            writer.close()
+            if entity_name in self.context["result"]:
+                self.context["result"][entity_name]["bytes"] = writer.bytes
+        for entity_name, sizer in self.context["sizers"].items():
+            if entity_name in self.context["result"]:
+                self.context["result"][entity_name]["page_sizing"] = sizer.stats()
+        retry_policy = getattr(self.query.request, "retry_policy", None)
+        limiter = self.query.request.get_rate_limiter()
+        for entity_name, result in self.context["result"].items():
+            if not isinstance(result, dict):
+                continue
+            retries = retry_policy.stats(entity_name) if retry_policy is not None else None
+            if retries is not None:
+                result["retries"] = retries
+            wait_seconds = limiter.wait_seconds(entity_name) if limiter is not None else 0
+            if wait_seconds:
+                result["rate_limit_wait_seconds"] = wait_seconds
+
+    def add_transfer(self, entity_name, response, decoded_bytes):
+        """
+        It adds the bytes received and decoded of a response to the "transfer" of the entity in the results
+
+        :param entity_name: the name of the entity
+        :param response: the response whose body was read
+        :param decoded_bytes: the bytes of the decoded body
+        """
+        totals = self.context["result"][entity_name].setdefault("transfer", {})
+        cz.add_transfer(totals, response, decoded_bytes)
+
+    def failadapter_data(self, *args, **kwargs):
+        """
+        It marks the entity of a page or stream that failed, also when the open circuit failed it at once, with an
+        error, so its tmp file doesn't replace the last whole file and its checkpoint is kept for --resume
+        """
+        response, request = kwargs.get("response")
+        entity_name = request.get("entity_name")
+        result = self.context["result"].get(entity_name)
+        if not isinstance(result, dict):
+            return
+        if request.get("stream"):
+            result["error"] = "The stream failed with a {} response.".format(response.status_code)
+        else:
+            result["error"] = "Page {} failed with a {} response.".format(
+                (request.get("params") or {}).get("page"), response.status_code
+            )
+        self.logger.error("{}: {}".format(entity_name, result["error"]))
+
     def postadapter_data_to_txt(self, *args, **kwargs):
         """
         It takes a stream of pages and converts them to text.
         """
         response, request = kwargs.get("response")
         entity_name = request.get("entity_name")
+        if ckp.STOP.is_set():
+            raise ckp.PullStopped(
+                "The pull of {} was stopped before page {}.".format(
+                    entity_name, request["params"]["page"]
+                )
+            )
+        checkpoint = self.context["checkpoints"][entity_name]
         t1 = time.time()
         try:
             if request["stream"]:
-                chunks_count = fp.stream_to_json(
-                    response=response, entity=entity_name, logger=self.logger
-                )
-                if chunks_count:
-                    records_count = fp.json_to_txt(
+                counter = {"bytes": 0}
+                result = self.context["result"][entity_name]
+                try:
+                    records_count = fp.stream_to_txt(
+                        response=response,
                         headers=self.context["headers"][entity_name],
-                        entity=entity_name,
+                        entity=self.get_filename(entity_name),
+                        keep_json=self.client.get("keep_stream_json", False),
+                        counter=counter,
                         logger=self.logger,
+                        sink=self.context["sinks"][entity_name],
                     )
-                self.context["result"][entity_name]["stream"] += 1
-                self.context["result"][entity_name]["records"] += records_count
+                except Exception as exc:
+                    # the tmp file has part of the entity, it must not replace the last whole file
+                    result["error"] = "The stream failed: {}".format(exc)
+                    raise
+                self.add_transfer(entity_name, response, counter["bytes"])
+                result["stream"] += 1
+                result["records"] += records_count
+                # a stream can't be resumed in the middle, it is only recorded when all its records arrived
+                if records_count != checkpoint.snapshot["count"]:
+                    result["error"] = "The stream has {} records and the count is {}.".format(
+                        records_count, checkpoint.snapshot["count"]
+                    )
+                    self.logger.error("{}: {}".format(entity_name, result["error"]))
+                else:
+                    txt_filename = self.context["sinks"][entity_name].tmp_filename
+                    checkpoint.page_done(0, records_count, os.path.getsize(txt_filename))
+                    elapsed = getattr(response, "elapsed", None)
+                    seconds = time.time() - t1 + (elapsed.total_seconds() if elapsed else 0)
+                    if records_count and seconds > 0:
+                        self.context["stream_timings"][entity_name] = {
+                            "records_per_sec": records_count / seconds
+                        }
             else:
-                data = response.json()["record"]
-                records_count = fp.pages_to_txt(
-                    headers=self.context["headers"][entity_name],
-                    data=data,
-                    entity=entity_name,
-                    logger=self.logger,
+                # the records are parsed out of the body and written a batch at a time, so a page is never held
+                # as a list of records
+                writer = self.context["writers"][entity_name]
+                parser = js.RecordParser()
+                counter = {"bytes": 0}
+                chunks = fp.count_chunks(
+                    response.iter_content(chunk_size=fp.STREAM_CHUNK_SIZE), counter
+                )
+                result = self.context["result"][entity_name]
+                page = request["params"]["page"]
+                try:
+                    records_count = writer.write_records(js.iter_records(chunks, parser))
+                except Exception as exc:
+                    # the tmp file has part of the page, it must not replace the last whole file
+                    result["error"] = "Page {} failed: {}".format(page, exc)
+                    raise
+                finally:
+                    response.close()
+                if parser.state != js.DONE or records_count != parser.count:
+                    result["error"] = "Page {} was cut after {} records.".format(
+                        page, records_count
+                    )
+                    self.logger.error("{}: {}".format(entity_name, result["error"]))
+                elif records_count:
+                    writer.flush()
+                    checkpoint.page_done(
+                        request["offset"], request["offset"] + records_count, writer.offset
+                    )
+                self.add_transfer(entity_name, response, counter["bytes"])
+                elapsed = getattr(response, "elapsed", None)
+                self.context["sizers"][entity_name].observe(
+                    parser.count,
+                    counter["bytes"],
+                    elapsed.total_seconds() if elapsed is not None else None,
                 )
                 self.logger.debug(
-                    "Page {0} out of {1} successfully created for {2} with {3} records.".format(
+                    "Page {0} of {1} records successfully created for {2} with {3} records.".format(
                         request["params"]["page"],
-                        self.context["pages"][entity_name],
+                        request["params"]["pagesize"],
                         entity_name,
                         records_count,
                     )
@@ -245,4 +626,9 @@ class PowerSchoolAdapter(AdapterGeneric):
         except Exception as e:
             print(e)
             records_count = 0
+        metrics = getattr(self.query.request, "metrics", None)
+        if metrics is not None:
+            # the records of a stream are converted while it arrives, so its conversion includes the transfer
+            metrics.observe("phase_seconds", time.time() - t1, phase="convert", entity=entity_name)
+            metrics.count("records_total", records_count, entity=entity_name)
         return self.context["result"]
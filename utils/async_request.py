@@ -0,0 +1,354 @@
+import asyncio
+import collections
+import datetime as dt
+import functools
+import json
+import tempfile
+import time
+
+import compression as cz
+import requests
+from decorators import debuglog, for_all_methods
+from queries_request import QueriesPowerSchool
+from requests.structures import CaseInsensitiveDict
+from session_request import RequestRetryPowerSchool, session_stats
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+CHUNK_SIZE = 2**16
+# the seconds between two tries to take a slot of the worker budget
+BUDGET_POLL = 0.01
+
+
+class StreamBody(object):
+    """
+    It is the `raw` of a streamed response of the asyncio engine. It reads the body from the aiohttp response when
+    `iter_content` asks for it, running the event loop of the request until the next chunk arrives, so the records are
+    parsed while the body arrives without a copy of it in memory or on disk. The loop runs the other requests in
+    flight meanwhile. It must be read while the loop is not running, like between the responses of `make_requests`.
+
+    :param resp: the aiohttp response, whose body was not read
+    :param loop: the event loop of the request
+    :param decoder: the `compression.Decoder` of the body
+    :param response: the `requests.Response` whose `wire_bytes` are kept up to date
+    """
+
+    def __init__(self, resp, loop, decoder, response):
+        self.resp = resp
+        self.loop = loop
+        self.decoder = decoder
+        self.response = response
+        self.buffer = b""
+        self.done = False
+
+    def read(self, size=-1, *args, **kwargs):
+        """
+        It returns up to `size` decoded bytes of the body, all of it when `size` is negative or None, and b"" at its
+        end
+        """
+        while not self.done and (size is None or size < 0 or len(self.buffer) < size):
+            chunk = self.loop.run_until_complete(self.resp.content.readany())
+            if chunk:
+                self.buffer += self.decoder.decode(chunk)
+            else:
+                self.buffer += self.decoder.flush()
+                self.done = True
+                self.resp.release()
+            self.response.wire_bytes = self.decoder.wire_bytes
+        if size is None or size < 0:
+            size = len(self.buffer)
+        data = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return data
+
+    def close(self):
+        """
+        It closes the connection of a body that was not read to its end, which can't go back to the pool
+        """
+        if not self.done:
+            self.done = True
+            self.resp.close()
+
+
+@for_all_methods(["__init__", "make_request_async", "fetch", "build_response"], debuglog())
+class AsyncRequestPowerSchool(RequestRetryPowerSchool):
+    """
+    This class makes the same requests as `RequestRetryPowerSchool`, from the same context dictionaries and through the
+    same `check_response` and logging hooks, but on an asyncio event loop, so many requests can be in flight without a
+    thread for each one. It needs Python 3 and aiohttp.
+
+    :param limit: the maximum number of open connections to the host
+    """
+
+    def __init__(self, *args, **kwargs):
+        if aiohttp is None:
+            raise ImportError("The asyncio request engine needs the aiohttp package installed.")
+        self.limit = kwargs.pop("limit", 100)
+        super(AsyncRequestPowerSchool, self).__init__(*args, **kwargs)
+        self.loop = None
+        self.client_session = None
+
+    def get_loop(self):
+        """
+        It returns the event loop of this request, creating it the first time
+        """
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+        return self.loop
+
+    def spawn(self):
+        """
+        It returns a copy of the request with its own event loop, so it can be used from another thread
+        """
+        request = super(AsyncRequestPowerSchool, self).spawn()
+        request.loop = None
+        request.client_session = None
+        return request
+
+    def close(self):
+        """
+        It closes the aiohttp session and the event loop
+        """
+        if self.loop is None:
+            return
+        if self.client_session is not None:
+            self.loop.run_until_complete(self.client_session.close())
+            self.client_session = None
+        self.loop.close()
+        self.loop = None
+
+    def make_request(self, *args, **kwargs):
+        """
+        It makes a single request, blocking until the response arrives, for the callers that don't batch requests.
+        """
+        return self.get_loop().run_until_complete(self.make_request_async(args[0]))
+
+    def make_requests(self, prepare, concurrency=1):
+        """
+        It makes the prepared requests with up to `concurrency` of them in flight on the event loop, and yields the
+        responses in the same order as the requests
+
+        :param prepare: an iterable of request context dictionaries
+        :param concurrency: the maximum number of requests in flight
+        """
+        loop = self.get_loop()
+        pending = collections.deque()
+        try:
+            for context in prepare:
+                pending.append(loop.create_task(self.make_request_async(context)))
+                if len(pending) >= max(concurrency, 1):
+                    yield loop.run_until_complete(pending.popleft())
+            while pending:
+                yield loop.run_until_complete(pending.popleft())
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def make_request_async(self, context):
+        """
+        It makes the request, sending it again while the retry policy allows it, like `make_request` does for the
+        threaded requests
+
+        :param context: the request context dictionary
+        """
+        attempt = 0
+        while True:
+            response, context = await self.fetch(context)
+            attempt += 1
+            refreshed = response.status_code == 401 and self.uses_token(context)
+            if refreshed:
+                self.logger.info("The token was rejected, requesting a new one.")
+                refresh = functools.partial(
+                    self.token_manager.refresh, stale_token=self.get_token()
+                )
+                self.authorize(await asyncio.get_event_loop().run_in_executor(None, refresh))
+            if self.circuit_is_open():
+                break
+            delay = self.retry_policy.next_delay(
+                response, attempt, entity=context.get("entity_name"), immediate=refreshed
+            )
+            if delay is None:
+                break
+            self.log_retry(response, context, attempt, delay)
+            await asyncio.sleep(delay)
+        if not response.ok and not context.get("stream", self.stream):
+            self.logger.debug(msg=response.text)
+        return response, context
+
+    def trace_configs(self):
+        """
+        It returns the aiohttp trace configs that add the requests and the connections opened to the connection
+        counters of the requests session, so both engines report them the same way
+        """
+        connection_stats = session_stats(self.session)
+        if connection_stats is None:
+            return []
+
+        async def on_request_start(session, context, params):
+            connection_stats.count(requests=1)
+
+        async def on_connection_create_end(session, context, params):
+            connection_stats.count(connections=1)
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        return [trace_config]
+
+    async def fetch(self, context):
+        """
+        It makes one attempt of the request and returns a `requests.Response` with the result, so the hooks written for
+        the threaded requests work unchanged. The wait for the rate limiter of the host is not part of the elapsed
+        time of the response.
+
+        :param context: the request context dictionary
+        """
+        breaker = self.get_circuit_breaker()
+        ticket = breaker.allow() if breaker is not None else None
+        if breaker is not None and ticket is None:
+            return self.circuit_open_response(), context
+        limiter = self.get_rate_limiter()
+        if limiter is not None:
+            delay = limiter.reserve(entity=context.get("entity_name"))
+            if delay > 0:
+                await asyncio.sleep(delay)
+        t0 = time.time()
+        if self.client_session is None:
+            # the bodies are decoded by build_response, which counts the bytes received
+            self.client_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.limit),
+                trace_configs=self.trace_configs(),
+                auto_decompress=False,
+            )
+        url = context.get("url", "")
+        params = context.get("params", None) or {}
+        timeout = context.get("timeout", self.timeout)
+        stream = context.get("stream", self.stream)
+        if self.uses_token(context):
+            # requesting a token blocks, so it runs in a thread, out of the event loop
+            fresh = self.token_manager.is_fresh()
+            self.authorize(
+                self.token_manager.token
+                if fresh
+                else await asyncio.get_event_loop().run_in_executor(
+                    None, self.token_manager.get_token
+                )
+            )
+        if self.budget is not None:
+            await self.acquire_budget()
+        failed = False
+        try:
+            resp = await self.client_session.request(
+                method=context.get("method", self.method),
+                url="{}{}".format(self.hostname, url) if "http" not in url else url,
+                headers=self.encoding_headers(context.get("headers", self.headers)),
+                params=dict((k, "{}".format(v)) for k, v in params.items() if v is not None),
+                json=context.get("payload", None),
+                timeout=aiohttp.ClientTimeout(sock_connect=timeout, sock_read=timeout),
+            )
+            try:
+                response = await self.build_response(
+                    resp, stream=stream, spool=context.get("spool", False), timer=t0
+                )
+            except BaseException:
+                resp.close()
+                raise
+            if limiter is not None:
+                limiter.record(response.status_code)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+            failed = True
+            self.logger.info("Request exception: {}.".format(err))
+            response = requests.Response()
+            response._content = json.dumps({"error": "{}".format(err)}).encode("utf-8")
+            response.status_code = 408
+            self.observe_request(context, response, t0)
+            return response, context
+        finally:
+            if self.budget is not None:
+                self.budget.release()
+            if breaker is not None:
+                breaker.record(failed, ticket)
+        if self.check_response(response=response, request=context):
+            self.log_response(context=context, response=response, timer=t0)
+        if not response.ok:
+            self.log_exception(exception="{} {}".format(response.status_code, response.reason))
+            if self.retry_params:
+                context.update(self.retry_params)
+        self.observe_request(context, response, t0)
+        return response, context
+
+    async def acquire_budget(self):
+        """
+        It waits for a slot of the worker budget without blocking the event loop. The slot is taken at once or not at
+        all, so a request cancelled while it waits doesn't keep one.
+        """
+        while not self.budget.acquire(False):
+            await asyncio.sleep(BUDGET_POLL)
+
+    def encoding_headers(self, headers):
+        """
+        It returns the headers of a request with an Accept-Encoding that `build_response` can decode, gzip and deflate,
+        unless the headers already have one
+
+        :param headers: the headers of the request
+        """
+        headers = dict(headers or {})
+        if not any(name.lower() == "accept-encoding" for name in headers):
+            headers["Accept-Encoding"] = cz.ACCEPT_ENCODING
+        return headers
+
+    async def build_response(self, resp, stream=False, spool=False, timer=None):
+        """
+        It copies an aiohttp response into a `requests.Response`. Compressed bodies are decoded chunk by chunk as they
+        arrive, and the bytes received are kept in the `wire_bytes` of the response. The body of a successful stream
+        is read by `iter_content` while it arrives, through a `StreamBody`. Spooled bodies are spooled to a temporary
+        file, so their connection goes back to the pool and `iter_content` reads them without holding the whole body
+        in memory.
+
+        :param resp: the aiohttp response
+        :param stream: if the body is read as a stream
+        :param spool: if the body is spooled
+        :param timer: the time the request started
+        """
+        response = requests.Response()
+        response.status_code = resp.status
+        response.reason = resp.reason
+        response.url = "{}".format(resp.url)
+        response.headers = CaseInsensitiveDict(resp.headers)
+        response.encoding = resp.charset
+        decoder = cz.Decoder(cz.content_encoding(response))
+        if stream and response.ok:
+            response.raw = StreamBody(resp, self.get_loop(), decoder, response)
+        elif stream or spool:
+            spool = tempfile.SpooledTemporaryFile(max_size=self.spool_size)
+            async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                spool.write(decoder.decode(chunk))
+            spool.write(decoder.flush())
+            spool.seek(0)
+            response.raw = spool
+            resp.release()
+        else:
+            response._content = decoder.decode(await resp.read()) + decoder.flush()
+            resp.release()
+        response.wire_bytes = decoder.wire_bytes
+        response.elapsed = dt.timedelta(seconds=time.time() - (timer or time.time()))
+        return response
+
+
+@for_all_methods(["__init__"], debuglog())
+class AsyncQueriesPowerSchool(QueriesPowerSchool):
+    """
+    This class runs the queries through an `AsyncRequestPowerSchool`, keeping up to `workers` requests in flight on its
+    event loop
+    """
+
+    def get_responses(self, *args, **kwargs):
+        """
+        It makes the prepared requests on the event loop and returns an iterator over the responses, in the same order
+        as the requests
+        """
+        prepare = kwargs.get("prepare")
+        return self.request.make_requests(prepare, concurrency=self.workers)
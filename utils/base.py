@@ -1,3 +1,4 @@
+import copy
 import json
 import logging
 import time
@@ -155,6 +156,11 @@ class RequestRetryGeneric(GenericMeta):
         retry_params=None,
         stream=False,
         timeout=600.0,
+        budget=None,
+        token_manager=None,
+        circuit_breakers=None,
+        rate_limiters=None,
+        metrics=None,
         logger=LoggerGeneric,
     ):
         self.method = method
@@ -165,6 +171,54 @@ class RequestRetryGeneric(GenericMeta):
         self.retry_params = retry_params
         self.stream = stream
         self.timeout = timeout
+        self.budget = budget
+        self.token_manager = token_manager
+        self.circuit_breakers = circuit_breakers
+        self.rate_limiters = rate_limiters
+        self.metrics = metrics
+
+    def send(self, context):
+        """
+        It sends the request described by the context through the session. When there is a rate limiter for the host,
+        the request waits for its turn first, and when a worker budget (a semaphore shared with other requests) is
+        set, it then waits for a free slot, which it keeps until `transfer` returns.
+
+        :param context: the request context dictionary
+        """
+        limiter = self.get_rate_limiter()
+        if limiter is not None:
+            delay = limiter.reserve(entity=context.get("entity_name"))
+            if delay > 0:
+                time.sleep(delay)
+        if self.budget is not None:
+            self.budget.acquire()
+        try:
+            resp = self.transfer(context)
+        finally:
+            if self.budget is not None:
+                self.budget.release()
+        if limiter is not None:
+            limiter.record(resp.status_code)
+        return resp
+
+    def transfer(self, context):
+        """
+        It sends the request through the session and returns its response. It runs with the slot of the worker budget,
+        so the subclasses that read the body here count it as a transfer in flight.
+
+        :param context: the request context dictionary
+        """
+        return self.session.request(
+            method=context.get("method", self.method),
+            url="{}{}".format(self.hostname, context.get("url", ""))
+            if "http" not in context.get("url")
+            else context.get("url"),
+            headers=context.get("headers", self.headers),
+            params=context.get("params", None),
+            json=context.get("payload", None),
+            stream=context.get("stream", self.stream),
+            timeout=context.get("timeout", self.timeout),
+        )
 
     def make_request(self, *args, **kwargs):
         """
@@ -172,35 +226,80 @@ class RequestRetryGeneric(GenericMeta):
         """
         t0 = time.time()
         context = args[0]
+        breaker = self.get_circuit_breaker()
+        ticket = breaker.allow() if breaker is not None else None
+        if breaker is not None and ticket is None:
+            return self.circuit_open_response(), context
+        failed = False
         try:
-            resp = self.session.request(
-                method=context.get("method", self.method),
-                url="{}{}".format(self.hostname, context.get("url", ""))
-                if "http" not in context.get("url")
-                else context.get("url"),
-                headers=context.get("headers", self.headers),
-                params=context.get("params", None),
-                json=context.get("payload", None),
-                stream=context.get("stream", self.stream),
-                timeout=context.get("timeout", self.timeout),
-            )
+            resp = self.send(context)
             if self.check_response(response=resp, request=context):
                 self.log_response(context=context, response=resp, timer=t0)
             resp.raise_for_status()
         except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as err:
+            failed = True
             self.logger.info("Request exception: {}.".format(err))
             resp = requests.Response()
-            resp._content = bytes({"error": err})
+            resp._content = "{}".format({"error": err}).encode("utf-8")
             resp.status_code = 408
         except requests.exceptions.HTTPError as err:
             self.log_exception(exception=err)
-            resp._content = bytes({"error": err})
-            context.update(self.retry_params)
+            # a streamed body that is not read keeps its connection out of the pool until it is closed
+            resp.close()
+            resp._content = "{}".format({"error": err}).encode("utf-8")
+            context.update(self.retry_params or {})
         except requests.exceptions.RequestException as err:
             self.log_exception(exception=err)
-            resp._content = bytes({"error": err})
+            resp._content = "{}".format({"error": err}).encode("utf-8")
+        finally:
+            if breaker is not None:
+                breaker.record(failed, ticket)
+        self.observe_request(context, resp, t0)
         return resp, context
 
+    def observe_request(self, context, response, timer):
+        """
+        It adds a request sent to the metrics of the run, when there are metrics. Its latency is the elapsed time of
+        the response, which leaves out the wait for the rate limiter, or the time since `timer` when there is none.
+
+        :param context: the request context dictionary
+        :param response: the response of the request
+        :param timer: the time the request started
+        """
+        if self.metrics is None:
+            return
+        elapsed = getattr(response, "elapsed", None)
+        seconds = elapsed.total_seconds() if elapsed else 0
+        self.metrics.observe_request(context, response, seconds or time.time() - timer)
+
+    def get_circuit_breaker(self):
+        """
+        It returns the circuit breaker of the host of the requests, or None when there are no circuit breakers
+        """
+        if self.circuit_breakers is None:
+            return None
+        return self.circuit_breakers.get(self.hostname)
+
+    def get_rate_limiter(self):
+        """
+        It returns the rate limiter of the host of the requests, or None when there are no rate limiters
+        """
+        if self.rate_limiters is None:
+            return None
+        return self.rate_limiters.get(self.hostname)
+
+    def circuit_open_response(self):
+        """
+        It returns the response of a request that is not sent because the circuit of its host is open
+        """
+        resp = requests.Response()
+        resp.status_code = 503
+        resp.reason = "Circuit Open"
+        resp._content = json.dumps(
+            {"error": "The circuit of {} is open, the request was not sent.".format(self.hostname)}
+        ).encode("utf-8")
+        return resp
+
     def log_response(self, *args, **kwargs):
         """
         It logs the response of the request
@@ -227,6 +326,22 @@ class RequestRetryGeneric(GenericMeta):
         exception_msg = kwargs.get("exception")
         self.logger.debug("Request exception: {}.".format(exception_msg))
 
+    def spawn(self):
+        """
+        It returns a copy of the request that shares the session, but has its own headers and retry parameters
+        """
+        request = copy.copy(self)
+        request.headers = dict(self.headers) if self.headers else self.headers
+        request.retry_params = dict(self.retry_params) if self.retry_params else self.retry_params
+        return request
+
+    def close(self):
+        """
+        It releases the resources owned by the request. The session is shared with the other requests, so there is
+        nothing to release here.
+        """
+        pass
+
     @abstractmethod
     def check_response(self, *args, **kwargs):
         """
@@ -248,12 +363,16 @@ class QueriesGeneric(GenericMeta):
         entities=None,
         preadapter=None,
         postadapter=None,
+        workers=1,
         logger=LoggerGeneric,
+        failadapter=None,
     ):
         self.request = request
         self.entities = entities
         self.preadapter = preadapter
         self.postadapter = postadapter
+        self.failadapter = failadapter
+        self.workers = workers
         self.logger = logger
         self.context = self.get_context_data()
 
@@ -263,6 +382,15 @@ class QueriesGeneric(GenericMeta):
         """
         return kwargs
 
+    def spawn(self):
+        """
+        It returns a copy of the query with its own request and a fresh context
+        """
+        query = copy.copy(self)
+        query.request = self.request.spawn()
+        query.context = query.get_context_data()
+        return query
+
     @abstractmethod
     def prepare_query(self, *args, **kwargs):
         """
@@ -299,6 +427,71 @@ class QueriesGeneric(GenericMeta):
         raise NotImplementedError
 
 
+class SinkGeneric(GenericMeta):
+    """
+    It writes the records of an entity to its output file, `<entity>.<extension>`. The records go to
+    `<entity>.<extension>.tmp` while the entity is pulled, and the tmp file is renamed once the pull ends.
+
+    :param headers: a list of headers for the data
+    :param entity: the name of the entity, with its path
+    :param logger: a logger object
+    """
+
+    extension = "txt"
+
+    def __init__(self, headers, entity, logger=LoggerGeneric):
+        self.headers = headers
+        self.entity = entity
+        self.logger = logger
+        self.serializer = self.get_serializer()
+
+    @property
+    def filename(self):
+        """
+        It returns the name of the output file
+        """
+        return "{}.{}".format(self.entity, self.extension)
+
+    @property
+    def tmp_filename(self):
+        """
+        It returns the name of the file the records are written to during the pull
+        """
+        return "{}.tmp".format(self.filename)
+
+    @abstractmethod
+    def get_serializer(self):
+        """
+        It returns the serializer that turns the records into lines, with `write`, `records` and `bytes`
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def header(self):
+        """
+        It returns the first line of the file, empty when the format has none
+        """
+        raise NotImplementedError
+
+    def open_file(self, mode, buffering):
+        """
+        It opens the tmp file in binary mode
+
+        :param mode: "wb" to start it, "ab" to add records to it
+        :param buffering: the size of the write buffer of the file
+        """
+        return open(self.tmp_filename, mode, buffering)
+
+    def write(self, file_obj, records):
+        """
+        It writes the lines of the records to a file opened with `open_file` and returns the number of records written
+
+        :param file_obj: the file returned by `open_file`
+        :param records: an iterable of record dictionaries
+        """
+        return self.serializer.write(file_obj, records)
+
+
 class AdapterGeneric(GenericMeta):
     """
     It's a metaclass that
@@ -308,10 +501,13 @@ class AdapterGeneric(GenericMeta):
     with that argument as its first argument
     """
 
-    def __init__(self, query=QueriesGeneric, client=ClientGeneric, logger=LoggerGeneric):
+    def __init__(
+        self, query=QueriesGeneric, client=ClientGeneric, output_dir="", logger=LoggerGeneric
+    ):
         self.query = query
         self.logger = logger
         self.client = client
+        self.output_dir = output_dir
         self.context = self.get_context_data()
 
     def get_context_data(self, **kwargs):
@@ -320,15 +516,25 @@ class AdapterGeneric(GenericMeta):
         """
         return kwargs
 
+    def spawn(self):
+        """
+        It returns a copy of the adapter with its own query and a fresh context, sharing the client
+        """
+        adapter = copy.copy(self)
+        adapter.query = self.query.spawn()
+        adapter.context = adapter.get_context_data()
+        return adapter
+
 
 class PullGeneric(GenericMeta):
     """
     The PullGeneric class is a generic class that can be used to pull data from a database
     """
 
-    def __init__(self, adapter=AdapterGeneric(), logger=LoggerGeneric):
+    def __init__(self, adapter=AdapterGeneric(), workers=1, logger=LoggerGeneric):
         self.adapter = adapter
         self.query = adapter.query
+        self.workers = workers
         self.logger = logger or adapter.logger
         self.context = self.get_context_data()
 
@@ -337,3 +543,14 @@ class PullGeneric(GenericMeta):
         It returns a dictionary of the context data.
         """
         return kwargs
+
+    def spawn(self):
+        """
+        It returns a copy of the pull with its own adapter and a fresh context, so one entity can be pulled in
+        isolation from the others
+        """
+        pull = copy.copy(self)
+        pull.adapter = self.adapter.spawn()
+        pull.query = pull.adapter.query
+        pull.context = pull.get_context_data()
+        return pull
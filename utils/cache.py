@@ -0,0 +1,150 @@
+import json
+import logging
+import os
+import threading
+import time
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".powerqueries_cache")
+FILE_MODE = 0o600
+DIR_MODE = 0o700
+
+# the caches of the same file share one lock, so districts pulled in the same process don't overwrite each other
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+def get_lock(path):
+    """
+    It returns the lock of a cache file, creating it the first time
+
+    :param path: the path of the cache file
+    """
+    with _locks_lock:
+        return _locks.setdefault(os.path.abspath(path), threading.RLock())
+
+
+def write_json(path, content):
+    """
+    It writes the content as json to a temporary file with owner only permissions and renames it over the file, so the
+    file is never left half written
+
+    :param path: the path of the file
+    :param content: a value that can be written as json
+    """
+    folder = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(folder):
+        os.makedirs(folder, DIR_MODE)
+    temp_path = "{}.{}.{}.tmp".format(path, os.getpid(), threading.current_thread().ident)
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, FILE_MODE)
+    try:
+        with os.fdopen(fd, "w") as temp_file:
+            json.dump(content, temp_file)
+        os.chmod(temp_path, FILE_MODE)
+        os.rename(temp_path, path)
+    except BaseException:
+        # an interruption, like PullInterrupted on SIGTERM, must not leave the temporary file behind either
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+class FileCache(object):
+    """
+    It keeps values with an expiry time in a json file that only its owner can read. The file is rewritten atomically,
+    so a run that is killed, or another run writing at the same time, never leaves it half written. A missing or
+    corrupt file is an empty cache. It counts its hits and misses.
+
+    :param path: the path of the cache file
+    :param logger: a logger object
+    """
+
+    def __init__(self, path, logger=None):
+        self.path = path
+        self.logger = logger or logging.getLogger(__name__)
+        self.lock = get_lock(path)
+        self.hits = 0
+        self.misses = 0
+
+    def load(self):
+        """
+        It returns the entries of the cache file, or an empty dictionary when it can't be read
+        """
+        try:
+            with open(self.path, "r") as cache_file:
+                entries = json.load(cache_file)
+            return entries if isinstance(entries, dict) else {}
+        except (IOError, OSError, ValueError) as exc:
+            if os.path.exists(self.path):
+                self.logger.warning("Ignoring the cache file {}: {}".format(self.path, exc))
+            return {}
+
+    def save(self, entries):
+        """
+        It writes the entries over the cache file, atomically and with owner only permissions
+
+        :param entries: the dictionary of entries
+        """
+        write_json(self.path, entries)
+
+    def get(self, key, default=None):
+        """
+        It returns the value of a key, or `default` when the key is missing or expired
+
+        :param key: the key of the entry
+        :param default: the value to return on a miss
+        """
+        with self.lock:
+            entry = self.load().get(key)
+            if not isinstance(entry, dict) or entry.get("expires_at", 0) <= time.time():
+                self.misses += 1
+                return default
+            self.hits += 1
+        return entry.get("value", default)
+
+    def stats(self):
+        """
+        It returns the hits, the misses and the hit ratio of the cache
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(float(self.hits) / lookups, 2) if lookups else 0.0,
+        }
+
+    def set(self, key, value, ttl):
+        """
+        It stores a value that expires after `ttl` seconds, dropping the expired entries of the file
+
+        :param key: the key of the entry
+        :param value: a value that can be written as json
+        :param ttl: the seconds the value is valid
+        """
+        now = time.time()
+        with self.lock:
+            entries = dict(
+                (k, v)
+                for k, v in self.load().items()
+                if isinstance(v, dict) and v.get("expires_at", 0) > now
+            )
+            entries[key] = {"value": value, "expires_at": now + ttl}
+            try:
+                self.save(entries)
+            except (IOError, OSError) as exc:
+                self.logger.warning("Could not write the cache file {}: {}".format(self.path, exc))
+
+    def delete(self, key):
+        """
+        It removes a key from the cache
+
+        :param key: the key of the entry
+        """
+        with self.lock:
+            entries = self.load()
+            if entries.pop(key, None) is not None:
+                try:
+                    self.save(entries)
+                except (IOError, OSError) as exc:
+                    self.logger.warning(
+                        "Could not write the cache file {}: {}".format(self.path, exc)
+                    )
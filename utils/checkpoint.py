@@ -0,0 +1,147 @@
+import json
+import logging
+import os
+import signal
+import threading
+
+from cache import write_json
+
+# set when the process is asked to stop, the entities being pulled stop at their next page
+STOP = threading.Event()
+
+
+class PullStopped(Exception):
+    """
+    It is raised by the entities being pulled when the process is asked to stop
+    """
+
+
+class PullInterrupted(KeyboardInterrupt):
+    """
+    It is raised in the main thread on SIGTERM. Like KeyboardInterrupt it is not an Exception, so the handlers that keep
+    one failed entity or district from stopping the others let it through.
+    """
+
+
+def checkpoint_filename(filename):
+    """
+    It returns the path of the checkpoint of an entity
+
+    :param filename: the path of the entity files, without extension
+    """
+    return "{}.checkpoint.json".format(filename)
+
+
+def stop_on_sigterm(logger):
+    """
+    It makes SIGTERM stop the pull like an interruption, so the pages being written are flushed and the checkpoints
+    keep the pages written, instead of killing the process in the middle of a write
+
+    :param logger: a logger object
+    """
+
+    def handler(signum, frame):
+        logger.warning(
+            "SIGTERM received, stopping the pull. Run it again with --resume to continue."
+        )
+        STOP.set()
+        raise PullInterrupted(128 + signum)
+
+    signal.signal(signal.SIGTERM, handler)
+
+
+class Checkpoint(object):
+    """
+    It records the pages of an entity written to its tmp file, by the records they cover and the size of the file
+    after each one, along with a snapshot of what the pages depend on, like the year id and the count. A run with
+    --resume continues the entity after the last page written when the snapshot still matches. The checkpoint is
+    rewritten atomically after every page.
+
+    :param path: the path of the checkpoint file
+    :param snapshot: a dictionary with the year id, the count, the smallest page size and the mode of the entity
+    :param pages: a dictionary with the first record of every page written, and the record after it and the size of
+        the tmp file after it
+    :param logger: a logger object
+    """
+
+    def __init__(self, path, snapshot, pages=None, logger=None):
+        self.path = path
+        self.snapshot = snapshot
+        self.pages = dict(pages or {})
+        self.logger = logger or logging.getLogger(__name__)
+
+    @classmethod
+    def load(cls, path, logger=None):
+        """
+        It returns the checkpoint saved in a file, or None when there is none or it can't be read
+
+        :param path: the path of the checkpoint file
+        :param logger: a logger object
+        """
+        try:
+            with open(path, "r") as checkpoint_file:
+                content = json.load(checkpoint_file)
+            pages = dict(
+                (int(first), (int(end), int(offset)))
+                for first, (end, offset) in content["pages"].items()
+            )
+            return cls(path=path, snapshot=content["snapshot"], pages=pages, logger=logger)
+        except (IOError, OSError, ValueError, KeyError, TypeError, AttributeError):
+            return None
+
+    def save(self):
+        """
+        It writes the checkpoint file
+        """
+        write_json(
+            self.path,
+            {
+                "snapshot": self.snapshot,
+                "pages": dict(
+                    ("{}".format(first), list(page)) for first, page in self.pages.items()
+                ),
+            },
+        )
+
+    def page_done(self, first, end, offset):
+        """
+        It records a page written and the size of the tmp file after it
+
+        :param first: the first record of the page
+        :param end: the record after the last record of the page
+        :param offset: the size of the tmp file after the page
+        """
+        self.pages[first] = (end, offset)
+        try:
+            self.save()
+        except (IOError, OSError) as exc:
+            self.logger.warning("Could not write the checkpoint {}: {}".format(self.path, exc))
+
+    def resume_point(self, file_size):
+        """
+        It returns the records of the pages written one after the other from the first record and the size of the tmp
+        file after them, leaving out the pages beyond the size of the file, or (0, 0) when there is nothing to keep
+
+        :param file_size: the size of the tmp file
+        """
+        records, offset = 0, 0
+        while records in self.pages and self.pages[records][1] <= file_size:
+            if self.pages[records][0] <= records:
+                break
+            records, offset = self.pages[records]
+        return records, offset
+
+    def keep_pages(self, records):
+        """
+        It forgets the pages after the first `records` records
+
+        :param records: the records to keep
+        """
+        self.pages = dict((first, page) for first, page in self.pages.items() if page[0] <= records)
+
+    def delete(self):
+        """
+        It removes the checkpoint file
+        """
+        if os.path.exists(self.path):
+            os.remove(self.path)
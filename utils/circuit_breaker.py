@@ -0,0 +1,147 @@
+import logging
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+FAILURES = 5
+RESET_SECONDS = 30.0
+# the ticket of the requests sent while the circuit is closed
+SENT = "sent"
+
+
+class CircuitBreaker(object):
+    """
+    It stops the requests to a host that stopped answering. After `failures` connection errors or timeouts in a row
+    the circuit opens, and the requests fail at once instead of waiting for their timeouts and retries. After
+    `reset_seconds` one request is let through as a probe: if the host answers it the circuit closes again, and
+    otherwise it stays open for another `reset_seconds`. Only the outcome of the probe moves the circuit once it is
+    open, the requests sent before it opened are not counted. The requests of every thread share it.
+
+    :param host: the host of the requests
+    :param failures: the connection errors or timeouts in a row that open the circuit
+    :param reset_seconds: the seconds the circuit stays open before a probe is let through
+    :param logger: a logger object
+    """
+
+    def __init__(self, host="", failures=FAILURES, reset_seconds=RESET_SECONDS, logger=None):
+        self.host = host
+        self.failures = max(int(failures), 1)
+        self.reset_seconds = float(reset_seconds)
+        self.logger = logger or logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.state = CLOSED
+        self.consecutive = 0
+        self.opened_at = None
+        self.probe = None
+        self.opened = 0
+        self.rejected = 0
+
+    def allow(self):
+        """
+        It returns the ticket of a request that can be sent, to be given back to `record` with its outcome, or None
+        when it can't: every request is sent while the circuit is closed, and only the probe once it has been open for
+        `reset_seconds`
+        """
+        with self.lock:
+            if self.state == CLOSED:
+                return SENT
+            if self.state == OPEN and time.time() - self.opened_at >= self.reset_seconds:
+                self.state = HALF_OPEN
+                self.probe = None
+            if self.state == HALF_OPEN and self.probe is None:
+                self.probe = object()
+                self.logger.info("Probing {} after {} sec.".format(self.host, self.reset_seconds))
+                return self.probe
+            self.rejected += 1
+            return None
+
+    def record(self, failed, ticket=SENT):
+        """
+        It adds the outcome of a request: a connection error or a timeout counts towards opening the circuit, any
+        answer of the host closes it. Once the circuit is open only the outcome of the probe counts.
+
+        :param failed: if the request failed with a connection error or a timeout
+        :param ticket: the ticket `allow` returned for the request
+        """
+        with self.lock:
+            if self.state != CLOSED:
+                if ticket is not self.probe:
+                    return
+                self.probe = None
+                if not failed:
+                    self.logger.info("{} answers again, closing its circuit.".format(self.host))
+                    self.state = CLOSED
+                    self.consecutive = 0
+                    return
+                self.consecutive += 1
+                self.open()
+                return
+            if not failed:
+                self.consecutive = 0
+                return
+            self.consecutive += 1
+            if self.consecutive >= self.failures:
+                self.open()
+
+    def open(self):
+        """
+        It opens the circuit for `reset_seconds`. It must be called holding the lock.
+        """
+        self.state = OPEN
+        self.opened_at = time.time()
+        self.opened += 1
+        self.logger.warning(
+            "{} failed {} requests in a row, failing its requests for {} sec.".format(
+                self.host, self.consecutive, self.reset_seconds
+            )
+        )
+
+    def is_open(self):
+        """
+        It returns if the circuit is open or waiting for its probe
+        """
+        with self.lock:
+            return self.state != CLOSED
+
+    def stats(self):
+        """
+        It returns the state of the circuit, the times it opened, the requests it failed at once and the connection
+        errors or timeouts in a row
+        """
+        with self.lock:
+            return {
+                "state": self.state,
+                "opened": self.opened,
+                "rejected_requests": self.rejected,
+                "consecutive_failures": self.consecutive,
+            }
+
+
+class CircuitBreakers(object):
+    """
+    It keeps the circuit breaker of every host requested in the run
+
+    :param logger: a logger object
+    """
+
+    def __init__(self, logger=None):
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.breakers = {}
+
+    def get(self, host, failures=FAILURES, reset_seconds=RESET_SECONDS):
+        """
+        It returns the circuit breaker of a host, creating it with `failures` and `reset_seconds` the first time
+
+        :param host: the host of the requests
+        :param failures: the connection errors or timeouts in a row that open the circuit
+        :param reset_seconds: the seconds the circuit stays open before a probe is let through
+        """
+        with self.lock:
+            if host not in self.breakers:
+                self.breakers[host] = CircuitBreaker(
+                    host, failures=failures, reset_seconds=reset_seconds, logger=self.logger
+                )
+            return self.breakers[host]
@@ -0,0 +1,102 @@
+import zlib
+
+ACCEPT_ENCODING = "gzip, deflate"
+IDENTITY = "identity"
+ENCODINGS = ("gzip", "x-gzip", "deflate")
+
+
+def accept_encoding(compression=True):
+    """
+    It returns the Accept-Encoding header of the requests, the encodings the responses are decoded from, or identity
+    to ask for uncompressed responses
+
+    :param compression: if the responses can be compressed
+    """
+    return ACCEPT_ENCODING if compression else IDENTITY
+
+
+def content_encoding(response):
+    """
+    It returns the encoding of the body of a response, "identity" when it is not compressed
+
+    :param response: a `requests.Response`
+    """
+    return ((response.headers or {}).get("Content-Encoding") or IDENTITY).strip().lower()
+
+
+class Decoder(object):
+    """
+    It decodes a gzip or deflate body chunk by chunk as it arrives, counting the bytes received and the bytes decoded.
+    Bodies with another encoding are passed through.
+
+    :param encoding: the Content-Encoding of the body
+    """
+
+    def __init__(self, encoding=IDENTITY):
+        self.encoding = encoding
+        # 32 + MAX_WBITS reads both the gzip and the zlib headers
+        self.decompressor = (
+            zlib.decompressobj(32 + zlib.MAX_WBITS) if encoding in ENCODINGS else None
+        )
+        self.wire_bytes = 0
+        self.decoded_bytes = 0
+
+    def decode(self, chunk):
+        """
+        It returns the decoded bytes of a chunk of the body
+
+        :param chunk: bytes of the body as received
+        """
+        self.wire_bytes += len(chunk)
+        data = self.decompressor.decompress(chunk) if self.decompressor is not None else chunk
+        self.decoded_bytes += len(data)
+        return data
+
+    def flush(self):
+        """
+        It returns the decoded bytes left once the body ended
+        """
+        data = self.decompressor.flush() if self.decompressor is not None else b""
+        self.decoded_bytes += len(data)
+        return data
+
+
+def wire_bytes(response):
+    """
+    It returns the bytes of the body of a response as they came over the network, before they were decoded, or None
+    when they were not counted. The responses of the asyncio engine carry the count, and the ones of requests are
+    counted by their urllib3 response.
+
+    :param response: a `requests.Response` whose body was read
+    """
+    counted = getattr(response, "wire_bytes", None)
+    if counted is not None:
+        return counted
+    tell = getattr(response.raw, "tell", None)
+    if tell is None or not hasattr(response.raw, "_fp_bytes_read"):
+        return None
+    return tell()
+
+
+def add_transfer(totals, response, decoded_bytes):
+    """
+    It adds the bytes received and decoded of a response to the transfer totals of an entity, and returns them. The
+    ratio is the decoded bytes for every byte received.
+
+    :param totals: the transfer totals of the entity, empty the first time
+    :param response: the `requests.Response` whose body was read
+    :param decoded_bytes: the bytes of the decoded body
+    """
+    received = wire_bytes(response)
+    received = decoded_bytes if received is None else received
+    totals["wire_bytes"] = totals.get("wire_bytes", 0) + received
+    totals["decoded_bytes"] = totals.get("decoded_bytes", 0) + decoded_bytes
+    totals["ratio"] = (
+        round(float(totals["decoded_bytes"]) / totals["wire_bytes"], 2)
+        if totals["wire_bytes"]
+        else 0.0
+    )
+    encodings = totals.setdefault("encodings", {})
+    encoding = content_encoding(response)
+    encodings[encoding] = encodings.get(encoding, 0) + 1
+    return totals
@@ -1,3 +1,4 @@
+import json
 import os
 import sys
 from optparse import OptionParser
@@ -56,26 +57,106 @@ def get_config_file(options, logger):
             )
 
     else:
-        site_folder = get_site_folder(options.folder)
-        if site_folder:
-            rootdir = "/home/{}".format(
-                site_folder if "/" not in site_folder else site_folder.split("/")[0]
-            )
-            config_file = "{}/{}.json".format(
-                rootdir,
-                "." + site_folder
-                if "/" not in site_folder
-                else "/.".join(site_folder.split("/")[::-1]),
-            )
-        else:
-            loggering.error_log(
-                msg="Configuration file does not exist on the site folder: {0}".format(config_file),
-                logger=logger,
-            )
+        config_file = get_site_config_file(options.folder, logger)
 
     return config_file
 
 
+def get_site_config_file(folder, logger):
+    """
+    It returns the config file of a district from its site folder
+
+    :param folder: the folder of the district within /home/
+    :param logger: a logger object
+    """
+    site_folder = get_site_folder(folder)
+    if site_folder:
+        rootdir = "/home/{}".format(
+            site_folder if "/" not in site_folder else site_folder.split("/")[0]
+        )
+        config_file = "{}/{}.json".format(
+            rootdir,
+            "." + site_folder
+            if "/" not in site_folder
+            else "/.".join(site_folder.split("/")[::-1]),
+        )
+    else:
+        loggering.error_log(
+            msg="Configuration file does not exist on the site folder: {0}".format(folder),
+            logger=logger,
+        )
+
+    return config_file
+
+
+def get_districts(options, logger):
+    """
+    It returns the districts to pull in one run, from the --folders list or from a hosts manifest. The manifest is a JSON
+    file with a list of folders, or of objects with a "folder" and optionally its "config" file and "output_dir", either
+    as the whole file or under a "districts" key.
+
+    :param options: A dictionary of options that were passed to the script
+    :param logger: a logger object
+    """
+    entries = []
+    base_dir = os.getcwd()
+    if "NULL" not in options.manifest:
+        base_dir = os.path.dirname(os.path.abspath(options.manifest))
+        with open(options.manifest, "r") as f:
+            manifest = json.load(f)
+        entries = manifest.get("districts", []) if isinstance(manifest, dict) else manifest
+    if "NULL" not in options.folders:
+        entries.extend(folder for folder in options.folders.split(",") if folder)
+    districts = []
+    for entry in entries:
+        district = {"folder": entry} if not isinstance(entry, dict) else dict(entry)
+        folder = "{}".format(district["folder"])
+        district["folder"] = folder
+        if district.get("config"):
+            district["config"] = os.path.join(base_dir, district["config"])
+        elif get_site_folder(folder):
+            district["config"] = get_site_config_file(folder, logger)
+        else:
+            # a missing district fails on its own instead of stopping the whole run
+            district["error"] = "Site folder /home/{} does not exist".format(folder)
+        district["output_dir"] = os.path.join(
+            base_dir, district.get("output_dir") or "/home/{}".format(folder)
+        )
+        districts.append(district)
+    return districts
+
+
+def get_manifest_setting(options, key, default=None):
+    """
+    It returns a top level setting of the hosts manifest, if there is one
+
+    :param options: A dictionary of options that were passed to the script
+    :param key: the name of the setting
+    :param default: the value to return if the setting is not defined
+    """
+    if "NULL" in options.manifest:
+        return default
+    with open(options.manifest, "r") as f:
+        manifest = json.load(f)
+    return manifest.get(key, default) if isinstance(manifest, dict) else default
+
+
+def get_setting(options, client, option, key, default=None):
+    """
+    It returns a setting from the command line options, falling back to the client's configuration file
+
+    :param options: the options that were passed to the script
+    :param client: the client object with the configuration file content
+    :param option: the name of the option in the command line
+    :param key: the name of the key in the configuration file
+    :param default: the value to return if the setting is defined in neither place
+    """
+    value = getattr(options, option, None)
+    if value is None or value == "NULL":
+        value = client.get(key, default)
+    return value
+
+
 def get_opts_and_args(args):
     """
     It takes a list of strings, and returns a tuple of two lists of strings
@@ -134,5 +215,86 @@ def get_opts_and_args(args):
         help="Run the script in a development environment. The option is the config file's name.",
     )
 
+    parser.add_option(
+        "-w",
+        "--workers",
+        dest="workers",
+        default=None,
+        type="int",
+        help='Number of pages of an entity requested at the same time. Overrides "page_workers" in the config file, defaults to 1.',
+    )
+
+    parser.add_option(
+        "-p",
+        "--parallel",
+        dest="entities",
+        default=None,
+        type="int",
+        help='Number of entities pulled at the same time. Overrides "entity_workers" in the config file, defaults to 1.',
+    )
+
+    parser.add_option(
+        "--engine",
+        dest="engine",
+        default="NULL",
+        type="choice",
+        choices=["NULL", "threads", "async"],
+        help='Request engine, "threads" or "async". Overrides "request_engine" in the config file, defaults to "threads".',
+    )
+
+    parser.add_option(
+        "--folders",
+        dest="folders",
+        default="NULL",
+        help="Pull several districts in one process. The folder names separated by commas WITHOUT SPACES. EXAMPLE: --folders=5121,5990",
+    )
+
+    parser.add_option(
+        "--manifest",
+        dest="manifest",
+        default="NULL",
+        help="Pull the districts listed in a hosts manifest JSON file in one process.",
+    )
+
+    parser.add_option(
+        "--districts",
+        dest="districts",
+        default=None,
+        type="int",
+        help='Number of districts pulled at the same time with --folders or --manifest. Overrides "max_in_flight" in the manifest, defaults to 2.',
+    )
+
+    parser.add_option(
+        "--budget",
+        dest="budget",
+        default=None,
+        type="int",
+        help='Number of requests in flight shared by all the districts with --folders or --manifest. Overrides "budget" in the manifest, defaults to 8.',
+    )
+
+    parser.add_option(
+        "--no-cache",
+        action="store_true",
+        dest="no_cache",
+        default=False,
+        help="Request the token, the year id and the counts from the server, without reading or writing the local cache.",
+    )
+
+    parser.add_option(
+        "--resume",
+        action="store_true",
+        dest="resume",
+        default=False,
+        help="Continue the entities of a stopped pull after the pages in their checkpoints, when their count and year id didn't change.",
+    )
+
+    parser.add_option(
+        "--profile",
+        action="store_true",
+        dest="profile",
+        default=False,
+        help="Profile every phase of the pull, write its stats to the profile folder of the output and log the functions that took the most time.",
+    )
+
     options, _ = parser.parse_args()
     return options
@@ -3,6 +3,11 @@ import functools
 import logging
 import time
 
+try:
+    from inspect import getfullargspec as getargspec
+except ImportError:
+    from inspect import getargspec
+
 
 def for_all_methods(excluded, decorator):
     def decorate(cls):
@@ -22,50 +27,106 @@ def timer(func, logger):
         start_time = time.time()
         value = func(*args, **kwargs)
         end_time = time.time()
-        run_time = round(start_time, end_time)
+        run_time = round(end_time - start_time, 2)
         logger.debug("Finished in {}".format(run_time), extra={"name_override": func.__name__})
         return value
 
     return wrapper_timer
 
 
+def scan_logger(args, kwargs):
+    """
+    It returns the logger among the arguments of a call, or the `logger` of one of them, the last one found
+
+    :param args: the positional arguments of the call
+    :param kwargs: the keyword arguments of the call
+    """
+    log = None
+    for kw in kwargs.values():
+        if isinstance(kw, logging.Logger):
+            log = kw
+        elif hasattr(kw, "logger"):
+            log = kw.logger
+    if log is None:
+        for arg in args:
+            if isinstance(arg, logging.Logger):
+                log = arg
+            elif hasattr(arg, "logger"):
+                log = arg.logger
+    return log
+
+
+def logger_getter(func):
+    """
+    It returns a function that finds the logger of a call to `func`, chosen once from the names of its arguments:
+    the `logger` argument, the `logger` of `self`, or a scan of every argument when it has none of them
+
+    :param func: the decorated function or method
+    """
+    try:
+        names = getargspec(func)[0]
+    except TypeError:
+        names = []
+    if "logger" in names:
+        index = names.index("logger")
+
+        def from_argument(args, kwargs):
+            if "logger" in kwargs:
+                return kwargs["logger"]
+            if len(args) > index:
+                return args[index]
+            return None
+
+        return from_argument
+    if names and names[0] == "self":
+        return lambda args, kwargs: getattr(args[0], "logger", None) if args else None
+    return scan_logger
+
+
+def debug_enabled(log):
+    """
+    It returns if a logger would write debug records
+
+    :param log: a logger, or whatever the decorated function got as its logger
+    """
+    try:
+        return log.isEnabledFor(logging.DEBUG)
+    except AttributeError:
+        return False
+
+
 def debuglog(logger=None):
     # type: (object) -> object
-    """Print the executing status of the decorated function
+    """Print the executing status of the decorated function. The way to find the logger is chosen when the function is
+    decorated, and a call whose logger doesn't write debug records goes straight to the function.
     @rtype: object
     """
 
     def log_inner(func):
+        if logger is None:
+            get_logger = logger_getter(func)
+        else:
+
+            def get_logger(args, kwargs):
+                return logger
+
+        name = {"name_override": func.__name__}
+
         @functools.wraps(func)
         def wrapper_log(*args, **kwargs):
-            log = None
-            try:
-                if logger is None:
-                    for kw in kwargs.values():
-                        if isinstance(kw, logging.Logger):
-                            log = kw
-                        elif isinstance(kw, object) and hasattr(kw, "logger"):
-                            log = kw.logger
-                    if log is None:
-                        for arg in args:
-                            if isinstance(arg, logging.Logger):
-                                log = arg
-                            elif isinstance(arg, object) and hasattr(arg, "logger"):
-                                log = arg.logger
-                else:
-                    log = logger
-            except Exception as exc:
-                print(exc)
+            log = get_logger(args, kwargs)
+            if not debug_enabled(log):
+                return func(*args, **kwargs)
             start_time = time.time()
-            log.debug("Executing... ", extra={"name_override": func.__name__})
+            log.debug("Executing... ", extra=name)
             value = func(*args, **kwargs)
             if value:
-                log.debug("Finishing...", extra={"name_override": func.__name__})
+                log.debug("Finishing...", extra=name)
             else:
-                log.debug("Finished.", extra={"name_override": func.__name__})
+                log.debug("Finished.", extra=name)
             tt = round(time.time() - start_time, 2)
             total_time = "Elapsed time: {}".format(dt.timedelta(seconds=tt)).split(".")[0]
-            log.debug(total_time, extra={"name_override": func.__name__})
+            log.debug(total_time, extra=name)
             return value
 
         return wrapper_log
@@ -1,18 +1,27 @@
+import collections
+import gzip
 import json
-import mmap
+import logging
 import os
-import re
 import shutil
-import sys
 import time
 
-from decorators import debuglog
+from base import SinkGeneric
+from decorators import debuglog, for_all_methods
+from json_stream import iter_file_chunks, iter_records
 
 from utils import loggering
 
 CHUNK_SIZE = 2**13
+STREAM_CHUNK_SIZE = 2**16
 BUFFERING = 2**21
 BATCH = 5000
+# the values of a row are joined with ROW_SEPARATOR and cleaned together, so no value can contain it. It is decoded
+# from bytes to be text on Python 2 too, where plain literals are bytes and joining them with text is slower.
+ROW_SEPARATOR = b"\x00".decode("ascii")
+TAB = b"\t".decode("ascii")
+GZIP_LEVEL = 6
+DEFAULT_FORMAT = "tsv"
 
 
 @debuglog()
@@ -40,6 +49,74 @@ def stream_to_json(response, entity, logger):
     return index
 
 
+@debuglog()
+def stream_to_txt(response, headers, entity, logger, keep_json=False, counter=None, sink=None):
+    """
+    It converts a streamed response straight into the tmp file of the sink, parsing the records out of the chunks as
+    they arrive, so the response is not written to a json file and read back
+
+    :param response: the streamed response from the API call
+    :param headers: a list of strings that are the headers for the output file
+    :param entity: the name of the entity you're downloading
+    :param logger: a logger object
+    :param keep_json: also keep the raw response in <entity>.json, for debugging
+    :param counter: a dictionary whose "bytes" are increased by the bytes of the decoded response, if any
+    :param sink: the sink of the output format, a tab separated txt file by default
+    :return: The number of records written. A stream cut before its end raises, so a truncated tmp file is never
+    taken for a whole one.
+    """
+    sink = sink or TsvSink(headers=headers, entity=entity, logger=logger)
+    serializer = sink.serializer
+    json_file = open("{}.json".format(entity), "wb") if keep_json else None
+    try:
+        with sink.open_file("wb", BUFFERING) as temp_file:
+            temp_file.write(sink.header())
+            chunks = response.iter_content(chunk_size=STREAM_CHUNK_SIZE)
+            if counter is not None:
+                chunks = count_chunks(chunks, counter)
+            if json_file:
+                chunks = copy_chunks(chunks, json_file)
+            sink.write(temp_file, iter_records(chunks))
+        logger.debug("Number of Records: {}".format(serializer.records))
+    except Exception as exc:
+        loggering.except_log(
+            "{0} file created with {1} records. Error: {2}".format(
+                entity.upper(), serializer.records, exc
+            ),
+            logger=logger,
+        )
+        raise
+    finally:
+        if json_file:
+            json_file.close()
+        response.close()
+    return serializer.records
+
+
+def copy_chunks(chunks, copy_file):
+    """
+    It yields the chunks unchanged, writing a copy of each one to a file
+
+    :param chunks: an iterable of chunks of bytes
+    :param copy_file: a file opened in binary mode
+    """
+    for chunk in chunks:
+        copy_file.write(chunk)
+        yield chunk
+
+
+def count_chunks(chunks, counter):
+    """
+    It yields the chunks unchanged, adding their size to the "bytes" of a counter
+
+    :param chunks: an iterable of chunks of bytes
+    :param counter: a dictionary with the "bytes" counted so far
+    """
+    for chunk in chunks:
+        counter["bytes"] = counter.get("bytes", 0) + len(chunk)
+        yield chunk
+
+
 def dict_to_record(record_dict, headers, logger=None):
     """
     It's replacing new lines and tabs with spaces
@@ -49,30 +126,368 @@ def dict_to_record(record_dict, headers, logger=None):
     :param logger: a logger object
     :return: A string of the record_list joined by tabs.
     """
-    record_list = []
-    for header in headers:
-        if header in record_dict:
+    return RowSerializer(headers=headers, logger=logger).serialize(record_dict)
+
+
+def clean(text):
+    """
+    It replaces the new lines and tabs with spaces and removes the quotes
+
+    :param text: the text to clean
+    """
+    return (
+        text.replace("\r\n", "   ")
+        .replace("\n", "   ")
+        .replace("\t", " ")
+        .replace('"', "")
+        .replace("'", "")
+    )
+
+
+class RowSerializer(object):
+    """
+    It turns records into tab separated lines for a fixed list of headers. The values of a row are joined with a
+    separator no value contains, cleaned with one chain of replaces and encoded once, instead of cleaning and encoding
+    every field on its own. Its lines are byte-identical to the field by field cleaning.
+
+    :param headers: a list of the lowercase headers of the output file
+    :param logger: a logger object
+    """
+
+    def __init__(self, headers, logger=None):
+        self.headers = list(headers)
+        self.logger = logger or logging.getLogger(__name__)
+        self.size = len(self.headers)
+        self.records = 0
+        self.bytes = 0
+
+    def serialize(self, record_dict):
+        """
+        It returns the tab separated line of a record, encoded in utf-8
+
+        :param record_dict: a dictionary of the record
+        """
+        values = [record_dict.get(header, "") for header in self.headers]
+        try:
+            row = ROW_SEPARATOR.join(values)
+        except (TypeError, UnicodeDecodeError):
+            return self.serialize_fields(values)
+        if row.count(ROW_SEPARATOR) != self.size - 1:
+            return self.serialize_fields(values)
+        return clean(row).replace(ROW_SEPARATOR, TAB).encode("utf-8") + b"\n"
+
+    def serialize_fields(self, values):
+        """
+        It cleans and encodes every value on its own, for the rows that have values which are not text or contain the
+        row separator
+
+        :param values: the list of values of the record, in the order of the headers
+        """
+        fields = []
+        for value in values:
             try:
-                field = (
-                    record_dict.get(header)
-                    .replace("\r\n", "   ")
-                    .replace("\n", "   ")
-                    .replace("\t", " ")
-                    .replace('"', "")
-                    .replace("'", "")
+                if isinstance(value, bytes):
+                    value = value.decode("ascii")
+                fields.append(clean(value).encode("utf-8"))
+            except Exception as err:
+                loggering.except_log(
+                    "Error: {0}.  Value: {1!r}".format(err, value), logger=self.logger
+                )
+                fields.append(b"")
+        return b"\t".join(fields) + b"\n"
+
+    def write(self, file_obj, records, batch_size=BATCH):
+        """
+        It writes the lines of the records to a file, `batch_size` lines at a time with `writelines`, and returns the
+        number of records written. The records and bytes written are added to `records` and `bytes`, also when the
+        records raise an error, which is raised after the lines before it are written.
+
+        :param file_obj: a file opened in binary mode
+        :param records: an iterable of record dictionaries
+        :param batch_size: the number of lines written at a time
+        """
+        serialize = self.serialize
+        count = 0
+        lines = []
+        try:
+            for record_dict in records:
+                lines.append(serialize(record_dict))
+                if len(lines) >= batch_size:
+                    count += self.write_lines(file_obj, lines)
+                    lines = []
+                    self.logger.debug("Records: {}".format(self.records))
+        finally:
+            count += self.write_lines(file_obj, lines)
+        return count
+
+    def write_lines(self, file_obj, lines):
+        """
+        It writes a batch of lines and adds them to the counters
+
+        :param file_obj: a file opened in binary mode
+        :param lines: a list of encoded lines
+        """
+        file_obj.writelines(lines)
+        self.records += len(lines)
+        self.bytes += sum(len(line) for line in lines)
+        return len(lines)
+
+
+def header_line(headers):
+    """
+    It returns the tab separated header line of the output file, encoded in utf-8
+
+    :param headers: a list of headers for the data
+    """
+    return b"\t".join([header.encode("utf-8") for header in headers]) + b"\n"
+
+
+class NdjsonSerializer(RowSerializer):
+    """
+    It turns records into lines of json objects with the headers as keys, in the order of the headers. The values are
+    written as they arrived, without cleaning them.
+
+    :param headers: a list of the lowercase headers of the output file
+    :param logger: a logger object
+    """
+
+    def serialize(self, record_dict):
+        """
+        It returns the json line of a record, encoded in utf-8
+
+        :param record_dict: a dictionary of the record
+        """
+        record = collections.OrderedDict(
+            (header, record_dict.get(header, "")) for header in self.headers
+        )
+        return json.dumps(record, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+class GzipMembers(object):
+    """
+    It compresses the lines written to a file into gzip members, ending the member on every `flush`. The file is a
+    whole gzip file after every flush, so the size of the file after a page is a point where it can be cut when a
+    pull is resumed. gzip and the gzip module read the members one after the other as a single file.
+
+    :param raw_file: a file opened in binary mode
+    :param level: the compression level, from 1 to 9
+    """
+
+    def __init__(self, raw_file, level=GZIP_LEVEL):
+        self.raw_file = raw_file
+        self.level = level
+        self.member = None
+
+    def write(self, data):
+        """
+        It compresses bytes into the current member, starting one if there is none
+
+        :param data: the bytes to write
+        """
+        if self.member is None:
+            # no file name and no time in the header, so the same records give the same bytes
+            self.member = gzip.GzipFile(
+                filename="", mode="wb", compresslevel=self.level, fileobj=self.raw_file, mtime=0
+            )
+        self.member.write(data)
+
+    def writelines(self, lines):
+        """
+        It compresses a batch of lines into the current member
+
+        :param lines: a list of lines of bytes
+        """
+        self.write(b"".join(lines))
+
+    def flush(self):
+        """
+        It ends the current member and flushes the file
+        """
+        if self.member is not None:
+            self.member.close()
+            self.member = None
+        self.raw_file.flush()
+
+    def close(self):
+        """
+        It ends the current member and closes the file
+        """
+        self.flush()
+        self.raw_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class TsvSink(SinkGeneric):
+    """
+    It writes an entity to a tab separated txt file with a header line
+    """
+
+    extension = "txt"
+
+    def get_serializer(self):
+        return RowSerializer(
+            headers=[header.lower() for header in self.headers], logger=self.logger
+        )
+
+    def header(self):
+        return header_line(self.headers)
+
+
+class GzipTsvSink(TsvSink):
+    """
+    It writes an entity to a gzip compressed tab separated txt file with a header line
+    """
+
+    extension = "txt.gz"
+
+    def open_file(self, mode, buffering):
+        return GzipMembers(open(self.tmp_filename, mode, buffering))
+
+
+class NdjsonSink(SinkGeneric):
+    """
+    It writes an entity to a file with one json object per record and no header line
+    """
+
+    extension = "ndjson"
+
+    def get_serializer(self):
+        return NdjsonSerializer(
+            headers=[header.lower() for header in self.headers], logger=self.logger
+        )
+
+    def header(self):
+        return b""
+
+
+class GzipNdjsonSink(NdjsonSink):
+    """
+    It writes an entity to a gzip compressed file with one json object per record
+    """
+
+    extension = "ndjson.gz"
+
+    def open_file(self, mode, buffering):
+        return GzipMembers(open(self.tmp_filename, mode, buffering))
+
+
+# the output formats of the "output_format" and "output_formats" keys of the config file
+SINKS = {
+    "tsv": TsvSink,
+    "tsv.gz": GzipTsvSink,
+    "ndjson": NdjsonSink,
+    "ndjson.gz": GzipNdjsonSink,
+}
+
+
+@for_all_methods(["__init__", "open", "close"], debuglog())
+class PageWriter(object):
+    """
+    It keeps the tmp file of an entity open while its pages arrive, so the file is opened once per entity instead of
+    once per page and the header line is written only once. It counts the records and bytes written so far, and keeps
+    the size of the file in `offset` after every flush.
+
+    :param headers: a list of headers for the data
+    :param entity: the name of the entity you're scraping, with its path
+    :param logger: a logger object
+    :param buffering: the size of the write buffer of the file
+    :param sink: the sink of the output format, a tab separated txt file by default
+    """
+
+    def __init__(self, headers, entity, logger, buffering=BUFFERING, sink=None):
+        self.headers = headers
+        self.sink = sink or TsvSink(headers=headers, entity=entity, logger=logger)
+        self.serializer = self.sink.serializer
+        self.entity = entity
+        self.filename = self.sink.tmp_filename
+        self.logger = logger
+        self.buffering = buffering
+        self.file = None
+        self.records = 0
+        self.bytes = 0
+        self.offset = 0
+
+    def open(self):
+        """
+        It opens the file the first time, writing the header line unless the file already has content
+        """
+        if self.file is None:
+            self.offset = os.path.getsize(self.filename) if os.path.exists(self.filename) else 0
+            self.file = self.sink.open_file("ab", self.buffering)
+            if not self.offset and self.sink.header():
+                self.write_line(self.sink.header())
+        return self.file
+
+    def flush(self):
+        """
+        It flushes the buffer of the file and keeps its size in `offset`
+        """
+        if self.file is not None:
+            self.file.flush()
+            self.offset = os.path.getsize(self.filename)
+
+    def write_line(self, line):
+        """
+        It writes one line to the file and adds its size to the bytes written
+
+        :param line: a line of bytes, with its new line
+        """
+        self.file.write(line)
+        self.bytes += len(line)
+
+    def write_records(self, data):
+        """
+        It writes a page of records to the file and returns the number of records written
+
+        :param data: an iterable of dictionaries, each dictionary is a record, like the records parsed out of a page
+        :return: The number of records written. A page that can't be read to its end raises, after its records read so
+        far are counted, so a cut page is never taken for a whole one.
+        """
+        records, size = self.serializer.records, self.serializer.bytes
+        self.open()
+        try:
+            self.sink.write(self.file, data)
+        except Exception as err:
+            loggering.except_log(
+                "{0} page written with {1} records. Error: {2}".format(
+                    self.entity.upper(), self.serializer.records - records, err
+                ),
+                logger=self.logger,
+            )
+            raise
+        finally:
+            self.records += self.serializer.records - records
+            self.bytes += self.serializer.bytes - size
+        return self.serializer.records - records
+
+    def close(self):
+        """
+        It flushes and closes the file
+        """
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            self.logger.debug(
+                "{0} written with {1} records and {2} bytes.".format(
+                    self.filename, self.records, self.bytes
                 )
-                record_list.append(field.encode("utf-8"))
-            except:
-                e = sys.exc_info()[0]
-                loggering.except_log("Error: {0}.  Value: {1}".format(e, field))
-                record_list.append("".encode("utf-8"))
-        else:
-            record_list.append("".encode("utf-8"))
-    return "\t".join(record_list) + "\n"
+            )
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
 
 
 @debuglog()
-def pages_to_txt(headers, data, entity, logger):
+def pages_to_txt(headers, data, entity, logger, sink=None):
     """
     This function takes in a list of headers, a list of data, and an entity name, and writes the data to a text file
 
@@ -80,24 +495,10 @@ def pages_to_txt(headers, data, entity, logger):
     :param data: a list of dictionaries, each dictionary is a page of data
     :param entity: the name of the entity you're scraping
     :param logger: a logger object
+    :param sink: the sink of the output format, a tab separated txt file by default
     """
-    initial_time = time.time()
-    overlooked_records = 0
-    headers = headers
-    lower_headers = [header.lower() for header in headers]
-
-    with open("{}.txt.tmp".format(entity), "ab") as temp_file:
-        temp_file.write("\t".join([header.encode("utf-8") for header in headers]) + "\n")
-
-        try:
-            for index, record_dict in enumerate(data, start=1):
-                record = dict_to_record(
-                    record_dict=record_dict, headers=lower_headers, logger=logger
-                )
-                temp_file.write(record)
-            # logger.info('Page created with {} records.'.format(index))
-        except Exception as err:
-            loggering.except_log("{0} file created with 0 records".format(entity.upper()), str(err))
+    with PageWriter(headers=headers, entity=entity, logger=logger, sink=sink) as writer:
+        index = writer.write_records(data)
     return index
 
 
@@ -111,74 +512,50 @@ def pages_to_gen(headers, data, file_name, logger):
     :param file_name: the name of the file to be generated
     :param logger: a logger object
     """
-    headers = headers
-    lower_headers = [header.lower() for header in headers]
-    yield ("\t".join([header.encode("utf-8") for header in headers]) + "\n")
+    serializer = RowSerializer(headers=[header.lower() for header in headers], logger=logger)
+    yield header_line(headers)
     try:
         index = 0
         while data:
             record_dict = data.next()
             index += 1
-            record = dict_to_record(record_dict=record_dict, headers=lower_headers, logger=logger)
-            yield (record)
+            yield serializer.serialize(record_dict)
         logger.info("Page created with {} records.".format(index))
     except Exception as err:
         loggering.except_log("{0} file created with 0 records".format(file_name.upper()), str(err))
 
 
 @debuglog()
-def json_to_txt(headers, entity, logger=None):
+def json_to_txt(headers, entity, logger=None, sink=None):
     """
-    It converts a json file to a txt file.
+    It converts a json file to a txt file, parsing the records in a single pass with a bounded amount of memory.
 
     :param headers: a list of strings that are the headers for the output file
     :param entity: the name of the entity you want to convert
     :param logger: a logger object
+    :param sink: the sink of the output format, a tab separated txt file by default
     """
     initial_time = time.time()
-    headers = headers
-    lower_headers = [header.lower() for header in headers]
-    with open("{}.json.tmp".format(entity), mode="r+b", buffering=BUFFERING) as json_file:
-        try:
-            mmap_json = mmap.mmap(json_file.fileno(), 0, access=mmap.ACCESS_READ)
-            logger.debug("File mapped succesfully")
-            items = re.finditer(b'(?<=[,\[])\{"[a-zA-Z0-9\-_]+":\s?".*?"\}(?=[,\]])', mmap_json)
-            if any(items):
-                logger.debug("Items found succesfully")
-                overlooked_records = 0
-                # reinitialize items because "any(items)" consumed the first record
-                data = re.finditer(b'(?<=[,\[])\{"[a-zA-Z0-9\-_]+":\s?".*?"\}(?=[,\]])', mmap_json)
-                with open("{}.txt.tmp".format(entity), "w") as temp_file:
-                    temp_file.write(
-                        "\t".join([header.encode("utf-8") for header in headers]) + "\n"
-                    )
-                    try:
-                        for index, record_dict in enumerate(data, start=1):
-                            record_dict = json.loads(record_dict.group(0))
-                            record = dict_to_record(record_dict=record_dict, headers=lower_headers)
-                            temp_file.write(record)
-                    except Exception as err:
-                        logger.except_log(
-                            "{0} file created with 0 records. Error: {1}".format(
-                                entity.upper(), str(err)
-                            )
-                        )
-
-                logger.debug(
-                    "{} converted after {}.".format(entity.upper(), time.time() - initial_time)
+    sink = sink or TsvSink(headers=headers, entity=entity, logger=logger)
+    serializer = sink.serializer
+    with open("{}.json.tmp".format(entity), mode="rb", buffering=BUFFERING) as json_file:
+        with sink.open_file("wb", BUFFERING) as temp_file:
+            temp_file.write(sink.header())
+            try:
+                sink.write(temp_file, iter_records(iter_file_chunks(json_file, BUFFERING)))
+            except Exception as err:
+                loggering.except_log(
+                    "{0} file created with {1} records. Error: {2}".format(
+                        entity.upper(), serializer.records, str(err)
+                    ),
+                    logger=logger,
                 )
-                logger.debug("Number of Records: {}".format(index))
-                logger.debug("Number of Skipped Records: {}".format(overlooked_records))
-                # review_temporary_file(entity, powerschool_error)
-
-            else:
-                logger.warning("Could not find any matches inside the json file")
-            mmap_json.close()
-
-        except Exception as err:
-            print(err)
-            logger.debug("Memory map assignment failed.")
-            loggering.except_log(err)
+    index = serializer.records
+    if index:
+        logger.debug("{} converted after {}.".format(entity.upper(), time.time() - initial_time))
+        logger.debug("Number of Records: {}".format(index))
+    else:
+        logger.warning("Could not find any records inside the json file")
     return index
 
 
@@ -207,17 +584,32 @@ def check_and_delete_file(full_filename, logger):
 
 
 @debuglog()
-def review_temporary_file(filename, logger):
+def truncate_file(filename, size, logger):
+    """
+    It cuts a file to its first `size` bytes
+
+    :param filename: the full path to the file
+    :param size: the size to keep
+    :param logger: a logger object
+    """
+    with open(filename, "r+b") as truncated_file:
+        truncated_file.truncate(size)
+    logger.debug("File {} truncated to {} bytes.".format(filename, size))
+
+
+@debuglog()
+def review_temporary_file(filename, logger, extension=TsvSink.extension):
     """
     It takes a filename and a logger, and it prints the contents of the file to the logger
 
     :param filename: The name of the file to be reviewed
     :param logger: a logger object
+    :param extension: the extension of the output file of the sink
     """
     ori_file_size = ""
     new_file_size = ""
-    txt_filename = "{}.txt".format(filename)
-    tmp_filename = "{}.txt.tmp".format(filename)
+    txt_filename = "{}.{}".format(filename, extension)
+    tmp_filename = "{}.tmp".format(txt_filename)
     json_filename = "{}.json.tmp".format(filename)
     check_and_delete_file(full_filename=json_filename, logger=logger)
     if os.path.exists(tmp_filename):
@@ -1,9 +1,13 @@
-import collections
 import datetime
 
 from utils import loggering
 from utils.decorators import debuglog
 
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
 
 @debuglog()
 def get_file_type_headers(client, entity, logger):
@@ -47,8 +51,8 @@ def settle_year_range(rollover_date, logger):
 
 
 def updatedict(d, u):
-    for k, v in u.iteritems():
-        if isinstance(v, collections.Mapping):
+    for k, v in u.items():
+        if isinstance(v, Mapping):
             d[k] = updatedict(d.get(k, {}), v)
         else:
             d[k] = v
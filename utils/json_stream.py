@@ -0,0 +1,143 @@
+import codecs
+import json
+import re
+
+ENVELOPE, RECORDS, DONE = "envelope", "records", "done"
+RECORDS_START = re.compile(r'"record"\s*:\s*\[')
+SEPARATORS = re.compile(r"[\s,]*")
+ENVELOPE_TAIL = 64
+MAX_RECORD_SIZE = 2**26
+
+
+class RecordParser(object):
+    """
+    It parses the records of a PowerQuery response, `{"name": ..., "record": [{...}, {...}]}`, incrementally. The response
+    is fed in chunks of bytes and every complete record is returned as soon as its closing brace arrives, so only the
+    record being parsed is kept in memory, whatever the size of the response.
+
+    :param max_record_size: the maximum number of characters a single record can take
+    """
+
+    def __init__(self, max_record_size=MAX_RECORD_SIZE):
+        self.decoder = json.JSONDecoder()
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self.max_record_size = max_record_size
+        self.buffer = ""
+        self.position = 0
+        self.retry_size = 0
+        self.state = ENVELOPE
+        self.count = 0
+
+    def feed(self, data):
+        """
+        It adds a chunk of the response and returns the list of records completed by it
+
+        :param data: a chunk of bytes of the response
+        """
+        if self.state == DONE:
+            return []
+        self.buffer = self.pending() + self.text_decoder.decode(data)
+        if self.state == ENVELOPE:
+            match = RECORDS_START.search(self.buffer)
+            if not match:
+                # keep enough of the tail to find a "record" key split between two chunks
+                self.buffer = self.buffer[-ENVELOPE_TAIL:]
+                return []
+            self.position = match.end()
+            self.state = RECORDS
+        if self.state == RECORDS:
+            return self.parse_records()
+        return []
+
+    def pending(self):
+        """
+        It returns the part of the buffer that was not parsed yet, and moves the position to its start
+        """
+        position, self.position = self.position, 0
+        return self.buffer[position:]
+
+    def parse_records(self):
+        """
+        It decodes every complete record in the buffer
+        """
+        records = []
+        buffer_size = len(self.buffer)
+        # after an incomplete record, wait until its data doubles before decoding it again, so big records that
+        # arrive in many chunks are not decoded over and over
+        if buffer_size - self.position < self.retry_size:
+            return records
+        self.retry_size = 0
+        while True:
+            start = SEPARATORS.match(self.buffer, self.position).end()
+            if start == buffer_size:
+                self.position = start
+                break
+            if self.buffer[start] == "]":
+                self.position = start + 1
+                self.state = DONE
+                break
+            try:
+                record, end = self.decoder.raw_decode(self.buffer, start)
+            except ValueError:
+                end = None
+            # a record is only complete when something follows it, the separator or the end of the list
+            if end is None or end >= buffer_size:
+                self.position = start
+                self.retry_size = (buffer_size - start) * 2
+                if buffer_size - start > self.max_record_size:
+                    raise ValueError(
+                        "Record at character {} is bigger than {} characters or is not valid JSON".format(
+                            start, self.max_record_size
+                        )
+                    )
+                break
+            records.append(record)
+            self.count += 1
+            self.position = end
+        return records
+
+    def close(self):
+        """
+        It checks the response ended after its records and returns the records still pending, raising ValueError if the
+        response was truncated in the middle of the list of records
+        """
+        self.buffer = self.pending() + self.text_decoder.decode(b"", True)
+        records = []
+        if self.state == RECORDS:
+            self.retry_size = 0
+            records = self.parse_records()
+            if self.state != DONE:
+                raise ValueError(
+                    "The response ended before the end of the records, after {} records".format(
+                        self.count
+                    )
+                )
+        return records
+
+
+def iter_records(chunks, parser=None):
+    """
+    It yields the records of a PowerQuery response from an iterable of chunks of bytes
+
+    :param chunks: an iterable of chunks of bytes, like `response.iter_content()` or a file read in blocks
+    :param parser: the RecordParser to use, a new one by default
+    """
+    parser = parser or RecordParser()
+    for chunk in chunks:
+        for record in parser.feed(chunk):
+            yield record
+    for record in parser.close():
+        yield record
+
+
+def iter_file_chunks(file_obj, chunk_size):
+    """
+    It yields the content of a file in chunks of `chunk_size` bytes
+
+    :param file_obj: a file opened in binary mode
+    :param chunk_size: the size of every chunk
+    """
+    chunk = file_obj.read(chunk_size)
+    while chunk:
+        yield chunk
+        chunk = file_obj.read(chunk_size)
@@ -1,5 +1,16 @@
+import atexit
+import collections
 import logging
+import logging.handlers
 import sys
+import threading
+import time
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
 
 from base import LoggerGeneric
 from decorators import debuglog
@@ -7,13 +18,218 @@ from decorators import debuglog
 SINGLE_LINE = "-" * 79
 DOUBLE_LINE = "=" * 79
 STAR_LINE = "*" * 79
+# records kept in memory before they are written, unless one of FLUSH_LEVEL arrives or the queue runs empty first
+CAPACITY = 512
+FLUSH_LEVEL = logging.ERROR
+# the listener of every set of handlers, by the logger name, levels, format and file of its handlers
+LISTENERS = {}
+LISTENERS_LOCK = threading.Lock()
+EXCEPTION_FORMATTER = logging.Formatter()
+# seconds the listener of Python 2 waits for the next record when its queue is empty
+POLL_SECONDS = 0.05
+
+if hasattr(logging.handlers, "QueueListener"):
+    QueueHandler = logging.handlers.QueueHandler
+    QueueListener = logging.handlers.QueueListener
+else:
+    # Python 2 has no queue handlers, these do what the ones of Python 3 do
+
+    class QueueHandler(logging.Handler):
+        """
+        It puts the records in a queue, with their message already merged with its arguments
+
+        :param queue: the queue of the records
+        """
+
+        def __init__(self, queue):
+            logging.Handler.__init__(self)
+            self.queue = queue
+
+        def prepare(self, record):
+            msg = self.format(record)
+            record.message = msg
+            record.msg = msg
+            record.args = None
+            record.exc_info = None
+            record.exc_text = None
+            return record
+
+        def emit(self, record):
+            try:
+                self.queue.put_nowait(self.prepare(record))
+            except Exception:
+                self.handleError(record)
+
+    class QueueListener(object):
+        """
+        It hands the records of a queue to its handlers on a background thread
+
+        :param queue: the queue of the records
+        :param handlers: the handlers of the records
+        :param respect_handler_level: if a record is only handed to the handlers of its level
+        """
+
+        _sentinel = None
+
+        def __init__(self, queue, *handlers, **kwargs):
+            self.queue = queue
+            self.handlers = handlers
+            self.respect_handler_level = kwargs.get("respect_handler_level", False)
+            self._thread = None
+
+        def dequeue(self, block):
+            return self.queue.get(block)
+
+        def start(self):
+            self._thread = threading.Thread(target=self._monitor)
+            self._thread.daemon = True
+            self._thread.start()
+
+        def handle(self, record):
+            for handler in self.handlers:
+                if not self.respect_handler_level or record.levelno >= handler.level:
+                    handler.handle(record)
+
+        def _monitor(self):
+            while True:
+                record = self.dequeue(True)
+                if record is self._sentinel:
+                    break
+                self.handle(record)
+
+        def stop(self):
+            self.queue.put_nowait(self._sentinel)
+            self._thread.join()
+            self._thread = None
+
+
+class DequeQueue(object):
+    """
+    It is a queue of records for Python 2, whose Queue takes the lock of a Condition written in Python for every
+    record: appending to a deque takes none, and the listener polls it when it is empty
+    """
+
+    def __init__(self):
+        self.records = collections.deque()
+
+    def put_nowait(self, record):
+        self.records.append(record)
+
+    def empty(self):
+        return not self.records
+
+    def get(self, block=True):
+        while True:
+            try:
+                return self.records.popleft()
+            except IndexError:
+                if not block:
+                    raise queue.Empty
+                time.sleep(POLL_SECONDS)
+
+
+# the queue without task tracking of Python 3.7 takes a record without the lock of a Condition too
+RecordQueue = getattr(queue, "SimpleQueue", DequeQueue)
+
+
+class RecordQueueHandler(QueueHandler):
+    """
+    It puts the records in the queue of a listener thread of the same process with their message merged with its
+    arguments and their exception as text, like the QueueHandler of Python 3, so arguments changed after the call, like
+    the dictionaries of the pull context, are logged as they were. The listener formats the rest of the line.
+    """
+
+    def prepare(self, record):
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = record.exc_text or EXCEPTION_FORMATTER.formatException(
+                record.exc_info
+            )
+        record.exc_info = None
+        return record
+
+
+class BufferedListener(QueueListener):
+    """
+    It hands the records of the queue of a logger to its memory handlers on a background thread, so the threads that
+    log don't format nor write them, and flushes the memory handlers whenever the queue runs empty
+    """
+
+    def dequeue(self, block):
+        if block and self.queue.empty():
+            self.flush()
+        return QueueListener.dequeue(self, block)
+
+    def flush(self):
+        """
+        It writes the records kept by the memory handlers
+        """
+        for handler in self.handlers:
+            handler.flush()
+
+
+def stop_listeners():
+    """
+    It writes the records still queued or kept in memory by every logger and stops their listeners. It runs at exit.
+    """
+    with LISTENERS_LOCK:
+        listeners = list(LISTENERS.values())
+        LISTENERS.clear()
+    for listener in listeners:
+        listener.stop()
+        listener.flush()
+
+
+atexit.register(stop_listeners)
 
 
 class LoggerPowerSchool(LoggerGeneric):
     """
-    This class is a subclass of LoggerGeneric, and it's used to log messages to a file.
+    This class is a subclass of LoggerGeneric, and it's used to log messages to a file. The logger puts the records
+    in a queue, and a listener thread formats and writes them through memory handlers, so a thread that logs a lot
+    doesn't wait for the console nor the file.
     """
 
+    listener = None
+
+    def get_logger(self, file_level=None):
+        """
+        It returns a logger object that queues its records for the console and, when there is a file, for the log file.
+        The listener of the same set of handlers is started once and shared by the loggers that ask for it again.
+
+        :param file_level: The level of logging to be written to the log file
+        """
+        file_level = file_level if self.file else None
+        key = (self.name, self.log_level, self.format, self.file, file_level)
+        with LISTENERS_LOCK:
+            listener = LISTENERS.get(key)
+            if listener is None:
+                handlers = [self.stream_handler()]
+                if file_level:
+                    handlers.append(self.file_handler(log_level=file_level))
+                listener = BufferedListener(
+                    RecordQueue(),
+                    *[self.memory_handler(target=handler) for handler in handlers],
+                    respect_handler_level=True
+                )
+                listener.queue_handler = RecordQueueHandler(listener.queue)
+                listener.start()
+                LISTENERS[key] = listener
+            queues = [running.queue for running in LISTENERS.values()]
+        logger = logging.getLogger(self.name)
+        logger.setLevel(getattr(logging, self.log_level))
+        for handler in list(logger.handlers):
+            # the handlers of the listeners stopped by stop_listeners queue records nobody writes
+            if isinstance(handler, RecordQueueHandler) and handler.queue not in queues:
+                logger.removeHandler(handler)
+        if listener.queue_handler not in logger.handlers:
+            logger.addHandler(listener.queue_handler)
+        self.listener = listener
+        self.logger = logger
+        return logger
+
     def formatter(self):
         """
         A function that takes in a string and returns a string with the first letter capitalized.
@@ -50,14 +266,31 @@ class LoggerPowerSchool(LoggerGeneric):
         return file_handler
 
     def memory_handler(self, capacity=None, flush_level=None, target=None):
+        """
+        It returns a handler that keeps the records in memory and writes them through `target` when it keeps
+        `capacity` records or gets one of `flush_level` or above
+
+        :param capacity: the number of records kept, CAPACITY by default
+        :param flush_level: the level of the records written at once, FLUSH_LEVEL by default
+        :param target: the handler that writes the records
+        """
         memoryhandler = logging.handlers.MemoryHandler(
-            capacity=1024 * 100, flushLevel=logging.Debug, target=target
+            capacity=capacity or CAPACITY, flushLevel=flush_level or FLUSH_LEVEL, target=target
         )
+        if target is not None:
+            memoryhandler.setLevel(target.level)
+        return memoryhandler
 
-    def flush_memory(
-        self,
-    ):
-        pass
+    def flush_memory(self, handler=None):
+        """
+        It writes the records kept in memory by a handler, or by every memory handler of the logger
+
+        :param handler: a memory handler, all the ones of the listener when None
+        """
+        if handler is not None:
+            handler.flush()
+        elif self.listener is not None:
+            self.listener.flush()
 
 
 # @debuglog()
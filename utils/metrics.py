@@ -0,0 +1,272 @@
+import json
+import logging
+import os
+import threading
+
+PREFIX = "powerqueries"
+# seconds, from a count request answered at once to a stream of a big entity
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 900.0)
+PHASES = ("token", "yearid", "count", "page", "stream", "convert")
+METRICS_FILE = "metrics.json"
+COUNTER, GAUGE, HISTOGRAM = "counter", "gauge", "histogram"
+HELP = {
+    "requests_total": "Requests sent, by phase, entity and status",
+    "request_seconds": "Seconds of every request sent, by phase and entity",
+    "phase_seconds": "Seconds of every phase of the pull, by entity",
+    "records_total": "Records written, by entity",
+    "run_seconds": "Seconds of the last run",
+    "last_success_timestamp_seconds": "Unix time the last run without errors ended",
+}
+
+
+def request_phase(context):
+    """
+    It returns the phase of the pull a request belongs to: token, yearid, count, page or stream
+
+    :param context: the request context dictionary
+    """
+    if context.get("stream"):
+        return "stream"
+    entity_name = context.get("entity_name")
+    if entity_name in ("token", "yearid"):
+        return entity_name
+    if (context.get("url") or "").endswith("/count"):
+        return "count"
+    return "page"
+
+
+class Histogram(object):
+    """
+    It counts the values observed below every bucket, and keeps their number, sum and maximum
+
+    :param buckets: the upper bounds of the buckets, in increasing order
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        """
+        It adds a value to the first bucket that holds it
+
+        :param value: the value observed
+        """
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+
+    def cumulative(self):
+        """
+        It returns the pairs of bucket bound and values observed up to it, ending with "+Inf" and all of them
+        """
+        pairs = []
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            pairs.append(("{}".format(bound), total))
+        pairs.append(("+Inf", self.count))
+        return pairs
+
+    def stats(self):
+        """
+        It returns the number, sum and maximum of the values observed and the cumulative buckets
+        """
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "max": round(self.max, 6),
+            "buckets": dict(self.cumulative()),
+        }
+
+
+class Metrics(object):
+    """
+    It keeps the counters, gauges and latency histograms of a run, by name and labels, and exports them as a json
+    file and as a file of the node_exporter textfile collector. The threads and the event loop share it.
+
+    :param labels: the labels of every metric, like the host of the district
+    :param logger: a logger object
+    """
+
+    def __init__(self, labels=None, logger=None):
+        self.labels = dict(labels or {})
+        self.logger = logger or logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.metrics = {}
+
+    def key(self, labels):
+        """
+        It returns the labels of a metric, with the labels of the registry, as a sorted tuple of pairs
+
+        :param labels: the labels of the metric
+        """
+        merged = dict(self.labels)
+        merged.update(labels)
+        return tuple(sorted((name, "{}".format(value)) for name, value in merged.items()))
+
+    def series(self, kind, name):
+        """
+        It returns the values of a metric by labels, creating the metric the first time
+
+        :param kind: counter, gauge or histogram
+        :param name: the name of the metric, without the prefix
+        """
+        metric = self.metrics.setdefault(name, (kind, {}))
+        if metric[0] != kind:
+            raise ValueError("{} is a {}, not a {}".format(name, metric[0], kind))
+        return metric[1]
+
+    def count(self, name, value=1, **labels):
+        """
+        It adds to a counter
+
+        :param name: the name of the counter
+        :param value: what to add
+        :param labels: the labels of the counter
+        """
+        with self.lock:
+            series = self.series(COUNTER, name)
+            key = self.key(labels)
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        """
+        It sets a gauge
+
+        :param name: the name of the gauge
+        :param value: its value
+        :param labels: the labels of the gauge
+        """
+        with self.lock:
+            self.series(GAUGE, name)[self.key(labels)] = value
+
+    def observe(self, name, seconds, **labels):
+        """
+        It adds a latency to a histogram
+
+        :param name: the name of the histogram
+        :param seconds: the latency
+        :param labels: the labels of the histogram
+        """
+        with self.lock:
+            series = self.series(HISTOGRAM, name)
+            key = self.key(labels)
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(seconds)
+
+    def observe_request(self, context, response, seconds):
+        """
+        It counts a request sent and adds its latency, by phase and entity
+
+        :param context: the request context dictionary
+        :param response: the response of the request
+        :param seconds: the seconds the request took
+        """
+        phase = request_phase(context)
+        entity = context.get("entity_name") or ""
+        self.count(
+            "requests_total",
+            phase=phase,
+            entity=entity,
+            status=getattr(response, "status_code", ""),
+        )
+        self.observe("request_seconds", seconds, phase=phase, entity=entity)
+
+    def snapshot(self):
+        """
+        It returns the metrics as a dictionary of kinds, names and series with their labels
+        """
+        result = {COUNTER: {}, GAUGE: {}, HISTOGRAM: {}}
+        with self.lock:
+            for name, (kind, series) in sorted(self.metrics.items()):
+                result[kind][name] = [
+                    {
+                        "labels": dict(key),
+                        "value": value.stats() if kind == HISTOGRAM else value,
+                    }
+                    for key, value in sorted(series.items())
+                ]
+        return result
+
+    def prometheus(self):
+        """
+        It returns the metrics in the text format of Prometheus
+        """
+        lines = []
+        with self.lock:
+            for name, (kind, series) in sorted(self.metrics.items()):
+                full_name = "{}_{}".format(PREFIX, name)
+                lines.append("# HELP {} {}".format(full_name, HELP.get(name, name)))
+                lines.append("# TYPE {} {}".format(full_name, kind))
+                for key, value in sorted(series.items()):
+                    if kind != HISTOGRAM:
+                        lines.append("{}{} {}".format(full_name, format_labels(key), value))
+                        continue
+                    for bound, count in value.cumulative():
+                        lines.append(
+                            "{}_bucket{} {}".format(
+                                full_name, format_labels(key + (("le", bound),)), count
+                            )
+                        )
+                    lines.append("{}_sum{} {}".format(full_name, format_labels(key), value.sum))
+                    lines.append("{}_count{} {}".format(full_name, format_labels(key), value.count))
+        return "\n".join(lines) + "\n"
+
+    def to_json(self, filename):
+        """
+        It writes the metrics to a json file
+
+        :param filename: the path of the file
+        """
+        write_atomically(filename, json.dumps(self.snapshot(), indent=4, sort_keys=True))
+        self.logger.debug("Metrics written to {}.".format(filename))
+
+    def to_prometheus(self, filename):
+        """
+        It writes the metrics to a file of the node_exporter textfile collector. The file is written next to it and
+        renamed, so the collector never reads half of it.
+
+        :param filename: the path of the file, ending in .prom
+        """
+        write_atomically(filename, self.prometheus())
+        self.logger.debug("Metrics written to {}.".format(filename))
+
+
+def format_labels(key):
+    """
+    It returns the labels of a series in the text format of Prometheus, `{name="value",...}`
+
+    :param key: the labels as a tuple of pairs
+    """
+    if not key:
+        return ""
+    return "{{{}}}".format(
+        ",".join(
+            '{}="{}"'.format(
+                name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            )
+            for name, value in key
+        )
+    )
+
+
+def write_atomically(filename, content):
+    """
+    It writes a file through a temporary file in the same folder that is renamed over it
+
+    :param filename: the path of the file
+    :param content: the text to write
+    """
+    tmp_filename = "{}.{}.tmp".format(filename, os.getpid())
+    with open(tmp_filename, "w") as tmp_file:
+        tmp_file.write(content)
+    os.rename(tmp_filename, filename)
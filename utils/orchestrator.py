@@ -0,0 +1,132 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+import loggering
+from scheduler import guard, iter_wait
+
+
+class DistrictOrchestrator(object):
+    """
+    It runs the pulls of many districts in one process, up to `max_in_flight` districts at the same time. All of their
+    requests share one worker budget, while every district keeps its own logger, log file, results and failures.
+
+    :param build_pull: a function that takes a district, the shared budget and the district logger and returns its pull
+    :param max_in_flight: the maximum number of districts pulled at the same time
+    :param budget: the maximum number of requests in flight across all the districts
+    :param log_level: the log level of the district loggers
+    :param logger: the logger of the orchestrator
+    """
+
+    def __init__(self, build_pull, max_in_flight=2, budget=8, log_level="INFO", logger=None):
+        self.build_pull = build_pull
+        self.max_in_flight = max(int(max_in_flight or 1), 1)
+        self.budget = threading.BoundedSemaphore(max(int(budget or 1), 1))
+        self.log_level = log_level
+        self.logger = logger or logging.getLogger(__name__)
+
+    def get_district_logger(self, district):
+        """
+        It returns a logger for the district that writes to the console, tagged with the folder, and to the debug.log of
+        the district output folder
+
+        :param district: the district dictionary
+        """
+        folder = district["folder"]
+        log_format = "%(asctime)s %(levelname)-8s [{0}] {1}: %(message)s".format(
+            folder, "[%(funcName)-15.15s]" if self.log_level == "DEBUG" else ""
+        )
+        output_dir = district.get("output_dir", "")
+        log_file = os.path.join(output_dir, "debug.log") if os.path.isdir(output_dir) else None
+        logger = loggering.LoggerPowerSchool(
+            log_level=self.log_level,
+            formatter=log_format,
+            name="PowerSchoolPull.{}".format(folder),
+            file_name=log_file,
+        ).get_logger(file_level="INFO")
+        logger.propagate = False
+        return logger
+
+    def run_district(self, district, options):
+        """
+        It pulls one district and returns its summary. Any failure is kept within the district.
+
+        :param district: the district dictionary
+        :param options: the options that were passed to the script
+        """
+        t0 = time.time()
+        result = {}
+        error = district.get("error")
+        if not error:
+            logger = self.get_district_logger(district)
+            try:
+                pull = self.build_pull(district=district, budget=self.budget, logger=logger)
+                try:
+                    result = pull.run(options=options) or {}
+                finally:
+                    pull.query.request.close()
+                error = pull.context.get("error")
+            except (Exception, SystemExit):
+                exc = sys.exc_info()[1]
+                loggering.except_log(
+                    "District {} failed: {}".format(district["folder"], exc), logger=logger
+                )
+                error = "{}".format(exc) or exc.__class__.__name__
+        seconds = round(time.time() - t0, 2)
+        records = sum(
+            value.get("records", 0) for value in result.values() if isinstance(value, dict)
+        )
+        return {
+            "status": "failed" if error else "ok",
+            "error": error,
+            "seconds": seconds,
+            "records": records,
+            "records_per_sec": round(records / seconds, 1) if seconds else 0,
+            "entities": len(
+                [value for value in result.values() if isinstance(value, dict) and "count" in value]
+            ),
+        }
+
+    def run(self, districts, options):
+        """
+        It pulls every district and logs one summary with the duration and throughput of each one
+
+        :param districts: the list of district dictionaries
+        :param options: the options that were passed to the script
+        """
+        t0 = time.time()
+        summary = {}
+        pool = ThreadPool(processes=min(self.max_in_flight, len(districts)) or 1)
+        try:
+            pulls = pool.imap_unordered(
+                guard(lambda district: (district["folder"], self.run_district(district, options))),
+                districts,
+            )
+            for folder, district_summary in iter_wait(pulls):
+                summary[folder] = district_summary
+                self.logger.info(
+                    "District {} {} in {} sec with {} records.".format(
+                        folder,
+                        district_summary["status"],
+                        district_summary["seconds"],
+                        district_summary["records"],
+                    )
+                )
+        finally:
+            pool.close()
+            pool.join()
+        self.logger.info(
+            "Districts summary: {}".format(json.dumps(summary, indent=4, sort_keys=True))
+        )
+        self.logger.info(
+            "{} of {} districts pulled in {} sec.".format(
+                len([s for s in summary.values() if s["status"] == "ok"]),
+                len(districts),
+                round(time.time() - t0, 2),
+            )
+        )
+        return summary
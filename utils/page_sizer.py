@@ -0,0 +1,152 @@
+import time
+
+PAGE_SIZE_MIN = 625
+PAGE_SIZE_MAX = 5000
+TARGET_BYTES = 2 * 1024 * 1024
+TARGET_SECONDS = 10.0
+SMOOTHING = 0.3
+
+
+def page_size_ladder(page_size_min=PAGE_SIZE_MIN, page_size_max=PAGE_SIZE_MAX):
+    """
+    It returns the page sizes to choose from, smallest first: `page_size_max` halved while the size stays whole and
+    not below `page_size_min`. Every size is a multiple of the smallest one.
+
+    :param page_size_min: the smallest page size allowed
+    :param page_size_max: the largest page size allowed
+    """
+    sizes = [int(page_size_max)]
+    while sizes[-1] % 2 == 0 and sizes[-1] // 2 >= page_size_min:
+        sizes.append(sizes[-1] // 2)
+    return sorted(sizes)
+
+
+class PageSizer(object):
+    """
+    It picks the page size of the requests of an entity while it is pulled. It keeps a moving average of the bytes
+    and seconds per record of the responses, and after every response it moves the size one step up or down the
+    ladder towards the largest size whose pages are expected to stay under `target_bytes` and `target_seconds`.
+    The server pages by `page` and `pagesize`, so a request starting at record `offset` is page `offset / size + 1`
+    and the size is halved until it divides the offset.
+
+    :param page_size_min: the smallest page size allowed
+    :param page_size_max: the largest page size allowed, the first size when nothing is known about the entity
+    :param target_bytes: the size of the responses to aim at
+    :param target_seconds: the time of the responses to aim at
+    :param bytes_per_record: the bytes per record seen in the last run, if any
+    :param seconds_per_record: the seconds per record seen in the last run, if any
+    """
+
+    def __init__(
+        self,
+        page_size_min=PAGE_SIZE_MIN,
+        page_size_max=PAGE_SIZE_MAX,
+        target_bytes=TARGET_BYTES,
+        target_seconds=TARGET_SECONDS,
+        bytes_per_record=None,
+        seconds_per_record=None,
+    ):
+        self.sizes = page_size_ladder(page_size_min, page_size_max)
+        self.target_bytes = target_bytes
+        self.target_seconds = target_seconds
+        self.bytes_per_record = bytes_per_record
+        self.seconds_per_record = seconds_per_record
+        self.size = self.target_size()
+        self.pages = {}
+        self.records = 0
+        self.bytes = 0
+        self.started = None
+        self.finished = None
+
+    @property
+    def base(self):
+        """
+        It returns the smallest page size, every page starts at a multiple of it
+        """
+        return self.sizes[0]
+
+    def target_size(self):
+        """
+        It returns the largest size of the ladder whose pages are expected to stay under the targets, the largest one
+        when nothing is known yet
+        """
+        limit = float("inf")
+        if self.bytes_per_record:
+            limit = min(limit, float(self.target_bytes) / self.bytes_per_record)
+        if self.seconds_per_record:
+            limit = min(limit, float(self.target_seconds) / self.seconds_per_record)
+        fitting = [size for size in self.sizes if size <= limit]
+        return fitting[-1] if fitting else self.sizes[0]
+
+    def next_page(self, offset):
+        """
+        It returns the page number and the page size of the request starting at record `offset`
+
+        :param offset: the number of records requested before this page, a multiple of the smallest size
+        """
+        if self.started is None:
+            self.started = time.time()
+        size = self.size
+        while offset % size:
+            size //= 2
+        self.pages[size] = self.pages.get(size, 0) + 1
+        return offset // size + 1, size
+
+    def average(self, current, value):
+        """
+        It returns the moving average `current` updated with `value`, or `value` when there is none yet
+
+        :param current: the moving average, or None
+        :param value: the new value
+        """
+        return value if current is None else current + SMOOTHING * (value - current)
+
+    def observe(self, records, size, seconds=None):
+        """
+        It adds a response to the averages and moves the page size one step towards the target size
+
+        :param records: the number of records of the response
+        :param size: the bytes of the response
+        :param seconds: the time the response took, if known
+        """
+        if records <= 0:
+            return
+        self.records += records
+        self.bytes += size
+        self.finished = time.time()
+        self.bytes_per_record = self.average(self.bytes_per_record, float(size) / records)
+        if seconds is not None:
+            self.seconds_per_record = self.average(
+                self.seconds_per_record, float(seconds) / records
+            )
+        target = self.target_size()
+        index = self.sizes.index(self.size)
+        if target > self.size:
+            self.size = self.sizes[index + 1]
+        elif target < self.size:
+            self.size = self.sizes[index - 1]
+
+    def estimates(self):
+        """
+        It returns the bytes and seconds per record seen and the records per second of the pages, to start the next
+        run of the entity with them
+        """
+        elapsed = (self.finished or 0) - (self.started or 0)
+        return {
+            "bytes_per_record": self.bytes_per_record,
+            "seconds_per_record": self.seconds_per_record,
+            "records_per_sec": self.records / elapsed if elapsed > 0 else None,
+        }
+
+    def stats(self):
+        """
+        It returns the pages requested by size, the bytes and seconds per record seen and the throughput of the pages
+        """
+        elapsed = (self.finished or 0) - (self.started or 0)
+        return {
+            "sizes": dict(("{}".format(size), pages) for size, pages in self.pages.items()),
+            "bytes_per_record": round(self.bytes_per_record or 0, 1),
+            "seconds_per_record": round(self.seconds_per_record or 0, 6),
+            "records_per_sec": round(self.records / elapsed, 1) if elapsed > 0 else 0.0,
+            "bytes_per_sec": round(self.bytes / elapsed, 1) if elapsed > 0 else 0.0,
+        }
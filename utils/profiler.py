@@ -0,0 +1,152 @@
+import cProfile
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+TOP = 20
+SORT = "tottime"
+
+
+class PhaseProfiler(object):
+    """
+    It profiles the phases of a pull with cProfile and writes the stats of every phase to `<folder>/<phase>.prof`,
+    which `python -m pstats` or snakeviz can read. The thread that runs a phase is profiled, and so is every thread
+    started while it runs, like the threads of the entities and of their pages, whose stats are added to the ones of
+    the phase.
+
+    :param folder: the folder of the stats files
+    :param top: the number of functions in the summary
+    :param logger: a logger object
+    """
+
+    def __init__(self, folder, top=TOP, logger=None):
+        self.folder = folder
+        self.top = int(top)
+        self.logger = logger or logging.getLogger(__name__)
+        self.stats = {}
+        self.files = {}
+        self.seconds = {}
+
+    def phase(self, name):
+        """
+        It returns a context manager that profiles the block as the phase `name`
+
+        :param name: the name of the phase, which names its stats file
+        """
+        return ProfiledPhase(self, name)
+
+    def add(self, name, profiles, seconds):
+        """
+        It adds the profiles of the threads of a phase to its stats and writes them to its stats file
+
+        :param name: the name of the phase
+        :param profiles: the cProfile.Profile of every thread of the phase
+        :param seconds: the seconds of the phase
+        """
+        stats = None
+        for profile in profiles:
+            try:
+                if stats is None:
+                    stats = pstats.Stats(profile)
+                else:
+                    stats.add(profile)
+            except TypeError:
+                # a thread that ended before calling any function has no stats
+                continue
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        if stats is None:
+            return
+        if name in self.stats:
+            self.stats[name].add(stats)
+        else:
+            self.stats[name] = stats
+        if not os.path.isdir(self.folder):
+            os.makedirs(self.folder)
+        filename = os.path.join(self.folder, "{}.prof".format(name))
+        self.stats[name].dump_stats(filename)
+        self.files[name] = filename
+        self.logger.debug("Profile of {} written to {}.".format(name, filename))
+
+    def summary(self):
+        """
+        It returns the seconds of every phase and the `top` functions that took the most time of their own in all
+        the phases together
+        """
+        lines = ["Profiled phases:"]
+        for name in sorted(self.seconds, key=self.seconds.get, reverse=True):
+            lines.append("  {}: {:.2f} sec".format(name, self.seconds[name]))
+        if self.files:
+            output = StringIO()
+            stats = pstats.Stats(*[self.files[name] for name in sorted(self.files)], stream=output)
+            stats.sort_stats(SORT).print_stats(self.top)
+            lines.append(output.getvalue().strip("\n"))
+        return "\n".join(lines)
+
+
+class ProfiledPhase(object):
+    """
+    It profiles a block in the thread that runs it and in the threads started while it runs
+
+    :param profiler: the PhaseProfiler the stats are added to
+    :param name: the name of the phase
+    """
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.lock = threading.Lock()
+        self.profiles = []
+        self.start = None
+
+    def profile_thread(self, frame, event, arg):
+        """
+        It is the profile function of the threads started during the phase: on their first event it replaces itself
+        with a profile of the thread
+        """
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # the interpreter allows one profiler at a time
+            sys.setprofile(None)
+            return
+        with self.lock:
+            self.profiles.append(profile)
+
+    def __enter__(self):
+        profile = cProfile.Profile()
+        self.profiles.append(profile)
+        self.start = time.time()
+        threading.setprofile(self.profile_thread)
+        profile.enable()
+        return self
+
+    def __exit__(self, *args):
+        self.profiles[0].disable()
+        threading.setprofile(None)
+        with self.lock:
+            profiles = list(self.profiles)
+        self.profiler.add(self.name, profiles, time.time() - self.start)
+
+
+class NoProfile(object):
+    """
+    It stands for a profiled phase when the pull is not profiled
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+NO_PROFILE = NoProfile()
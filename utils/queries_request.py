@@ -1,9 +1,45 @@
+import collections
 import time
 from functools import partial
-from itertools import chain, imap
+from itertools import chain
+from multiprocessing.pool import ThreadPool
 
 from base import QueriesGeneric
 from decorators import debuglog, for_all_methods
+from scheduler import guard, wait
+
+try:
+    from itertools import imap
+except ImportError:
+    imap = map
+
+
+def ordered_imap(func, iterable, workers=1):
+    """
+    It maps `func` over `iterable` with up to `workers` calls running at the same time, and yields the results in the
+    same order as the input
+
+    :param func: the function to call with every item
+    :param iterable: the items to process
+    :param workers: the maximum number of calls in flight, 1 or less means a plain sequential imap
+    """
+    if workers <= 1:
+        for value in imap(func, iterable):
+            yield value
+        return
+    pool = ThreadPool(processes=workers)
+    pending = collections.deque()
+    try:
+        for item in iterable:
+            pending.append(pool.apply_async(guard(func), (item,)))
+            # keep the window bounded so finished responses don't pile up in memory
+            if len(pending) >= workers * 2:
+                yield wait(pending.popleft())
+        while pending:
+            yield wait(pending.popleft())
+    finally:
+        pool.terminate()
+        pool.join()
 
 
 @for_all_methods(["__init__"], debuglog())
@@ -29,17 +65,29 @@ class QueriesPowerSchool(QueriesGeneric):
 
     def request_query(self, *args, **kwargs):
         """
-        A function that takes in a variable number of arguments and keyword arguments.
+        It makes the prepared requests, up to `self.workers` at the same time, and processes the responses in the same
+        order they were prepared, so the pages of an entity are written in page order. The responses that are not ok
+        are passed to the `failadapter`, when there is one.
         """
         prepare = kwargs.get("prepare")
-        responses = imap(self.request.make_request, prepare)
+        responses = self.get_responses(prepare=prepare)
+        result = {}
         for response in responses:
             if self.check_response_query(response=response):
                 result = self.process_query(response=response)
             else:
                 result = response[0].text
+                if self.failadapter is not None:
+                    self.failadapter(response=response)
         return result
 
+    def get_responses(self, *args, **kwargs):
+        """
+        It makes the prepared requests and returns an iterator over the responses, in the same order as the requests
+        """
+        prepare = kwargs.get("prepare")
+        return ordered_imap(self.request.make_request, prepare, workers=self.workers)
+
     def process_query(self, *args, **kwargs):
         """
         A function that takes in a variable number of arguments and keyword arguments.
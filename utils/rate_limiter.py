@@ -0,0 +1,159 @@
+import collections
+import logging
+import threading
+import time
+
+MIN_RATE = 0.5
+DECREASE = 0.5
+# the share of the ceiling rate added back after every answer that is not a 429
+INCREASE = 0.02
+# a burst of 429 answers to the requests in flight lowers the rate once
+DECREASE_INTERVAL = 1.0
+RECENT_REQUESTS = 50
+
+
+class RateLimiter(object):
+    """
+    It spaces the requests to a host with a token bucket: `rate` requests per second on average, up to `burst` of them
+    at once. Every request reserves a token and waits until it is due, so the threads and the event loop share the
+    same bucket. A 429 answer halves the rate, down to `min_rate`, and every other answer raises it a little, back up
+    to `rate`. Without a `rate` the requests are not spaced until the first 429, and the rate starts from the one of
+    the last requests.
+
+    :param host: the host of the requests
+    :param rate: the requests per second allowed, or None for no limit until the first 429
+    :param burst: the requests that can be sent at once, one second of requests by default
+    :param min_rate: the lowest rate the 429 answers can lower it to
+    :param logger: a logger object
+    """
+
+    def __init__(self, host="", rate=None, burst=None, min_rate=MIN_RATE, logger=None):
+        self.host = host
+        self.ceiling = float(rate) if rate else None
+        self.rate = self.ceiling
+        self.burst = float(burst) if burst else max(self.rate or 1.0, 1.0)
+        self.min_rate = float(min_rate)
+        self.logger = logger or logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.tokens = self.burst
+        self.updated = time.time()
+        self.recent = collections.deque(maxlen=RECENT_REQUESTS)
+        self.decreased_at = 0.0
+        self.throttled = 0
+        self.decreases = 0
+        self.requests = 0
+        self.waits = {}
+
+    def recent_rate(self, now):
+        """
+        It returns the requests per second of the last requests, or None when there are too few of them
+
+        :param now: the current time
+        """
+        if len(self.recent) < 2 or now <= self.recent[0]:
+            return None
+        return len(self.recent) / (now - self.recent[0])
+
+    def reserve(self, entity=None):
+        """
+        It takes a token for a request and returns the seconds to wait before sending it
+
+        :param entity: the entity the request belongs to, to count its wait
+        """
+        with self.lock:
+            now = time.time()
+            self.requests += 1
+            self.recent.append(now)
+            if self.rate is None:
+                return 0.0
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            if delay > 0:
+                self.waits[entity or ""] = self.waits.get(entity or "", 0.0) + delay
+            return delay
+
+    def record(self, status_code):
+        """
+        It adjusts the rate to the answer of a request: down on a 429, a little up otherwise
+
+        :param status_code: the status of the answer
+        """
+        with self.lock:
+            now = time.time()
+            if status_code != 429:
+                if self.rate is not None and self.rate < self.ceiling:
+                    self.rate = min(self.ceiling, self.rate + self.ceiling * INCREASE)
+                return
+            self.throttled += 1
+            if now - self.decreased_at < DECREASE_INTERVAL:
+                return
+            current = self.rate or self.recent_rate(now) or 1.0
+            if self.ceiling is None:
+                self.ceiling = current
+                self.burst = max(current, 1.0)
+                self.tokens = 0.0
+                self.updated = now
+            self.rate = max(self.min_rate, current * DECREASE)
+            self.tokens = min(self.tokens, 0.0)
+            self.decreased_at = now
+            self.decreases += 1
+            self.logger.info(
+                "{} answered 429, lowering its rate to {:.2f} requests/sec.".format(
+                    self.host, self.rate
+                )
+            )
+
+    def wait_seconds(self, entity):
+        """
+        It returns the seconds the requests of an entity waited for the limiter
+
+        :param entity: the name of the entity
+        """
+        with self.lock:
+            return round(self.waits.get(entity, 0.0), 2)
+
+    def stats(self):
+        """
+        It returns the rate, its ceiling, the requests, the 429 answers, the times the rate was lowered and the
+        seconds waited for the limiter
+        """
+        with self.lock:
+            return {
+                "rate": round(self.rate, 2) if self.rate is not None else None,
+                "ceiling": round(self.ceiling, 2) if self.ceiling is not None else None,
+                "requests": self.requests,
+                "throttled": self.throttled,
+                "decreases": self.decreases,
+                "wait_seconds": round(sum(self.waits.values()), 2),
+            }
+
+
+class RateLimiters(object):
+    """
+    It keeps the rate limiter of every host requested in the run
+
+    :param logger: a logger object
+    """
+
+    def __init__(self, logger=None):
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.limiters = {}
+
+    def get(self, host, rate=None, burst=None, min_rate=MIN_RATE):
+        """
+        It returns the rate limiter of a host, creating it with `rate`, `burst` and `min_rate` the first time
+
+        :param host: the host of the requests
+        :param rate: the requests per second allowed, or None for no limit until the first 429
+        :param burst: the requests that can be sent at once
+        :param min_rate: the lowest rate the 429 answers can lower it to
+        """
+        with self.lock:
+            if host not in self.limiters:
+                self.limiters[host] = RateLimiter(
+                    host, rate=rate, burst=burst, min_rate=min_rate, logger=self.logger
+                )
+            return self.limiters[host]
@@ -0,0 +1,192 @@
+import logging
+import random
+import threading
+import time
+from email.utils import mktime_tz, parsedate_tz
+
+ATTEMPTS = 4
+BACKOFF = 1.0
+MAX_BACKOFF = 30.0
+MAX_RETRY_AFTER = 120.0
+RETRY_BUDGET = 100
+# 408 is also what a connection error or a timeout is turned into
+RETRY_STATUSES = (408, 429, 500, 502, 503, 504)
+RETRY_AFTER_STATUSES = (429, 503)
+
+
+def retry_after(response, now=None):
+    """
+    It returns the seconds the server asks to wait in the Retry-After header of a response, given in seconds or as an
+    HTTP date, or None when there is no valid header
+
+    :param response: a `requests.Response`
+    :param now: the current time, for the HTTP dates
+    """
+    value = (response.headers or {}).get("Retry-After")
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    parsed = parsedate_tz(value)
+    if parsed is None:
+        return None
+    return max(mktime_tz(parsed) - (time.time() if now is None else now), 0.0)
+
+
+class RetryBudget(object):
+    """
+    It limits the retries of a whole run, so a server that fails every request is not asked again and again for
+    every page of every entity. The requests of every thread, and of every district of the run, share it.
+
+    :param retries: the number of retries allowed in the run
+    """
+
+    def __init__(self, retries=RETRY_BUDGET):
+        self.lock = threading.Lock()
+        self.retries = int(retries)
+        self.spent = 0
+
+    def spend(self):
+        """
+        It takes a retry from the budget and returns if there was one left
+        """
+        with self.lock:
+            if self.spent >= self.retries:
+                return False
+            self.spent += 1
+            return True
+
+    def remaining(self):
+        """
+        It returns the retries left in the budget
+        """
+        with self.lock:
+            return max(self.retries - self.spent, 0)
+
+
+class RetryPolicy(object):
+    """
+    It decides if a failed request is sent again and how long to wait before. The wait grows exponentially with the
+    attempts, from `backoff` up to `max_backoff` seconds, and is drawn at random below that limit, so the requests that
+    failed together don't come back together. On 429 and 503 the Retry-After of the server is waited instead, unless
+    it is longer than `max_retry_after`. Every retry is taken from the run-wide `budget`, and the retries and the
+    seconds waited are counted by entity.
+
+    :param attempts: the maximum number of attempts of every request
+    :param backoff: the largest wait, in seconds, before the first retry
+    :param max_backoff: the largest wait, in seconds, before any retry
+    :param max_retry_after: the longest Retry-After, in seconds, that is waited
+    :param budget: the RetryBudget of the run, a new one when None
+    :param retry_statuses: the status codes that are retried
+    :param logger: a logger object
+    """
+
+    def __init__(
+        self,
+        attempts=ATTEMPTS,
+        backoff=BACKOFF,
+        max_backoff=MAX_BACKOFF,
+        max_retry_after=MAX_RETRY_AFTER,
+        budget=None,
+        retry_statuses=RETRY_STATUSES,
+        logger=None,
+    ):
+        self.attempts = max(int(attempts), 1)
+        self.backoff = float(backoff)
+        self.max_backoff = float(max_backoff)
+        self.max_retry_after = float(max_retry_after)
+        self.budget = budget if budget is not None else RetryBudget()
+        self.retry_statuses = tuple(retry_statuses)
+        self.logger = logger or logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.entities = {}
+        self.random = random.Random()
+
+    def backoff_delay(self, attempt):
+        """
+        It returns a random wait below the exponential backoff limit of an attempt
+
+        :param attempt: the number of attempts made, 1 after the first one
+        """
+        limit = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        return self.random.uniform(0, limit)
+
+    def next_delay(self, response, attempt, entity=None, immediate=False):
+        """
+        It returns the seconds to wait before the next attempt of a request, or None when the request is not retried:
+        the response is ok, its status is not retried, the attempts or the budget are exhausted, or the server asks to
+        wait too long. An immediate retry, after a new token was requested for a rejected one, doesn't wait and doesn't
+        spend the budget.
+
+        :param response: the response of the last attempt
+        :param attempt: the number of attempts made, 1 after the first one
+        :param entity: the entity the request belongs to, to count its retries
+        :param immediate: if the request is retried at once whatever its status
+        """
+        if response.ok or attempt >= self.attempts:
+            return None
+        if immediate:
+            self.count(entity, response.status_code, 0.0)
+            return 0.0
+        if response.status_code not in self.retry_statuses:
+            return None
+        delay = None
+        if response.status_code in RETRY_AFTER_STATUSES:
+            delay = retry_after(response)
+            if delay is not None and delay > self.max_retry_after:
+                self.logger.info(
+                    "The server asks to wait {:.0f} sec before retrying {}, giving up.".format(
+                        delay, entity or "the request"
+                    )
+                )
+                return None
+        if not self.budget.spend():
+            self.count(entity, response.status_code, None)
+            self.logger.info(
+                "The retry budget of {} retries is spent, giving up {}.".format(
+                    self.budget.retries, entity or "the request"
+                )
+            )
+            return None
+        if delay is None:
+            delay = self.backoff_delay(attempt)
+        self.count(entity, response.status_code, delay)
+        return delay
+
+    def count(self, entity, status_code, delay):
+        """
+        It adds a retry of an entity to its counters, or a retry refused by the budget when `delay` is None
+
+        :param entity: the entity the request belongs to
+        :param status_code: the status of the response that is retried
+        :param delay: the seconds waited before the retry
+        """
+        with self.lock:
+            stats = self.entities.setdefault(
+                entity or "", {"retries": 0, "sleep_seconds": 0.0, "statuses": {}, "given_up": 0}
+            )
+            if delay is None:
+                stats["given_up"] += 1
+                return
+            stats["retries"] += 1
+            stats["sleep_seconds"] += delay
+            status = "{}".format(status_code)
+            stats["statuses"][status] = stats["statuses"].get(status, 0) + 1
+
+    def stats(self, entity):
+        """
+        It returns the retries of an entity, the seconds waited before them, the statuses retried and the retries
+        refused by the budget, or None when the entity was never retried
+
+        :param entity: the name of the entity
+        """
+        with self.lock:
+            stats = self.entities.get(entity)
+            if stats is None:
+                return None
+            return dict(
+                stats,
+                sleep_seconds=round(stats["sleep_seconds"], 2),
+                statuses=dict(stats["statuses"]),
+            )
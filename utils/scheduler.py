@@ -0,0 +1,141 @@
+import functools
+import logging
+import sys
+import threading
+import time
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+
+import loggering
+
+POLL = 1.0
+
+
+class Raised(object):
+    """
+    It carries an exception that is not an `Exception`, like a `SystemExit` or a `KeyboardInterrupt`, out of a pool
+    worker. The pool only sets the result of a call for an `Exception`, any other one ends the worker and its result
+    is never set.
+
+    :param exception: the exception raised by the call
+    """
+
+    def __init__(self, exception):
+        self.exception = exception
+
+
+def guard(func):
+    """
+    It returns `func` wrapped to run in a pool worker, returning the exceptions that are not an `Exception` as a
+    `Raised`, which `wait` and `iter_wait` raise again in the thread that waits for the result
+
+    :param func: the function called by the pool
+    """
+
+    @functools.wraps(func)
+    def guarded(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            raise
+        except BaseException:
+            return Raised(sys.exc_info()[1])
+
+    return guarded
+
+
+def unwrap(value):
+    """
+    It returns the result of a call made through `guard`, raising the exception it carries if it is a `Raised`
+
+    :param value: the result of the call
+    """
+    if isinstance(value, Raised):
+        raise value.exception
+    return value
+
+
+def wait(async_result, poll=POLL):
+    """
+    It returns the value of an `AsyncResult` of a function wrapped with `guard`. The main thread waits `poll` seconds
+    at a time, because on Python 2 a wait without timeout holds the signals, like SIGTERM, until it ends.
+
+    :param async_result: the result of `apply_async`
+    :param poll: the seconds the main thread waits at a time
+    """
+    if threading.current_thread().name != "MainThread":
+        return unwrap(async_result.get())
+    while True:
+        try:
+            return unwrap(async_result.get(poll))
+        except TimeoutError:
+            pass
+
+
+def iter_wait(results, poll=POLL):
+    """
+    It yields the values of the iterator returned by `imap` or `imap_unordered` of a function wrapped with `guard`,
+    waiting like `wait`
+
+    :param results: the iterator of results
+    :param poll: the seconds the main thread waits at a time
+    """
+    main_thread = threading.current_thread().name == "MainThread"
+    while True:
+        try:
+            value = results.next(poll if main_thread else None)
+        except TimeoutError:
+            continue
+        except StopIteration:
+            return
+        yield unwrap(value)
+
+
+class EntityScheduler(object):
+    """
+    It pulls independent entities concurrently, keeping at most `max_in_flight` of them running at the same time
+
+    :param max_in_flight: the maximum number of entities pulled at the same time, 1 or less pulls them one by one
+    :param logger: a logger object
+    """
+
+    def __init__(self, max_in_flight=1, logger=None):
+        self.max_in_flight = max(int(max_in_flight or 1), 1)
+        self.logger = logger or logging.getLogger(__name__)
+
+    def pull(self, func, entity):
+        """
+        It calls `func` for one entity and returns the entity, its result and the elapsed time, turning any failure
+        into an error result so it does not stop the other entities
+
+        :param func: the function that pulls one entity and returns its result dictionary
+        :param entity: the entity to pull
+        """
+        t0 = time.time()
+        try:
+            result = func(entity)
+        except (Exception, SystemExit):
+            exc = sys.exc_info()[1]
+            loggering.except_log("Pull of {} failed: {}".format(entity, exc), logger=self.logger)
+            result = {entity.split(".")[-1]: {"error": "{}".format(exc)}}
+        return entity, result, round(time.time() - t0, 2)
+
+    def run(self, func, entities):
+        """
+        It pulls every entity and yields `(entity, result, elapsed)` as soon as each one finishes
+
+        :param func: the function that pulls one entity and returns its result dictionary
+        :param entities: the list of entities to pull
+        """
+        if self.max_in_flight <= 1 or len(entities) <= 1:
+            for entity in entities:
+                yield self.pull(func, entity)
+            return
+        pool = ThreadPool(processes=min(self.max_in_flight, len(entities)))
+        try:
+            pulls = pool.imap_unordered(guard(lambda entity: self.pull(func, entity)), entities)
+            for pulled in iter_wait(pulls):
+                yield pulled
+        finally:
+            pool.close()
+            pool.join()
@@ -1,30 +1,194 @@
+import datetime as dt
+import tempfile
+import threading
+import time
+
 import requests
 from base import RequestRetryGeneric
-from decorators import debuglog, for_all_methods, retry_requests
-from requests.adapters import HTTPAdapter, Retry
+from decorators import debuglog, for_all_methods
+from requests.adapters import DEFAULT_POOLBLOCK, DEFAULT_POOLSIZE, HTTPAdapter
+from requests.packages.urllib3.connectionpool import (
+    HTTPConnectionPool,
+    HTTPSConnectionPool,
+)
+from retry_policy import RetryPolicy
+
+CHUNK_SIZE = 2**16
+# the bodies spooled up to this size are kept in memory, the bigger ones in a temporary file, so every worker holds
+# at most this much of a page before its records are parsed
+SPOOL_SIZE = 2**20
+HEAD_SIZE = 512
+
+
+class ConnectionStats(object):
+    """
+    It counts the requests sent through a session and the connections opened for them, so a run can tell how many
+    requests reused a keep-alive connection and how many paid for a new one, with its TCP and TLS handshakes, and how
+    many connections were thrown away because the pool was full. The threads of the session share it.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+        self.discarded = 0
+
+    def count(self, requests=0, connections=0, discarded=0):
+        """
+        It adds to the counters
+
+        :param requests: the requests sent
+        :param connections: the connections opened
+        :param discarded: the connections closed because the pool was full
+        """
+        with self.lock:
+            self.requests += requests
+            self.connections += connections
+            self.discarded += discarded
+
+    def stats(self):
+        """
+        It returns the requests, the new and the reused connections, the ratio of requests that reused a connection
+        and the discarded connections
+        """
+        with self.lock:
+            reused = max(self.requests - self.connections, 0)
+            return {
+                "requests": self.requests,
+                "new_connections": self.connections,
+                "reused_connections": reused,
+                "reuse_ratio": round(float(reused) / self.requests, 2) if self.requests else 0.0,
+                "discarded_connections": self.discarded,
+            }
+
+
+def counting_pool(pool_class, connection_stats):
+    """
+    It returns a subclass of an urllib3 connection pool that adds its requests, the connections it opens and the
+    connections it discards to the counters. Every attempt of a request is counted, and a connection is counted when
+    its socket is opened, also when a pooled connection closed by the server is opened again.
+
+    :param pool_class: HTTPConnectionPool or HTTPSConnectionPool
+    :param connection_stats: the ConnectionStats to add to
+    """
+
+    class CountingConnection(pool_class.ConnectionCls):
+        def connect(self):
+            connection_stats.count(connections=1)
+            return super(CountingConnection, self).connect()
+
+    class CountingPool(pool_class):
+        ConnectionCls = CountingConnection
+
+        def urlopen(self, *args, **kwargs):
+            connection_stats.count(requests=1)
+            return super(CountingPool, self).urlopen(*args, **kwargs)
+
+        def _put_conn(self, conn):
+            if conn is not None and self.pool is not None and self.pool.full():
+                connection_stats.count(discarded=1)
+            return super(CountingPool, self)._put_conn(conn)
+
+    return CountingPool
+
+
+class PoolAdapter(HTTPAdapter):
+    """
+    It is an HTTPAdapter whose connection pools count their requests and connections in `connection_stats`
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.connection_stats = ConnectionStats()
+        super(PoolAdapter, self).__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super(PoolAdapter, self).init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": counting_pool(HTTPConnectionPool, self.connection_stats),
+            "https": counting_pool(HTTPSConnectionPool, self.connection_stats),
+        }
+
+
+def session_stats(session):
+    """
+    It returns the ConnectionStats of a session made by `session_retry`, or None for other sessions
+
+    :param session: a requests session
+    """
+    for adapter in session.adapters.values():
+        connection_stats = getattr(adapter, "connection_stats", None)
+        if connection_stats is not None:
+            return connection_stats
+    return None
+
+
+def spool_body(response, chunk_size=CHUNK_SIZE, spool_size=SPOOL_SIZE):
+    """
+    It reads the body of a streamed response, decoded, into a spooled temporary file that replaces its `raw`, so the
+    connection goes back to the pool at once and `iter_content` reads the body from the file. The bytes received are
+    kept in the `wire_bytes` of the response and the time spent reading the body is added to its `elapsed`.
+
+    :param response: a `requests.Response` sent with `stream=True`, whose body was not read
+    :param chunk_size: the size of the chunks read
+    :param spool_size: the bytes kept in memory before the body is moved to a temporary file
+    """
+    t0 = time.time()
+    spool = tempfile.SpooledTemporaryFile(max_size=spool_size)
+    try:
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            spool.write(chunk)
+    except Exception:
+        spool.close()
+        raise
+    tell = getattr(response.raw, "tell", None)
+    if tell is not None and hasattr(response.raw, "_fp_bytes_read"):
+        response.wire_bytes = tell()
+    response.close()
+    spool.seek(0)
+    response.raw = spool
+    response._content = False
+    response._content_consumed = False
+    response.elapsed += dt.timedelta(seconds=time.time() - t0)
+    return response
+
+
+def peek_body(response, size=HEAD_SIZE):
+    """
+    It returns the first bytes of the body of a response, without consuming a spooled body
+
+    :param response: a `requests.Response`
+    :param size: the bytes to return
+    """
+    if response._content is not False:
+        return response.content[:size]
+    head = response.raw.read(size)
+    response.raw.seek(0)
+    return head
 
 
 @debuglog()
-def session_retry(retries=5, backoff_factor=2, status_forcelist=(500, 502, 503, 504), logger=None):
+def session_retry(
+    pool_connections=DEFAULT_POOLSIZE,
+    pool_maxsize=DEFAULT_POOLSIZE,
+    pool_block=DEFAULT_POOLBLOCK,
+    logger=None,
+):
     """
-    Creates a Session instance
+    Creates a Session instance. The adapter doesn't retry, the requests are retried by the RetryPolicy of
+    `RequestRetryPowerSchool`, so the retries of a request are not multiplied by two layers.
 
-    :param retries: The number of times to retry the request, defaults to 5 (optional)
-    :param backoff_factor: The backoff factor to apply between attempts after the second try (most errors are resolved
-    immediately by a second try without a delay). urllib3 will sleep for: {backoff factor} * (2 ^ ({number of total retries}
-    - 1)) seconds. If the backoff_, defaults to 2 (optional)
-    :param status_forcelist: A set of integer HTTP status codes that we should force a retry on
+    :param pool_connections: the number of hosts whose connection pools are kept
+    :param pool_maxsize: the number of connections kept open to every host, it should be the requests in flight
+    :param pool_block: if a request waits for a free connection when the pool is full, instead of opening one that is
+    thrown away afterwards
     :param logger: The logger to use. If None, print
     """
     session = requests.Session()
-    retry = Retry(
-        total=retries,
-        read=retries,
-        connect=retries,
-        backoff_factor=backoff_factor,
-        status_forcelist=status_forcelist,
+    adapter = PoolAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        pool_block=pool_block,
     )
-    adapter = HTTPAdapter(max_retries=retry)
     session.mount("http://", adapter)
     session.mount("https://", adapter)
     return session
@@ -36,14 +200,134 @@ class RequestRetryPowerSchool(RequestRetryGeneric):
     """
     his class is a subclass of the generic `RequestRetryGeneric` class, and it is used to make requests to the
     PowerSchool API
+
+    :param retry_policy: the RetryPolicy that decides which requests are sent again and when, a new one when None
+    :param spool_size: the bytes of a spooled body kept in memory before it is moved to a temporary file
     """
 
-    @retry_requests(retry=2, sleep_time=1)
+    def __init__(self, *args, **kwargs):
+        self.retry_policy = kwargs.pop("retry_policy", None) or RetryPolicy(
+            logger=kwargs.get("logger")
+        )
+        self.spool_size = kwargs.pop("spool_size", None) or SPOOL_SIZE
+        super(RequestRetryPowerSchool, self).__init__(*args, **kwargs)
+
     def make_request(self, *args, **kwargs):
         """
-        It makes a request to the server.
+        It makes a request to the server, sending it again while the retry policy allows it and the circuit of the
+        host is closed
+        """
+        attempt = 0
+        while True:
+            response, context = super(RequestRetryPowerSchool, self).make_request(*args, **kwargs)
+            attempt += 1
+            refreshed = self.refresh_rejected_token(response, context)
+            if self.circuit_is_open():
+                break
+            delay = self.retry_policy.next_delay(
+                response, attempt, entity=context.get("entity_name"), immediate=refreshed
+            )
+            if delay is None:
+                break
+            self.log_retry(response, context, attempt, delay)
+            time.sleep(delay)
+        if not response.ok and not context.get("stream", self.stream):
+            self.logger.debug(msg=response.text)
+        return response, context
+
+    def circuit_is_open(self):
+        """
+        It returns if the circuit of the host is open, so the request is not retried
+        """
+        breaker = self.get_circuit_breaker()
+        return breaker is not None and breaker.is_open()
+
+    def refresh_rejected_token(self, response, context):
+        """
+        It requests a new token when the server rejected the one of the request, and returns if it did
+
+        :param response: the response of the request
+        :param context: the request context dictionary
+        """
+        if response.status_code != 401 or not self.uses_token(context):
+            return False
+        self.logger.info("The token was rejected, requesting a new one.")
+        self.authorize(self.token_manager.refresh(stale_token=self.get_token()))
+        return True
+
+    def log_retry(self, response, context, attempt, delay):
+        """
+        It logs the retry of a request, with its entity and page but not its params, which hold the client secret of
+        the token request
+
+        :param response: the response of the last attempt
+        :param context: the request context dictionary
+        :param attempt: the number of attempts made
+        :param delay: the seconds waited before the next attempt
+        """
+        page = (context.get("params") or {}).get("page")
+        self.logger.info(
+            "Retry {} of {}{} after a {} response, in {:.1f} sec.".format(
+                attempt,
+                context.get("entity_name") or context.get("url", ""),
+                " page {}".format(page) if page else "",
+                response.status_code,
+                delay,
+            )
+        )
+
+    def send(self, context):
+        """
+        It sends the request with a valid token, requesting a new one first when it is about to expire
+
+        :param context: the request context dictionary
+        """
+        if self.uses_token(context):
+            self.authorize(self.token_manager.get_token())
+        return super(RequestRetryPowerSchool, self).send(context)
+
+    def transfer(self, context):
+        """
+        It sends the request, and spools the body of a spooled request before its slot of the worker budget is given
+        back, so the budget bounds the bodies being read and not only the requests waiting for their headers
+
+        :param context: the request context dictionary
+        """
+        if not context.get("spool"):
+            return super(RequestRetryPowerSchool, self).transfer(context)
+        response = super(RequestRetryPowerSchool, self).transfer(dict(context, stream=True))
+        if response.ok:
+            try:
+                spool_body(response, spool_size=self.spool_size)
+            except requests.exceptions.ChunkedEncodingError as err:
+                # a body cut in the middle is retried like a connection that was dropped
+                raise requests.exceptions.ConnectionError(err)
+        return response
+
+    def uses_token(self, context):
+        """
+        It returns if the request is authorized with the token of the token manager, the requests with their own
+        headers, like the token request, are not
+
+        :param context: the request context dictionary
+        """
+        return self.token_manager is not None and "headers" not in context
+
+    def get_token(self):
+        """
+        It returns the token of the Authorization header
+        """
+        return (self.headers or {}).get("Authorization", "").replace("Bearer ", "", 1) or None
+
+    def authorize(self, token):
+        """
+        It sets the Authorization header of the requests, replacing the headers dictionary so the copies of the
+        request keep theirs
+
+        :param token: the access token
         """
-        return super(RequestRetryPowerSchool, self).make_request(*args, **kwargs)
+        if token != self.get_token():
+            self.headers = dict(self.headers or {}, Authorization="Bearer {0}".format(token))
 
     def check_response(self, *args, **kwargs):
         """
@@ -56,13 +340,14 @@ class RequestRetryPowerSchool(RequestRetryGeneric):
             if response.ok:
                 if stream:
                     return True
-                if "count" in response.content:
+                content = peek_body(response) if request.get("spool") else response.content
+                if b"count" in content:
                     return True
-                elif "access_token" in response.content:
+                elif b"access_token" in content:
                     return True
-                elif "record" in response.content:
+                elif b"record" in content:
                     return True
-                elif "message" in response.content:
+                elif b"message" in content:
                     response.status_code = 403
                     return False
                 else:
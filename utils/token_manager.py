@@ -0,0 +1,115 @@
+import logging
+import threading
+import time
+
+REFRESH_MARGIN = 300
+DEFAULT_EXPIRES_IN = 3600
+
+
+class TokenError(Exception):
+    """
+    The server didn't answer a token request with an access token. It is raised in the thread that asked for the
+    token, so a page worker fails its page and the pull fails on the main thread.
+    """
+
+
+def is_token(token):
+    """
+    It returns if a value can be an access token, and not the error of a failed token request
+
+    :param token: the value to check
+    """
+    return bool(token) and not isinstance(token, (dict, list))
+
+
+class TokenManager(object):
+    """
+    It keeps the access token of a district and its expiry time. The token is shared with the next runs through a
+    `FileCache` and is requested again `refresh_margin` seconds before it expires, or when the server rejects it. The
+    requests of every thread share the manager, so only one of them requests the new token.
+
+    :param fetch: a function that requests a new token and returns the access token and its `expires_in`
+    :param cache: the FileCache where the token is kept, or None to keep it only in memory
+    :param key: the key of the district in the cache
+    :param refresh_margin: the seconds before the expiry when the token is requested again
+    :param logger: a logger object
+    """
+
+    def __init__(self, fetch, cache=None, key="", refresh_margin=REFRESH_MARGIN, logger=None):
+        self.fetch = fetch
+        self.cache = cache
+        self.key = key
+        self.refresh_margin = refresh_margin
+        self.logger = logger or logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.token = None
+        self.expires_at = 0
+        self.source = None
+        self.refreshes = 0
+
+    def is_fresh(self):
+        """
+        It returns if there is a token that is not about to expire
+        """
+        return self.token is not None and time.time() < self.expires_at - self.refresh_margin
+
+    def get_token(self):
+        """
+        It returns a valid token, from memory, from the cache or from the server, in that order
+        """
+        with self.lock:
+            if self.is_fresh():
+                return self.token
+            cached = self.cache.get(self.key) if self.cache is not None else None
+            if isinstance(cached, dict) and is_token(cached.get("access_token")):
+                self.token = cached["access_token"]
+                self.expires_at = cached.get("expires_at", 0)
+                if self.is_fresh():
+                    self.source = "cache"
+                    self.logger.debug("Using the cached token.")
+                    return self.token
+            return self.request_token()
+
+    def refresh(self, stale_token=None):
+        """
+        It requests a new token, unless another request already replaced the stale one
+
+        :param stale_token: the token the server rejected
+        """
+        with self.lock:
+            if stale_token is not None and stale_token != self.token and self.is_fresh():
+                return self.token
+            return self.request_token()
+
+    def request_token(self):
+        """
+        It requests a new token from the server and stores it in the cache. It must be called holding the lock. A
+        failed request raises a TokenError and keeps the last token.
+        """
+        token, expires_in = self.fetch()
+        if not is_token(token):
+            raise TokenError("The token request failed: {}".format(token))
+        try:
+            expires_in = int(expires_in)
+        except (TypeError, ValueError):
+            expires_in = DEFAULT_EXPIRES_IN
+        self.token = token
+        self.expires_at = time.time() + expires_in
+        self.source = "server"
+        self.refreshes += 1
+        if self.cache is not None:
+            self.cache.set(
+                self.key, {"access_token": token, "expires_at": self.expires_at}, ttl=expires_in
+            )
+        self.logger.debug("New token that expires in {} sec.".format(expires_in))
+        return token
+
+    def status(self):
+        """
+        It returns where the token came from, when it expires and how many times it was requested, without the token
+        """
+        return {
+            "source": self.source,
+            "expires_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.expires_at)),
+            "requested": self.refreshes,
+        }
@@ -0,0 +1,89 @@
+import os
+
+PAGED = "paged"
+STREAM = "stream"
+MODES = (PAGED, STREAM)
+# a stream can't be resumed, it has to be this much faster than the pages to be chosen
+STREAM_MARGIN = 0.2
+SCRATCH_MARGIN = 1.2
+
+
+def free_space(folder):
+    """
+    It returns the bytes available to the user in the file system of a folder, or None when it can't be known
+
+    :param folder: the folder
+    """
+    try:
+        stats = os.statvfs(folder or ".")
+    except (AttributeError, OSError):
+        return None
+    return stats.f_bavail * stats.f_frsize
+
+
+def choose_mode(
+    count,
+    pages,
+    stream_threshold,
+    page_stats=None,
+    stream_stats=None,
+    pinned=None,
+    keep_json=False,
+    free_bytes=None,
+    margin=STREAM_MARGIN,
+):
+    """
+    It returns the mode to pull an entity with, "paged" or "stream", and the reason. A pinned mode wins. A stream
+    whose json copy doesn't fit in the free space is paged. When the records per second of both modes are known, from
+    the last runs or a sampled first page, the cheaper one is chosen, and otherwise the entity is streamed when it
+    has more pages than `stream_threshold`.
+
+    :param count: the number of records of the entity
+    :param pages: the number of pages of the entity at the largest page size
+    :param stream_threshold: the number of pages above which the entity is streamed when there are no timings
+    :param page_stats: a dictionary with the "bytes_per_record" and "records_per_sec" of the pages, if known
+    :param stream_stats: a dictionary with the "records_per_sec" of the stream, if known
+    :param pinned: the mode set for the entity in the config file, if any
+    :param keep_json: if the stream keeps a json copy of the response
+    :param free_bytes: the bytes available in the output folder, if known
+    :param margin: how much faster the stream has to be than the pages, 0.2 is 20%
+    """
+    if pinned in MODES:
+        return pinned, "pinned in the config file"
+    page_stats = page_stats or {}
+    stream_stats = stream_stats or {}
+    bytes_per_record = page_stats.get("bytes_per_record")
+    if keep_json and bytes_per_record and free_bytes is not None:
+        json_bytes = count * bytes_per_record * SCRATCH_MARGIN
+        if json_bytes > free_bytes:
+            return PAGED, "the stream json needs about {} MB and {} MB are free".format(
+                int(json_bytes // 2**20), int(free_bytes // 2**20)
+            )
+    page_rate = page_stats.get("records_per_sec")
+    stream_rate = stream_stats.get("records_per_sec")
+    if page_rate and stream_rate:
+        paged_seconds = float(count) / page_rate
+        stream_seconds = float(count) / stream_rate
+        if stream_seconds * (1 + margin) < paged_seconds:
+            return (
+                STREAM,
+                "the stream takes about {:.1f} sec and the pages about {:.1f} sec".format(
+                    stream_seconds, paged_seconds
+                ),
+            )
+        return PAGED, "the pages take about {:.1f} sec and the stream about {:.1f} sec".format(
+            paged_seconds, stream_seconds
+        )
+    if pages > stream_threshold:
+        return (
+            STREAM,
+            "{} pages are over the stream threshold of {}, without timings of both modes".format(
+                pages, stream_threshold
+            ),
+        )
+    return (
+        PAGED,
+        "{} pages are within the stream threshold of {}, without timings of both modes".format(
+            pages, stream_threshold
+        ),
+    )